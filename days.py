@@ -1,16 +1,35 @@
-import requests
+import argparse
+import codecs
 import os
-import zipfile
-import io
 import pandas as pd
-from datetime import date, datetime, timedelta
-import xml.etree.ElementTree as ET
+from datetime import datetime, timedelta
 import glob
-import re
+import sys
+from pathlib import Path
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src', 'py'))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src'))
+from instrumentation import span
+from download_and_read_excel import MAX_INTERVALS_PER_DAY, infer_resolution_minutes
+from gme_fetcher import (
+    GME_DATASETS, GMEFetcher, existing_dates, missing_date_ranges, parse_gme_xml
+)
+from rolling_stats import update_rolling_stats
+from data_quality import run_quality_gate
+from pipeline_status import refresh_manifest
+from watch import DEFAULT_NOTIFY_URL, notify, watch
+from convert_to_parquet import convert_pun_mgp
 
 # Default output paths for GME data
 DEFAULT_OUTPUT_PATH = r"sources\GME\EE"  # Electricity
 
+MGP_PRICES = 'MGP-Prezzi'  # GME_DATASETS entry of the PUN files
+
+DEFAULT_DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'db')
+PRICE_STORE_FILENAME = 'PUN-MGP.csv'  # Hourly price store in db/ (pun_service, cost engine, shards)
+CSV_COLUMN_ALIASES = {'Date': 'Data', 'Hour': 'Ora', 'Interval': 'Ora'}
+METER_PATTERNS = ['IT*.csv']  # Meter exports dropped in db/ (db/pods/ takes any CSV)
+
 def download_gme_xml_current_month(output_path=DEFAULT_OUTPUT_PATH):
     """
     Download XML price data from GME for the current month (up to tomorrow)
@@ -19,91 +38,15 @@ def download_gme_xml_current_month(output_path=DEFAULT_OUTPUT_PATH):
     Returns:
         list: List of extracted XML file paths
     """
-    from datetime import datetime
-    import re
-
-    # Calculate current month dates (up to tomorrow, let server tell us if not ready)
     today = datetime.now()
     data_inizio = today.replace(day=1).strftime("%Y%m%d")
-    # Try up to tomorrow - server will return what's available
     data_fine = (today + timedelta(days=1)).strftime("%Y%m%d")
-    date_param = (
-        today.replace(day=1).replace(month=today.month-1)
-            if today.month > 1 else today.replace(day=1).replace(month=12, year=today.year-1)
-    ).strftime("%Y%m%d")
-
-    session = requests.Session()
-    session.headers.update({
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0.0.0 Safari/537.36',
-        'Accept': 'application/json, text/plain, */*',
-        'Accept-Language': 'en-US,en;q=0.9',
-        'Cache-Control': 'no-cache',
-        'Referer': 'https://gme.mercatoelettrico.org/en-us/Home/Results/Electricity/MGP/Download?valore=Prezzi',
-        'Sec-Fetch-Dest': 'empty',
-        'Sec-Fetch-Mode': 'cors',
-        'Sec-Fetch-Site': 'same-origin',
-        'ModuleId': '12103',
-        'TabId': '1749',
-        'UserId': '-1'
-    })
-
-    try:
-        print("Getting CSRF token...")
-        page_response = session.get("https://gme.mercatoelettrico.org/en-us/Home/Results/Electricity/MGP/Download", timeout=10)
-        if page_response.status_code == 200:
-            csrf_match = re.search(r'<input[^>]*name=["\']__RequestVerificationToken["\'][^>]*value=["\']([^"\']+)["\']', page_response.text)
-            csrf_token = csrf_match.group(1) if csrf_match else None
-            if csrf_token:
-                print(f"Found CSRF token: {csrf_token[:20]}...")
-        else:
-            print(f"Page visit failed: {page_response.status_code}")
-            csrf_token = None
-    except Exception as e:
-        print(f"Warning: Could not get CSRF token: {e}")
-        csrf_token = None
-
-    params = {
-        'DataInizio': data_inizio,
-        'DataFine': data_fine,
-        'Date': date_param,
-        'Mercato': 'MGP',
-        'Settore': 'Prezzi',
-        'FiltroDate': 'InizioFine'
-    }
-    if csrf_token:
-        params['__RequestVerificationToken'] = csrf_token
-
-    try:
-        print(f"Downloading XML data for current month ({data_inizio} to {data_fine})...")
-
-        url = "https://gme.mercatoelettrico.org/DesktopModules/GmeDownload/API/ExcelDownload/downloadzipfile"
-        response = session.get(url, params=params, timeout=30)
-
-        if response.status_code != 200:
-            print(f"HTTP Error {response.status_code}")
-            return None
-
-        os.makedirs(output_path, exist_ok=True)
 
-        with zipfile.ZipFile(io.BytesIO(response.content), 'r') as zip_ref:
-            xml_files = [f for f in zip_ref.namelist() if f.endswith('.xml')]
-
-            extracted_files = []
-            for xml_file in xml_files:
-                xml_content = zip_ref.read(xml_file)
-                xml_filepath = os.path.join(output_path, xml_file)
-
-                with open(xml_filepath, 'wb') as f:
-                    f.write(xml_content)
-
-                extracted_files.append(xml_filepath)
-                print(f"Extracted: {xml_file} ({len(xml_content)} bytes)")
-
-            return extracted_files
-
-    except Exception as e:
-        print(f"Error downloading data: {e}")
-        return None
+    print(f"Downloading XML data for current month ({data_inizio} to {data_fine})...")
+    results = GMEFetcher().download(
+        [(MGP_PRICES, data_inizio, data_fine)], {MGP_PRICES: output_path}, overwrite=True
+    )
+    return results.get(MGP_PRICES, [])
 
 def get_existing_dates_from_folder(xml_folder_path=DEFAULT_OUTPUT_PATH):
     """
@@ -112,19 +55,7 @@ def get_existing_dates_from_folder(xml_folder_path=DEFAULT_OUTPUT_PATH):
     Returns:
         set: Set of existing dates in YYYYMMDD format
     """
-    xml_pattern = os.path.join(xml_folder_path, "*MGPPrezzi.xml")
-    xml_files = glob.glob(xml_pattern)
-
-    existing_dates = set()
-    date_pattern = re.compile(r'(\d{8})MGPPrezzi\.xml$')
-
-    for xml_file in xml_files:
-        filename = os.path.basename(xml_file)
-        match = date_pattern.search(filename)
-        if match:
-            existing_dates.add(match.group(1))
-
-    return existing_dates
+    return existing_dates(xml_folder_path, GME_DATASETS[MGP_PRICES]['suffix'])
 
 def get_missing_date_ranges(xml_folder_path=DEFAULT_OUTPUT_PATH, max_days_back=30):
     """
@@ -138,47 +69,7 @@ def get_missing_date_ranges(xml_folder_path=DEFAULT_OUTPUT_PATH, max_days_back=3
     Returns:
         list: List of tuples (start_date, end_date) in YYYYMMDD format
     """
-    existing_dates = get_existing_dates_from_folder(xml_folder_path)
-    today = datetime.now()
-    
-    # Always check up to tomorrow - let the server tell us if data isn't ready yet
-    end_check_date = today + timedelta(days=1)
-
-    if not existing_dates:
-        # No files exist, start from max_days_back ago
-        start_date = end_check_date - timedelta(days=max_days_back)
-        return [(start_date.strftime("%Y%m%d"), end_check_date.strftime("%Y%m%d"))]
-
-    # Convert existing dates to set for faster lookup
-    existing_date_strs = set(existing_dates)
-    
-    # Find oldest existing date to determine start point
-    existing_datetimes = sorted([datetime.strptime(date_str, "%Y%m%d") for date_str in existing_dates])
-    oldest_date = existing_datetimes[0]
-
-    # Check every day from oldest to end_check_date and find gaps
-    missing_ranges = []
-    current_date = oldest_date
-    
-    while current_date.date() <= end_check_date.date():
-        if current_date.strftime("%Y%m%d") not in existing_date_strs:
-            # Found a missing date, find the end of this gap
-            gap_start = current_date
-            gap_end = current_date
-            
-            # Extend the gap to include consecutive missing dates
-            next_date = current_date + timedelta(days=1)
-            while (next_date.date() <= end_check_date.date() and 
-                   next_date.strftime("%Y%m%d") not in existing_date_strs):
-                gap_end = next_date
-                next_date += timedelta(days=1)
-            
-            missing_ranges.append((gap_start.strftime("%Y%m%d"), gap_end.strftime("%Y%m%d")))
-            current_date = next_date
-        else:
-            current_date += timedelta(days=1)
-
-    return missing_ranges
+    return missing_date_ranges(xml_folder_path, GME_DATASETS[MGP_PRICES]['suffix'], max_days_back)
 
 def download_missing_gme_data(output_path=DEFAULT_OUTPUT_PATH, max_days_back=30):
     """
@@ -208,103 +99,56 @@ def download_missing_gme_data(output_path=DEFAULT_OUTPUT_PATH, max_days_back=30)
 
     print(f"Missing date ranges: {missing_ranges}")
 
-    all_downloaded_files = []
-
-    # Download each missing range
-    for start_date, end_date in missing_ranges:
-        print(f"\nDownloading data from {start_date} to {end_date}...")
-
-        # Calculate date_param (month before start_date)
-        start_dt = datetime.strptime(start_date, "%Y%m%d")
-        date_param_dt = start_dt.replace(day=1).replace(month=start_dt.month-1) if start_dt.month > 1 else start_dt.replace(day=1).replace(month=12, year=start_dt.year-1)
-        date_param = date_param_dt.strftime("%Y%m%d")
-
-        # Use existing download function with specific date range
-        session = requests.Session()
-        session.headers.update({
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0.0.0 Safari/537.36',
-            'Accept': 'application/json, text/plain, */*',
-            'Accept-Language': 'en-US,en;q=0.9',
-            'Cache-Control': 'no-cache',
-            'Referer': 'https://gme.mercatoelettrico.org/en-us/Home/Results/Electricity/MGP/Download?valore=Prezzi',
-            'Sec-Fetch-Dest': 'empty',
-            'Sec-Fetch-Mode': 'cors',
-            'Sec-Fetch-Site': 'same-origin',
-            'ModuleId': '12103',
-            'TabId': '1749',
-            'UserId': '-1'
-        })
-
-        # Get CSRF token
-        try:
-            page_response = session.get("https://gme.mercatoelettrico.org/en-us/Home/Results/Electricity/MGP/Download", timeout=10)
-            if page_response.status_code == 200:
-                csrf_match = re.search(r'<input[^>]*name=["\']__RequestVerificationToken["\'][^>]*value=["\']([^"\']+)["\']', page_response.text)
-                csrf_token = csrf_match.group(1) if csrf_match else None
-            else:
-                csrf_token = None
-        except Exception as e:
-            print(f"Warning: Could not get CSRF token: {e}")
-            csrf_token = None
-
-        # Download parameters
-        params = {
-            'DataInizio': start_date,
-            'DataFine': end_date,
-            'Date': date_param,
-            'Mercato': 'MGP',
-            'Settore': 'Prezzi',
-            'FiltroDate': 'InizioFine'
-        }
-
-        if csrf_token:
-            params['__RequestVerificationToken'] = csrf_token
+    # All ranges go through the shared fetcher pool
+    jobs = [(MGP_PRICES, start_date, end_date) for start_date, end_date in missing_ranges]
+    all_downloaded_files = GMEFetcher().download(jobs, {MGP_PRICES: output_path}).get(MGP_PRICES, [])
 
-        try:
-            url = "https://gme.mercatoelettrico.org/DesktopModules/GmeDownload/API/ExcelDownload/downloadzipfile"
-            response = session.get(url, params=params, timeout=30)
-
-            if response.status_code != 200:
-                print(f"HTTP Error {response.status_code} for range {start_date}-{end_date}")
-                continue
-
-            # Extract XML files from ZIP
-            os.makedirs(output_path, exist_ok=True)
+    print(f"\nDownloaded {len(all_downloaded_files)} new files")
+    return all_downloaded_files
 
-            with zipfile.ZipFile(io.BytesIO(response.content), 'r') as zip_ref:
-                xml_files = [f for f in zip_ref.namelist() if f.endswith('.xml')]
+def parse_mgp_xml(xml_file, columns=('PUN',)):
+    """
+    Extract the PUN records from a GME MGPPrezzi XML file
 
-                for xml_file in xml_files:
-                    xml_content = zip_ref.read(xml_file)
-                    xml_filepath = os.path.join(output_path, xml_file)
+    Hourly files number the intervals of the day in <Ora> (1-25); quarter-hour
+    files number them in <Periodo> (or <Ora>) from 1 to 100.
 
-                    # Only save if file doesn't exist (avoid overwriting)
-                    if not os.path.exists(xml_filepath):
-                        with open(xml_filepath, 'wb') as f:
-                            f.write(xml_content)
+    Args:
+        xml_file: Path to the XML file
+        columns: Price elements to extract (None for PUN and every zone)
 
-                        all_downloaded_files.append(xml_filepath)
-                        print(f"Downloaded: {xml_file} ({len(xml_content)} bytes)")
-                    else:
-                        print(f"Skipped existing: {xml_file}")
+    Returns:
+        list: List of dicts with Data (YYYYMMDD), Ora (interval of the day) and
+        one float per price column
+    """
+    return parse_gme_xml(xml_file, GME_DATASETS[MGP_PRICES]['record'], columns)
 
-        except Exception as e:
-            print(f"Error downloading range {start_date}-{end_date}: {e}")
-            continue
+def xml_resolution_minutes(records):
+    """Interval length of a parsed XML file: 60 (Ora 1-25) or 15 (up to 100)"""
+    if not records:
+        return 60
+    return infer_resolution_minutes([record['Ora'] for record in records])
 
-    print(f"\nDownloaded {len(all_downloaded_files)} new files")
-    return all_downloaded_files
+def resolution_csv_filename(output_filename, minutes):
+    """CSV holding one resolution: PUN_CM.csv for hours, PUN_CM-15.csv for quarter-hours"""
+    if minutes == 60:
+        return output_filename
+    stem, ext = os.path.splitext(output_filename)
+    return f"{stem}-{minutes}{ext}"
 
 def create_pun_csv_from_xml(xml_folder_path=DEFAULT_OUTPUT_PATH, output_filename="PUN_CM.csv"):
     """
-    Create a CSV file with PUN hourly data from all XML files in the folder
+    Create a CSV file with PUN data from all XML files in the folder
+
+    Hourly and quarter-hourly files are written to separate CSV files (see
+    resolution_csv_filename), so each CSV has a single interval resolution.
 
     Args:
         xml_folder_path: Path to folder containing XML files
         output_filename: Name of output CSV file
 
     Returns:
-        str: Path to created CSV file
+        str: Path to created CSV file (the hourly one if any)
     """
 
     # Find all XML files in the folder
@@ -317,69 +161,196 @@ def create_pun_csv_from_xml(xml_folder_path=DEFAULT_OUTPUT_PATH, output_filename
 
     print(f"Found {len(xml_files)} XML files to process")
 
-    # List to store all data
-    all_data = []
+    # Records of each resolution (minutes -> list)
+    data_by_resolution = {}
 
-    for xml_file in xml_files:
-        try:
-            print(f"Processing {os.path.basename(xml_file)}...")
+    with span('parse', files=len(xml_files)) as s:
+        for xml_file in xml_files:
+            try:
+                print(f"Processing {os.path.basename(xml_file)}...")
+
+                records = parse_mgp_xml(xml_file)
+                data_by_resolution.setdefault(xml_resolution_minutes(records), []).extend(records)
+                s.add(rows=len(records), bytes=os.path.getsize(xml_file))
 
-            # Parse XML file
-            tree = ET.parse(xml_file)
-            root = tree.getroot()
+            except Exception as e:
+                print(f"Error processing {xml_file}: {e}")
+                continue
+
+    if not any(data_by_resolution.values()):
+        print("No data extracted from XML files")
+        return None
+
+    csv_paths = []
+    for minutes, all_data in sorted(data_by_resolution.items(), reverse=True):
+        # Create DataFrame and sort by Data and Ora
+        with span('merge', minutes=minutes) as s:
+            df = pd.DataFrame(all_data)
+            df = df.sort_values(['Data', 'Ora']).reset_index(drop=True)
+            s.add(rows=len(df))
 
-            # Extract data from each Prezzi element
-            for prezzi in root.findall('Prezzi'):
-                data_elem = prezzi.find('Data')
-                ora_elem = prezzi.find('Ora')
-                pun_elem = prezzi.find('PUN')
+        # Create output path
+        csv_path = os.path.join(xml_folder_path, resolution_csv_filename(output_filename, minutes))
 
-                if data_elem is not None and ora_elem is not None and pun_elem is not None:
-                    # Convert PUN value from string with comma to float
-                    pun_value = float(pun_elem.text.replace(',', '.'))
+        # Save to CSV with semicolon separator
+        with span('write', minutes=minutes) as s:
+            df.to_csv(csv_path, index=False, sep=';')
+            s.add(rows=len(df), bytes=os.path.getsize(csv_path))
+
+        print(f"Created CSV with {len(df)} {minutes}-minute records: {csv_path}")
+        print(f"Data range: {df['Data'].min()} to {df['Data'].max()}")
+        csv_paths.append(csv_path)
+
+    return csv_paths[0]
+
+def merge_into_csv(csv_path, new_data):
+    """
+    Add new XML records to a CSV file, skipping dates it already has
 
-                    all_data.append({
-                        'Data': data_elem.text,
-                        'Ora': int(ora_elem.text),
-                        'PUN': pun_value
-                    })
+    The file is replaced atomically and keeps its UTF-8 BOM when it had one.
 
+    Args:
+        csv_path: CSV file to update (created if missing)
+        new_data: List of record dicts from parse_mgp_xml
+
+    Returns:
+        int: Number of records added
+
+    Raises:
+        ValueError: The existing file cannot be read (it is left untouched)
+    """
+    # Load existing CSV data if it exists
+    existing_df = None
+    existing_dates = set()
+    header = None
+    encoding = 'utf-8'
+
+    if os.path.exists(csv_path):
+        try:
+            with open(csv_path, 'rb') as f:
+                if f.read(len(codecs.BOM_UTF8)) == codecs.BOM_UTF8:
+                    encoding = 'utf-8-sig'
+            existing_df = pd.read_csv(csv_path, sep=';', encoding='utf-8-sig')
+            # Files in the Date;Hour layout are merged under the XML names and written back as they were
+            header = list(existing_df.columns)
+            existing_df = existing_df.rename(columns=CSV_COLUMN_ALIASES)
+            existing_df['Data'] = existing_df['Data'].astype(str)
+            existing_dates = set(existing_df['Data'])
+            print(f"Loaded existing CSV with {len(existing_df)} records")
         except Exception as e:
-            print(f"Error processing {xml_file}: {e}")
-            continue
+            # Writing the new records alone would wipe the history of the file
+            raise ValueError(f"Cannot read {csv_path}, not updated: {e}") from e
 
-    if not all_data:
-        print("No data extracted from XML files")
-        return None
+    # Skip dates that already exist in CSV (avoid duplicates)
+    new_data = [record for record in new_data if record['Data'] not in existing_dates]
+    if not new_data:
+        return 0
+
+    # Create DataFrame with new data
+    new_df = pd.DataFrame(new_data)
+    print(f"Extracted {len(new_df)} new records")
+
+    with span('merge') as s:
+        # Combine with existing data if any
+        if existing_df is not None:
+            combined_df = pd.concat([existing_df, new_df], ignore_index=True)
+        else:
+            combined_df = new_df
+
+        # Sort by Data and Ora
+        combined_df = combined_df.sort_values(['Data', 'Ora']).reset_index(drop=True)
+
+        # Remove duplicates, reporting them: they point at a problem in the source files
+        before = len(combined_df)
+        combined_df = combined_df.drop_duplicates(subset=['Data', 'Ora']).reset_index(drop=True)
+        if len(combined_df) < before:
+            print(f"Warning: dropped {before - len(combined_df)} duplicate (Data, Ora) records")
+        s.add(rows=len(combined_df))
 
-    # Create DataFrame and sort by Data and Ora
-    df = pd.DataFrame(all_data)
-    df = df.sort_values(['Data', 'Ora']).reset_index(drop=True)
+    # Save updated CSV with semicolon separator
+    with span('write') as s:
+        output_df = combined_df.rename(columns=dict(zip(existing_df.columns, header))) if header else combined_df
+        tmp = f'{csv_path}.{os.getpid()}.tmp'
+        output_df.to_csv(tmp, index=False, sep=';', encoding=encoding)
+        os.replace(tmp, csv_path)
+        s.add(rows=len(combined_df), bytes=os.path.getsize(csv_path))
 
-    # Create output path
-    csv_path = os.path.join(xml_folder_path, output_filename)
+    print(f"Updated CSV with {len(combined_df)} total records: {csv_path}")
+    # Convert Data column to string to ensure proper comparison
+    combined_df['Data'] = combined_df['Data'].astype(str)
+    print(f"Date range: {combined_df['Data'].min()} to {combined_df['Data'].max()}")
 
-    # Save to CSV with semicolon separator
-    df.to_csv(csv_path, index=False, sep=';')
+    return len(new_df)
 
-    print(f"Created CSV with {len(df)} hourly records: {csv_path}")
-    print(f"Data range: {df['Data'].min()} to {df['Data'].max()}")
+def ingest_xml_files(xml_files, xml_folder_path=DEFAULT_OUTPUT_PATH, output_filename="PUN_CM.csv", db_path=None):
+    """
+    Parse XML files and merge their records into the CSV of their resolution
 
-    return csv_path
+    Args:
+        xml_files: XML files to process
+        xml_folder_path: Folder holding the CSV files
+        output_filename: Name of the hourly CSV file
+        db_path: Database folder whose price store (PUN-MGP.csv / PUN-MGP-15.csv)
+            also receives the records, when that CSV exists (None to skip)
 
-def update_csv_incremental(xml_folder_path=DEFAULT_OUTPUT_PATH, output_filename="PUN_CM.csv"):
+    Returns:
+        dict: {CSV path: records added} for every CSV that received records
+    """
+    new_data = {}
+    with span('parse', files=len(xml_files)) as s:
+        for xml_file in xml_files:
+            try:
+                filename = os.path.basename(xml_file)
+                print(f"Processing {filename}...")
+
+                records = parse_mgp_xml(xml_file)
+                new_data.setdefault(xml_resolution_minutes(records), []).extend(records)
+                s.add(rows=len(records), bytes=os.path.getsize(xml_file))
+
+            except Exception as e:
+                print(f"Error processing {xml_file}: {e}")
+                continue
+
+    added = {}
+    for minutes, records in new_data.items():
+        csv_paths = [os.path.join(xml_folder_path, resolution_csv_filename(output_filename, minutes))]
+        store_path = db_path and os.path.join(db_path, resolution_csv_filename(PRICE_STORE_FILENAME, minutes))
+        if store_path and os.path.exists(store_path):
+            csv_paths.append(store_path)
+        for csv_path in csv_paths:
+            try:
+                count = merge_into_csv(csv_path, records)
+            except ValueError as e:
+                print(f"Error: {e}")
+                continue
+            if count:
+                added[csv_path] = count
+    return added
+
+def refresh_store_parquet(csv_path):
+    """Rewrite the Parquet copy of an updated price CSV, when it has one (readers prefer it)"""
+    folder = os.path.dirname(csv_path)
+    dataset = os.path.splitext(os.path.basename(csv_path))[0]
+    if os.path.exists(os.path.join(folder, f'{dataset}.parquet')):
+        with span('days.convert', dataset=dataset):
+            convert_pun_mgp(Path(folder), os.path.basename(csv_path))
+
+def update_csv_incremental(xml_folder_path=DEFAULT_OUTPUT_PATH, output_filename="PUN_CM.csv",
+                           db_path=DEFAULT_DB_PATH):
     """
     Update CSV file incrementally with only new XML data
 
+    Quarter-hourly XML files go to their own CSV (see resolution_csv_filename).
+    The new records also reach the db/ price store, as in watch mode.
+
     Args:
         xml_folder_path: Path to folder containing XML files
         output_filename: Name of CSV file to update
+        db_path: Database folder with the price store (None to skip it)
 
     Returns:
         str: Path to updated CSV file
     """
-    csv_path = os.path.join(xml_folder_path, output_filename)
-
     # Get XML files and their modification times
     xml_pattern = os.path.join(xml_folder_path, "*.xml")
     xml_files = glob.glob(xml_pattern)
@@ -388,9 +359,13 @@ def update_csv_incremental(xml_folder_path=DEFAULT_OUTPUT_PATH, output_filename=
         print(f"No XML files found in {xml_folder_path}")
         return None
 
-    # Check if CSV exists and get its modification time
-    csv_exists = os.path.exists(csv_path)
-    csv_mtime = os.path.getmtime(csv_path) if csv_exists else 0
+    # Check which CSV files exist; the oldest one decides which XML files are new
+    csv_paths = {
+        minutes: os.path.join(xml_folder_path, resolution_csv_filename(output_filename, minutes))
+        for minutes in MAX_INTERVALS_PER_DAY
+    }
+    existing_csvs = [path for path in csv_paths.values() if os.path.exists(path)]
+    csv_mtime = min(os.path.getmtime(path) for path in existing_csvs) if existing_csvs else 0
 
     # Find XML files that are newer than the CSV
     new_xml_files = []
@@ -399,107 +374,107 @@ def update_csv_incremental(xml_folder_path=DEFAULT_OUTPUT_PATH, output_filename=
         if xml_mtime > csv_mtime:
             new_xml_files.append(xml_file)
 
-    if not new_xml_files and csv_exists:
+    if not new_xml_files and existing_csvs:
         print("CSV is up to date - no new XML files to process")
-        return csv_path
+        return existing_csvs[0]
 
     print(f"Processing {len(new_xml_files)} new/updated XML files")
+    added_by_csv = ingest_xml_files(new_xml_files, xml_folder_path, output_filename, db_path)
+    for csv_path in added_by_csv:
+        refresh_store_parquet(csv_path)
+    added = sum(added_by_csv.values())
 
-    # Load existing CSV data if it exists
-    existing_df = None
-    existing_dates = set()
-
-    if csv_exists:
-        try:
-            existing_df = pd.read_csv(csv_path)
-            existing_dates = set(existing_df['Data'].astype(str))
-            print(f"Loaded existing CSV with {len(existing_df)} records")
-        except Exception as e:
-            print(f"Error loading existing CSV: {e}")
-            existing_df = None
-
-    # Process only new XML files
-    new_data = []
-    for xml_file in new_xml_files:
-        try:
-            filename = os.path.basename(xml_file)
-            print(f"Processing {filename}...")
-
-            # Parse XML file
-            tree = ET.parse(xml_file)
-            root = tree.getroot()
-
-            # Extract data from each Prezzi element
-            for prezzi in root.findall('Prezzi'):
-                data_elem = prezzi.find('Data')
-                ora_elem = prezzi.find('Ora')
-                pun_elem = prezzi.find('PUN')
-
-                if data_elem is not None and ora_elem is not None and pun_elem is not None:
-                    date_str = data_elem.text
-
-                    # Skip if this date already exists in CSV (avoid duplicates)
-                    if existing_df is not None and date_str in existing_dates:
-                        continue
-
-                    # Convert PUN value from string with comma to float
-                    pun_value = float(pun_elem.text.replace(',', '.'))
-
-                    new_data.append({
-                        'Data': date_str,
-                        'Ora': int(ora_elem.text),
-                        'PUN': pun_value
-                    })
-
-        except Exception as e:
-            print(f"Error processing {xml_file}: {e}")
-            continue
-
-    if not new_data and existing_df is not None:
+    if not added:
         print("No new data to add")
-        return csv_path
-
-    # Create DataFrame with new data
-    if new_data:
-        new_df = pd.DataFrame(new_data)
-        print(f"Extracted {len(new_df)} new records")
 
-        # Combine with existing data if any
-        if existing_df is not None:
-            combined_df = pd.concat([existing_df, new_df], ignore_index=True)
-        else:
-            combined_df = new_df
+    # Report the hourly CSV, or the quarter-hour one when there is no hourly data
+    existing_csvs = [path for path in csv_paths.values() if os.path.exists(path)]
+    return existing_csvs[0] if existing_csvs else None
 
-        # Sort by Data and Ora
-        combined_df = combined_df.sort_values(['Data', 'Ora']).reset_index(drop=True)
+def process_changes(paths, xml_folder_path=DEFAULT_OUTPUT_PATH, db_path=DEFAULT_DB_PATH,
+                    output_filename="PUN_CM.csv", notify_url=DEFAULT_NOTIFY_URL):
+    """
+    Incremental update for one batch of changed files (watch mode)
 
-        # Remove duplicates (just in case)
-        combined_df = combined_df.drop_duplicates(subset=['Data', 'Ora']).reset_index(drop=True)
+    New XML files are merged into their PUN_CM CSV and into the db/ price
+    store (PUN-MGP.csv, rewritten to Parquet when a .parquet copy exists),
+    then validated and added to the rolling statistics; meter files are
+    validated. A running pun_service is then told to drop its caches right
+    away (it would otherwise notice the new file versions within a second).
+    The Streamlit dashboard reads the GME yearly archives instead and
+    re-reads them on its own schedule (see dashboard_pun.data_version).
 
-    else:
-        # No new data, just use existing
-        combined_df = existing_df if existing_df is not None else pd.DataFrame()
+    Args:
+        paths: Changed files of the batch
+        xml_folder_path: GME XML folder (holds the PUN_CM CSV files)
+        db_path: Database folder with the price store and the meter files
+        output_filename: Name of the hourly CSV file
+        notify_url: Cache invalidation endpoint (None to skip)
 
-    # Save updated CSV with semicolon separator
-    combined_df.to_csv(csv_path, index=False, sep=';')
+    Returns:
+        dict: {CSV path: records added}
+    """
+    suffix = GME_DATASETS[MGP_PRICES]['suffix']
+    paths = [path for path in paths if os.path.exists(path)]
+    xml_files = [path for path in paths if path.endswith(suffix)]
+    meter_files = [path for path in paths if not path.endswith(suffix)]
+    print(f"\n=== {datetime.now():%H:%M:%S} {len(xml_files)} XML / {len(meter_files)} meter file(s) changed ===")
+
+    added = ingest_xml_files(xml_files, xml_folder_path, output_filename, db_path) if xml_files else {}
+    for csv_path, count in added.items():
+        folder = os.path.dirname(csv_path)
+        dataset = os.path.splitext(os.path.basename(csv_path))[0]
+        refresh_store_parquet(csv_path)
+        if not run_quality_gate(folder, datasets=[dataset], meters=False):
+            print(f"[FAILED] {dataset}: data quality thresholds exceeded, rollups not updated")
+            continue
+        with span('days.rolling_stats'):
+            _, recomputed = update_rolling_stats(folder, dataset)
+        print(f"{dataset}: {count} records added, {recomputed} days of rolling statistics updated")
 
-    print(f"Updated CSV with {len(combined_df)} total records: {csv_path}")
-    if len(combined_df) > 0:
-        # Convert Data column to string to ensure proper comparison
-        combined_df['Data'] = combined_df['Data'].astype(str)
-        print(f"Date range: {combined_df['Data'].min()} to {combined_df['Data'].max()}")
+    if meter_files:
+        run_quality_gate(db_path, datasets=[], meters=meter_files)
 
-    return csv_path
+    if added or meter_files:
+        try:
+            refresh_manifest(db_path, xml_folder_path)
+        except Exception as e:
+            print(f"Could not refresh the manifest: {e}")
+        if notify_url and notify(notify_url):
+            print("pun_service caches invalidated")
+    return added
+
+def watch_sources(xml_folder_path=DEFAULT_OUTPUT_PATH, db_path=DEFAULT_DB_PATH, output_filename="PUN_CM.csv",
+                  notify_url=DEFAULT_NOTIFY_URL, use_watchdog=None):
+    """Ingest XML and meter files as they arrive, until interrupted"""
+    suffix = GME_DATASETS[MGP_PRICES]['suffix']
+    targets = [
+        (xml_folder_path, [f'*{suffix}']),
+        (db_path, METER_PATTERNS),
+        (os.path.join(db_path, 'pods'), ['*.csv']),
+    ]
+    watch(targets, lambda paths: process_changes(paths, xml_folder_path, db_path, output_filename, notify_url),
+          use_watchdog=use_watchdog)
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Download the GME prices and update the PUN CSV files')
+    parser.add_argument('--watch', action='store_true',
+                        help='Keep running and ingest XML and meter files as they arrive')
+    parser.add_argument('--notify', default=DEFAULT_NOTIFY_URL,
+                        help="Cache invalidation URL called after each watch batch ('' to disable)")
+    parser.add_argument('--poll', action='store_true', help='Poll the folders instead of using watchdog')
+    args = parser.parse_args()
+
     print("=== Smart GME Data Management System ===")
 
     # Step 1: Smart download (only missing data)
-    result = download_missing_gme_data()
+    with span('days.download'):
+        result = download_missing_gme_data()
 
     # Step 2: Incremental CSV update (only process new files)
     print("\n=== Updating CSV incrementally ===")
-    csv_path = update_csv_incremental()
+    with span('days.update_csv'):
+        csv_path = update_csv_incremental()
 
     if csv_path:
         print(f"\n[SUCCESS] Electricity CSV updated: {os.path.basename(csv_path)}")
@@ -512,6 +487,31 @@ if __name__ == "__main__":
             print(f"\nTotal records: {len(df_preview)}")
         except Exception as e:
             print(f"Could not preview CSV: {e}")
+
+        # Step 3: Validate the updated prices against the DST calendar and bounds
+        if not run_quality_gate(os.path.dirname(csv_path), datasets=['PUN_CM', 'PUN_CM-15'], meters=False):
+            print("[FAILED] Data quality thresholds exceeded (set ONEENERGY_QUALITY=warn to continue)")
+            sys.exit(1)
+
+        # Step 4: Rolling indicators for the daily reports (only new days are computed)
+        try:
+            with span('days.rolling_stats'):
+                dataset = os.path.splitext(os.path.basename(csv_path))[0]
+                stats, recomputed = update_rolling_stats(os.path.dirname(csv_path), dataset)
+            print(f"\nRolling statistics ({recomputed} days updated):")
+            print(stats.latest().round(2).to_string(index=False))
+        except Exception as e:
+            print(f"Could not update rolling statistics: {e}")
+
+        # Step 5: Coverage manifest read by the fast status check (pipeline_status.py)
+        try:
+            refresh_manifest(xml_path=os.path.dirname(csv_path))
+        except Exception as e:
+            print(f"Could not refresh the manifest: {e}")
     else:
         print("[FAILED] Electricity CSV update failed")
-    
+
+    # Step 6: Stay up and ingest new files as they land
+    if args.watch:
+        print("\n=== Watch mode ===")
+        watch_sources(notify_url=args.notify or None, use_watchdog=False if args.poll else None)
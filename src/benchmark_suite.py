@@ -0,0 +1,422 @@
+"""
+Benchmark suite for the data pipeline and the dashboard hot paths.
+
+Every benchmark runs a few warmup iterations and then repeated timed runs;
+the report gives latency percentiles, CPU time, throughput and the peak
+memory allocated by one run (tracemalloc, measured in an extra untimed run so
+tracing does not skew the latencies), and is saved as JSON. When a baseline JSON is given, the run fails
+(exit code 1) if any benchmark got slower than the allowed threshold.
+
+The reference run is kept in benchmarks/baseline.json (committed, run on the
+repository's db/; paths inside it are relative to the repository root). It
+was recorded on a single-CPU host and latencies depend on the machine:
+regenerate it with --save-baseline on the machine that runs the comparison,
+after a change that is meant to move the numbers.
+
+Usage:
+    python src/benchmark_suite.py
+    python src/benchmark_suite.py --repeat 20 --output results.json
+    python src/benchmark_suite.py --baseline              # compare with benchmarks/baseline.json
+    python src/benchmark_suite.py --save-baseline         # replace benchmarks/baseline.json
+    python src/benchmark_suite.py --db path/to/synthetic/db --xml path/to/xml
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+sys.path.append(str(REPO_ROOT))
+sys.path.append(str(REPO_ROOT / 'src'))
+sys.path.append(str(REPO_ROOT / 'src' / 'py'))
+
+import convert_to_parquet
+from days import parse_mgp_xml
+from cost_engine import load_prices, meter_utc_minutes, run_cost_engine
+from download_and_read_excel import (
+    FASCIA_LABELS, yyyymmdd_to_day_number, midnight_utc_offset_hours, get_fascia_codes
+)
+from filter_index import FilterIndex
+from interval_store import load_interval_store
+import instrumentation
+from instrumentation import peak_rss_mb
+
+DEFAULT_DB_PATH = REPO_ROOT / 'db'
+DEFAULT_XML_PATH = REPO_ROOT / 'sources' / 'GME' / 'EE'
+DEFAULT_RESULTS_DIR = REPO_ROOT / 'benchmarks'
+DEFAULT_BASELINE_PATH = DEFAULT_RESULTS_DIR / 'baseline.json'
+DEFAULT_THRESHOLD = 0.20  # Allowed p50 slowdown against the baseline
+DEFAULT_MIN_DELTA_MS = 1.0  # Ignore regressions smaller than this (timer noise)
+
+
+def run_benchmark(name, fn, repeat=10, warmup=2, rows=None, nbytes=None, setup=None):
+    """
+    Time fn over repeated runs
+
+    Args:
+        name: Benchmark name
+        fn: Callable to time
+        repeat: Timed runs
+        warmup: Untimed runs before timing
+        rows: Rows processed per run (for throughput)
+        nbytes: Bytes processed per run (for throughput)
+        setup: Optional callable run untimed before every run
+
+    Returns:
+        dict: Timing statistics in milliseconds plus throughput and peak allocation
+    """
+    for _ in range(warmup):
+        if setup:
+            setup()
+        fn()
+
+    wall, cpu = [], []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start_wall, start_cpu = time.perf_counter(), time.process_time()
+        fn()
+        wall.append(time.perf_counter() - start_wall)
+        cpu.append(time.process_time() - start_cpu)
+
+    # Peak of a single run: the process-wide RSS peak never goes down, so every
+    # benchmark after the heaviest one would report the same number
+    if setup:
+        setup()
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak_alloc = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    wall_ms = np.array(wall) * 1000
+    result = {
+        'name': name,
+        'repeat': repeat,
+        'warmup': warmup,
+        'min_ms': float(wall_ms.min()),
+        'mean_ms': float(wall_ms.mean()),
+        'p50_ms': float(np.percentile(wall_ms, 50)),
+        'p90_ms': float(np.percentile(wall_ms, 90)),
+        'p99_ms': float(np.percentile(wall_ms, 99)),
+        'max_ms': float(wall_ms.max()),
+        'cpu_p50_ms': float(np.percentile(np.array(cpu) * 1000, 50)),
+        'rows': rows,
+        'bytes': nbytes,
+        'rows_per_s': rows / np.median(wall) if rows else None,
+        'mb_per_s': nbytes / 1024 / 1024 / np.median(wall) if nbytes else None,
+        'peak_alloc_mb': peak_alloc / 1024 / 1024,
+    }
+    return result
+
+
+def _quiet(fn, *args, **kwargs):
+    """Call fn with its progress prints silenced"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        return fn(*args, **kwargs)
+
+
+def build_benchmarks(db_path, xml_path, work_dir):
+    """
+    Prepare the data and return the benchmark definitions
+
+    Returns:
+        list: (name, fn, kwargs for run_benchmark)
+    """
+    benchmarks = []
+
+    # Working copy of the store so conversions never touch the real files
+    work_db = Path(work_dir) / 'db'
+    work_db.mkdir(parents=True, exist_ok=True)
+    for filename in ('PUN-MGP.csv', 'PUN-MGP-15.csv', 'IT012E00801406.csv', 'GAS-MGP.csv'):
+        if (Path(db_path) / filename).exists():
+            shutil.copy2(Path(db_path) / filename, work_db / filename)
+
+    # XML parsing
+    xml_files = sorted(Path(xml_path).glob('*MGPPrezzi.xml'))
+    if xml_files:
+        xml_rows = sum(len(parse_mgp_xml(f)) for f in xml_files)
+        xml_bytes = sum(f.stat().st_size for f in xml_files)
+        benchmarks.append((
+            'xml_parse',
+            lambda: [parse_mgp_xml(f) for f in xml_files],
+            {'rows': xml_rows, 'nbytes': xml_bytes},
+        ))
+
+    # CSV -> Parquet conversion
+    pun_csv = work_db / 'PUN-MGP.csv'
+    pun = pd.read_csv(pun_csv, sep=';', encoding='utf-8-sig')
+    benchmarks.append((
+        'convert_pun_mgp',
+        lambda: _quiet(convert_to_parquet.convert_pun_mgp, work_db),
+        {'rows': len(pun), 'nbytes': pun_csv.stat().st_size},
+    ))
+
+    meter_csv = work_db / 'IT012E00801406.csv'
+    has_meter = meter_csv.exists()
+    if has_meter:
+        meter_rows = sum(1 for _ in open(meter_csv, encoding='utf-8')) - 1
+        benchmarks.append((
+            'convert_consumi',
+            lambda: _quiet(convert_to_parquet.convert_consumi, work_db),
+            {
+                'rows': meter_rows,
+                'nbytes': meter_csv.stat().st_size,
+                'setup': lambda: shutil.rmtree(work_db / 'Consumi', ignore_errors=True),
+            },
+        ))
+
+    # Range queries on the Parquet store
+    _quiet(convert_to_parquet.convert_pun_mgp, work_db)
+    last_date = pd.read_parquet(work_db / 'PUN-MGP.parquet', columns=['Date'])['Date'].max()
+    range_start = last_date - pd.Timedelta(days=90)
+    benchmarks.append((
+        'range_query_pun_90d',
+        lambda: pd.read_parquet(
+            work_db / 'PUN-MGP.parquet',
+            filters=[('Date', '>=', range_start), ('Date', '<=', last_date)]
+        ),
+        {'rows': 90 * 24},
+    ))
+
+    prices = load_prices(work_db)
+    range_end = prices.end
+    benchmarks.append((
+        'range_query_price_series_90d',
+        lambda: np.nanmean(prices.slice(range_end - 90 * 24, range_end)),
+        {'rows': 90 * 24},
+    ))
+    lookup_minutes = np.random.default_rng(0).integers(
+        prices.first * 60, range_end * 60, 1_000_000
+    )
+    benchmarks.append((
+        'price_series_lookup_1m',
+        lambda: prices.lookup(lookup_minutes),
+        {'rows': len(lookup_minutes)},
+    ))
+
+    # Rollups
+    pun_parquet = pd.read_parquet(work_db / 'PUN-MGP.parquet')
+    benchmarks.append((
+        'rollup_pun_daily',
+        lambda: pun_parquet.groupby('Date')['PUN'].agg(['mean', 'min', 'max']),
+        {'rows': len(pun_parquet)},
+    ))
+    benchmarks.append((
+        'rollup_pun_monthly',
+        lambda: pun_parquet.groupby(pun_parquet['Date'].dt.to_period('M'))['PUN'].mean(),
+        {'rows': len(pun_parquet)},
+    ))
+
+    # Dense day x interval store: a 4x finer resolution must not mean 4x slower queries
+    for dataset in ('PUN-MGP', 'PUN-MGP-15'):
+        if not (work_db / f'{dataset}.csv').exists():
+            continue
+        store = load_interval_store(work_db, dataset, use_cache=False)
+        benchmarks.append((
+            f'dense_rollup_monthly_{store.minutes}m',
+            lambda store=store: store.rollup('month'),
+            {'rows': int(store.counts.sum())},
+        ))
+        benchmarks.append((
+            f'dense_range_query_90d_{store.minutes}m',
+            lambda store=store: np.nanmean(store.slice(store.last_day - 89)),
+            {'rows': int(store.counts[-90:].sum())},
+        ))
+
+    if has_meter:
+        benchmarks.append((
+            'rollup_cost_monthly',
+            lambda: run_cost_engine(meter_csv, levels=('month', 'fascia'), prices=prices),
+            {'rows': meter_rows},
+        ))
+
+    # Fascia classification and DST time axis
+    days = yyyymmdd_to_day_number(pun['Date'].to_numpy())
+    hours = pun['Hour'].to_numpy(dtype='int64')
+    benchmarks.append((
+        'fascia_classification',
+        lambda: get_fascia_codes(days, hours),
+        {'rows': len(pun)},
+    ))
+    benchmarks.append((
+        'dst_time_axis_prices',
+        lambda: days * 1440 - midnight_utc_offset_hours(days) * 60 + (hours - 1) * 60,
+        {'rows': len(pun)},
+    ))
+    if has_meter:
+        meter = pd.read_csv(meter_csv, sep=';', usecols=['DATA', 'ORA', 'FL_ORA_LEGALE'])
+        benchmarks.append((
+            'dst_time_axis_meter',
+            lambda: meter_utc_minutes(meter['DATA'].to_numpy(), meter['ORA'].to_numpy(),
+                                      meter['FL_ORA_LEGALE'].to_numpy()),
+            {'rows': len(meter)},
+        ))
+
+    # Dashboard filters over the whole history
+    dashboard = pd.DataFrame({
+        'Date': days.astype('datetime64[D]'),
+        'Month': (days.astype('datetime64[D]').astype('datetime64[M]').astype('int64') % 12 + 1),
+        'WeekdayNum': (days + 3) % 7,
+        'Fascia': FASCIA_LABELS[get_fascia_codes(days, hours)],
+    })
+    benchmarks.append((
+        'dashboard_filter_index_build',
+        lambda: FilterIndex(dashboard),
+        {'rows': len(dashboard), 'repeat_scale': 0.5},
+    ))
+    index = FilterIndex(dashboard)
+    start_filter = dashboard['Date'].iloc[len(dashboard) // 4]
+    end_filter = dashboard['Date'].iloc[3 * len(dashboard) // 4]
+    selection = {'Month': [1, 2, 3, 7, 8], 'WeekdayNum': [0, 1, 2, 3, 4], 'Fascia': ['F1', 'F2']}
+    benchmarks.append((
+        'dashboard_filter_select',
+        lambda: index.select(selection, start_date=start_filter, end_date=end_filter),
+        {'rows': len(dashboard)},
+    ))
+    benchmarks.append((
+        'dashboard_filter_isin_reference',
+        lambda: dashboard[
+            dashboard['Month'].isin(selection['Month']) &
+            dashboard['WeekdayNum'].isin(selection['WeekdayNum']) &
+            dashboard['Fascia'].isin(selection['Fascia']) &
+            (dashboard['Date'] >= start_filter) & (dashboard['Date'] <= end_filter)
+        ],
+        {'rows': len(dashboard)},
+    ))
+
+    return benchmarks
+
+
+def compare_with_baseline(results, baseline, threshold=DEFAULT_THRESHOLD,
+                          min_delta_ms=DEFAULT_MIN_DELTA_MS):
+    """
+    Compare p50 latencies with a baseline run
+
+    Returns:
+        list: (name, baseline p50, current p50, ratio, regressed) per shared benchmark
+    """
+    rows = []
+    for name, current in results['benchmarks'].items():
+        reference = baseline.get('benchmarks', {}).get(name)
+        if not reference:
+            continue
+        base_ms, cur_ms = reference['p50_ms'], current['p50_ms']
+        ratio = cur_ms / base_ms if base_ms > 0 else float('inf')
+        regressed = ratio > 1 + threshold and (cur_ms - base_ms) > min_delta_ms
+        rows.append((name, base_ms, cur_ms, ratio, regressed))
+    return rows
+
+
+def repo_relative(path):
+    """Path relative to the repository root when inside it, else as given"""
+    path = Path(path).resolve()
+    try:
+        return path.relative_to(REPO_ROOT).as_posix()
+    except ValueError:
+        return str(path)
+
+
+def print_report(results):
+    """Print the results table"""
+    print(f"{'benchmark':<34}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'rows/s':>14}{'MB/s':>9}{'peak MB':>9}")
+    print("-" * 96)
+    for name, r in results['benchmarks'].items():
+        rows_per_s = f"{r['rows_per_s']:,.0f}" if r['rows_per_s'] else "-"
+        mb_per_s = f"{r['mb_per_s']:.1f}" if r['mb_per_s'] else "-"
+        peak = f"{r['peak_alloc_mb']:.1f}" if r.get('peak_alloc_mb') is not None else "-"
+        print(f"{name:<34}{r['p50_ms']:>10.3f}{r['p90_ms']:>10.3f}{r['p99_ms']:>10.3f}"
+              f"{rows_per_s:>14}{mb_per_s:>9}{peak:>9}")
+
+
+def main(argv=None):
+    """Run the suite, save the JSON results and check the baseline."""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', default=str(DEFAULT_DB_PATH), help='Folder with the CSV store')
+    parser.add_argument('--xml', default=str(DEFAULT_XML_PATH), help='Folder with MGPPrezzi XML files')
+    parser.add_argument('--repeat', type=int, default=10, help='Timed runs per benchmark')
+    parser.add_argument('--warmup', type=int, default=2, help='Warmup runs per benchmark')
+    parser.add_argument('--only', nargs='*', help='Run only benchmarks whose name contains one of these')
+    parser.add_argument('--output', help='Results JSON (default: benchmarks/results-<timestamp>.json)')
+    parser.add_argument('--baseline', nargs='?', const=str(DEFAULT_BASELINE_PATH),
+                        help='Baseline JSON to compare against (default: benchmarks/baseline.json)')
+    parser.add_argument('--save-baseline', action='store_true',
+                        help='Also save the results as benchmarks/baseline.json')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help='Allowed p50 slowdown ratio (0.2 = 20%%)')
+    parser.add_argument('--min-delta-ms', type=float, default=DEFAULT_MIN_DELTA_MS,
+                        help='Ignore slowdowns smaller than this many ms')
+    args = parser.parse_args(argv)
+
+    # The suite does its own timing; keep benchmark runs out of the pipeline metrics
+    instrumentation.configure(metrics_path='off')
+
+    results = {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'cpu_count': os.cpu_count(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'db': repo_relative(args.db),
+        'xml': repo_relative(args.xml),
+        'benchmarks': {},
+    }
+
+    with tempfile.TemporaryDirectory(prefix='oneenergy-bench-') as work_dir:
+        benchmarks = build_benchmarks(args.db, args.xml, work_dir)
+        for name, fn, options in benchmarks:
+            if args.only and not any(part in name for part in args.only):
+                continue
+            options = dict(options)
+            repeat = max(1, int(args.repeat * options.pop('repeat_scale', 1)))
+            print(f"Running {name}...", file=sys.stderr)
+            results['benchmarks'][name] = run_benchmark(
+                name, fn, repeat=repeat, warmup=args.warmup, **options
+            )
+
+    results['peak_rss_mb'] = peak_rss_mb()
+    print_report(results)
+
+    output = Path(args.output) if args.output else (
+        DEFAULT_RESULTS_DIR / f"results-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json"
+    )
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(results, indent=2))
+    print(f"\nResults saved to {output}")
+    if args.save_baseline:
+        DEFAULT_BASELINE_PATH.parent.mkdir(parents=True, exist_ok=True)
+        DEFAULT_BASELINE_PATH.write_text(json.dumps(results, indent=2))
+        print(f"Baseline saved to {DEFAULT_BASELINE_PATH}")
+
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text())
+        comparison = compare_with_baseline(results, baseline, args.threshold, args.min_delta_ms)
+        print(f"\nComparison with {args.baseline} (threshold +{args.threshold:.0%}):")
+        for name, base_ms, cur_ms, ratio, regressed in comparison:
+            flag = "REGRESSION" if regressed else "ok"
+            print(f"  {name:<34}{base_ms:>10.3f} -> {cur_ms:>10.3f} ms  x{ratio:.2f}  {flag}")
+        regressions = [row for row in comparison if row[4]]
+        if regressions:
+            print(f"\n[FAILED] {len(regressions)} benchmark(s) regressed")
+            return 1
+        print("\n[SUCCESS] No regressions")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,45 +2,86 @@
 Convert CSV energy data files to Parquet format for improved performance.
 Optimizes data types and applies compression for faster Power BI loading.
 """
+import argparse
+import numpy as np
 import pandas as pd
 import pyarrow as pa
-import pyarrow.parquet as pq
 from pathlib import Path
 import sys
 from datetime import datetime
 
-def convert_pun_mgp(db_path):
-    """Convert PUN-MGP price data to Parquet."""
-    print("Converting PUN-MGP.csv...")
-
-    # Read CSV with correct separator
-    df = pd.read_csv(db_path / 'PUN-MGP.csv', sep=';', encoding='utf-8-sig')
+sys.path.append(str(Path(__file__).parent / 'py'))
+from instrumentation import span
+from download_and_read_excel import infer_resolution_minutes
+from interval_store import RESOLUTION_KEY
+from static_shards import export_shards
+from rolling_stats import update_rolling_stats
+from data_quality import run_quality_gate
+from pipeline_status import refresh_manifest
+from fixed_point import parse_fixed, from_fixed, to_decimal_array, fixed_point_enabled
+from parquet_layout import OBJECTIVES, print_results, tune_layouts, write_dataset, write_table
+
+def convert_pun_mgp(db_path, filename='PUN-MGP.csv', fixed_point=None):
+    """
+    Convert PUN-MGP price data (hourly or quarter-hourly) to Parquet.
+
+    With fixed_point (default: ONEENERGY_FIXED_POINT) PUN is stored exactly
+    as decimal(18, 6) micro-euros parsed from the CSV text, instead of float32.
+    Written with the dataset's tuned layout (see parquet_layout).
+    """
+    print(f"Converting {filename}...")
+    if fixed_point is None:
+        fixed_point = fixed_point_enabled()
+
+    # Read CSV with correct separator (PUN as text when parsed to fixed point)
+    with span('read') as s:
+        df = pd.read_csv(db_path / filename, sep=';', encoding='utf-8-sig',
+                         dtype={'PUN': 'str'} if fixed_point else None)
+        s.add(rows=len(df), bytes=(db_path / filename).stat().st_size)
 
     # Parse date (format: YYYYMMDD)
     df['Date'] = pd.to_datetime(df['Date'], format='%Y%m%d')
 
     # Optimize data types
-    df['Hour'] = df['Hour'].astype('int8')  # Hours 1-24 fit in int8
-    df['PUN'] = df['PUN'].astype('float32')  # Price precision sufficient with float32
+    if 'Interval' in df.columns:
+        df['Interval'] = df['Interval'].astype('int16')  # Quarter-hours 1-100
+        minutes = infer_resolution_minutes(df['Interval'].to_numpy())
+    else:
+        df['Hour'] = df['Hour'].astype('int8')  # Hours 1-24 fit in int8
+        minutes = 60
+    if fixed_point:
+        # Empty cells (hours GME has not priced) are stored as nulls
+        text = df['PUN']
+        missing = (text.isna() | (text.str.strip() == '')).to_numpy()
+        micro = np.zeros(len(df), dtype='int64')
+        micro[~missing] = parse_fixed(text[~missing].to_numpy())
+        df['PUN'] = np.where(missing, np.nan, from_fixed(micro))  # Replaced by the exact decimals when writing
+    else:
+        df['PUN'] = df['PUN'].astype('float32')  # Price precision sufficient with float32
 
     # Add year column for potential partitioning
     df['Year'] = df['Date'].dt.year.astype('int16')
 
-    # Save as Parquet with compression
-    output_path = db_path / 'PUN-MGP.parquet'
-    df.to_parquet(
-        output_path,
-        compression='snappy',  # Fast compression
-        index=False,
-        engine='pyarrow'
-    )
+    # Save as Parquet with compression, recording the resolution in the schema
+    output_path = db_path / filename.replace('.csv', '.parquet')
+    with span('write') as s:
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        if fixed_point:
+            table = table.set_column(table.schema.get_field_index('PUN'), 'PUN', to_decimal_array(micro, missing))
+        table = table.replace_schema_metadata(
+            {**(table.schema.metadata or {}), RESOLUTION_KEY: str(minutes).encode()}
+        )
+        # Decimals are stored as INT64 and delta bit-packed: smaller than float32
+        write_table(table, output_path, filename[:-len('.csv')], db_path)
+        s.add(rows=len(df), bytes=output_path.stat().st_size)
 
     # Report statistics
-    original_size = (db_path / 'PUN-MGP.csv').stat().st_size / 1024 / 1024
+    original_size = (db_path / filename).stat().st_size / 1024 / 1024
     new_size = output_path.stat().st_size / 1024 / 1024
     reduction = (1 - new_size/original_size) * 100
 
-    print(f"  - Rows: {len(df):,}")
+    encoding = 'fixed point' if fixed_point else 'float32'
+    print(f"  - Rows: {len(df):,} ({minutes}-minute intervals, {encoding} prices)")
     print(f"  - Date range: {df['Date'].min().date()} to {df['Date'].max().date()}")
     print(f"  - Size: {original_size:.2f} MB -> {new_size:.2f} MB ({reduction:.1f}% reduction)")
 
@@ -51,13 +92,17 @@ def convert_consumi(db_path):
     print("\nConverting IT012E00801406.csv (Consumi)...")
 
     # Read CSV
-    df = pd.read_csv(db_path / 'IT012E00801406.csv', sep=';', encoding='utf-8')
+    with span('read') as s:
+        df = pd.read_csv(db_path / 'IT012E00801406.csv', sep=';', encoding='utf-8')
+        s.add(rows=len(df), bytes=(db_path / 'IT012E00801406.csv').stat().st_size)
 
     # Parse date and time (DATA: YYYYMMDD, ORA: HHMM00)
-    df['DateTime'] = pd.to_datetime(
-        df['DATA'].astype(str) + ' ' + df['ORA'].astype(str).str.zfill(6),
-        format='%Y%m%d %H%M%S'
-    )
+    with span('parse') as s:
+        s.add(rows=len(df))
+        df['DateTime'] = pd.to_datetime(
+            df['DATA'].astype(str) + ' ' + df['ORA'].astype(str).str.zfill(6),
+            format='%Y%m%d %H%M%S'
+        )
 
     # Optimize data types
     numeric_columns = [
@@ -85,22 +130,16 @@ def convert_consumi(db_path):
     output_path = db_path / 'Consumi'
 
     # Create partitioned dataset
-    table = pa.Table.from_pandas(df)
-    pq.write_to_dataset(
-        table,
-        root_path=str(output_path),
-        partition_cols=['Year'],
-        compression='snappy'
-    )
+    with span('write_partitioned') as s:
+        table = pa.Table.from_pandas(df)
+        write_dataset(table, output_path, ['Year'], 'IT012E00801406', db_path)
+        s.add(rows=len(df))
 
     # Also create single file version for simpler access
     single_file_path = db_path / 'IT012E00801406.parquet'
-    df.to_parquet(
-        single_file_path,
-        compression='snappy',
-        index=False,
-        engine='pyarrow'
-    )
+    with span('write') as s:
+        write_table(pa.Table.from_pandas(df, preserve_index=False), single_file_path, 'IT012E00801406', db_path)
+        s.add(rows=len(df), bytes=single_file_path.stat().st_size)
 
     # Report statistics
     original_size = (db_path / 'IT012E00801406.csv').stat().st_size / 1024 / 1024
@@ -133,12 +172,7 @@ def convert_gas_mgp(db_path):
 
     # Save as Parquet
     output_path = db_path / 'GAS-MGP.parquet'
-    df.to_parquet(
-        output_path,
-        compression='snappy',
-        index=False,
-        engine='pyarrow'
-    )
+    write_table(pa.Table.from_pandas(df, preserve_index=False), output_path, 'GAS-MGP', db_path)
 
     original_size = (db_path / 'GAS-MGP.csv').stat().st_size / 1024
     new_size = output_path.stat().st_size / 1024
@@ -148,8 +182,62 @@ def convert_gas_mgp(db_path):
 
     return df
 
-def main():
+def convert_psv(db_path, filename):
+    """Convert PSV_DA (daily) or PSV_MA (monthly) gas prices to Parquet."""
+    print(f"\nConverting {filename}...")
+
+    df = pd.read_csv(db_path / filename, sep=';', encoding='utf-8')
+    date_col, value_col = df.columns[0], df.columns[1]
+
+    # PSV_DA uses dd/mm/yyyy, PSV_MA uses YearMonth (newest first)
+    if date_col == 'YearMonth':
+        df['Date'] = pd.to_datetime(df[date_col].astype(str), format='%Y%m', errors='coerce')
+    else:
+        df['Date'] = pd.to_datetime(df[date_col], format='%d/%m/%Y', errors='coerce')
+    df[value_col] = pd.to_numeric(df[value_col], errors='coerce').astype('float32')
+    df = df.sort_values('Date').reset_index(drop=True)
+
+    output = db_path / filename.replace('.csv', '.parquet')
+    write_table(pa.Table.from_pandas(df, preserve_index=False), output, filename[:-len('.csv')], db_path)
+
+    print(f"  - Rows: {len(df):,}")
+    print(f"  - Date range: {df['Date'].min().date()} to {df['Date'].max().date()}")
+    print(f"  - Converted to {output.name}")
+
+    return df
+
+def convert_datasets(db_path):
+    """Convert every CSV dataset present in db_path."""
+    with span('convert.pun_mgp') as s:
+        pun_df = convert_pun_mgp(db_path)
+        s.add(rows=len(pun_df))
+    if (db_path / 'PUN-MGP-15.csv').exists():
+        with span('convert.pun_mgp_15') as s:
+            s.add(rows=len(convert_pun_mgp(db_path, 'PUN-MGP-15.csv')))
+    with span('convert.consumi') as s:
+        consumi_df = convert_consumi(db_path)
+        s.add(rows=len(consumi_df))
+
+    # Convert smaller files if they exist
+    if (db_path / 'GAS-MGP.csv').exists():
+        with span('convert.gas_mgp') as s:
+            gas_df = convert_gas_mgp(db_path)
+            s.add(rows=len(gas_df))
+
+    # Convert PSV files if they exist
+    for psv_file in ['PSV_DA.csv', 'PSV_MA.csv']:
+        if (db_path / psv_file).exists():
+            with span(f"convert.{psv_file[:-4].lower()}") as s:
+                s.add(rows=len(convert_psv(db_path, psv_file)))
+
+def main(argv=None):
     """Main conversion function."""
+    parser = argparse.ArgumentParser(description='Convert the CSV datasets to Parquet')
+    parser.add_argument('--tune', action='store_true',
+                        help='Measure Parquet layouts, save the best per dataset and rewrite with them')
+    parser.add_argument('--objective', choices=list(OBJECTIVES), default='balanced', help='Ranking of --tune')
+    args = parser.parse_args(argv)
+
     # Get database path
     script_dir = Path(__file__).parent
     db_path = script_dir.parent / 'db'
@@ -162,23 +250,34 @@ def main():
     print(f"Database path: {db_path}\n")
     print("=" * 50)
 
-    try:
-        # Convert main data files
-        pun_df = convert_pun_mgp(db_path)
-        consumi_df = convert_consumi(db_path)
-
-        # Convert smaller files if they exist
-        if (db_path / 'GAS-MGP.csv').exists():
-            gas_df = convert_gas_mgp(db_path)
+    # Do not publish data that fails the quality thresholds
+    if not run_quality_gate(db_path):
+        print("\nError: data quality thresholds exceeded (set ONEENERGY_QUALITY=warn to convert anyway)")
+        sys.exit(1)
+    print()
 
-        # Convert PSV files if they exist
-        for psv_file in ['PSV_DA.csv', 'PSV_MA.csv']:
-            if (db_path / psv_file).exists():
-                print(f"\nConverting {psv_file}...")
-                df = pd.read_csv(db_path / psv_file, sep=';', encoding='utf-8')
-                output = db_path / psv_file.replace('.csv', '.parquet')
-                df.to_parquet(output, compression='snappy', index=False)
-                print(f"  - Converted to {output.name}")
+    try:
+        convert_datasets(db_path)
+
+        # Measure layouts on the converted files, then rewrite them with the winners
+        if args.tune:
+            print("\nTuning Parquet layouts...")
+            with span('convert.tune_layouts'):
+                tuned = tune_layouts(db_path, objective=args.objective)
+            for dataset, (_, results) in tuned.items():
+                print_results(dataset, results)
+            print("\nRewriting with the tuned layouts")
+            convert_datasets(db_path)
+
+        # Refresh the chart's static shards (only changed months are rewritten)
+        with span('convert.static_shards'):
+            stats = export_shards(db_path)
+            print(f"\nChart shards: {stats['written']} written, {stats['unchanged']} unchanged")
+        with span('convert.rolling_stats'):
+            _, recomputed = update_rolling_stats(db_path)
+            print(f"Rolling statistics: {recomputed} days updated")
+        with span('convert.manifest'):
+            refresh_manifest(db_path)
 
         print("\n" + "=" * 50)
         print("Conversion completed successfully!")
@@ -0,0 +1,398 @@
+"""
+Deterministic synthetic datasets for scale testing.
+
+Writes the same formats the real pipeline reads, so benchmarks and scaling
+tests go through the real parsers:
+    sources/GME/EE/YYYYMMDDMGPPrezzi.xml   daily MGP prices, every zone column
+    db/PUN-MGP.csv                         hourly PUN (23/25 hours on DST days)
+    db/PUN-MGP-15.csv                      quarter-hourly PUN (92/100 on DST days)
+    db/pods/<POD>.csv                      15-minute meter data, IT012E00801406 layout
+    db/IT012E00801406.csv                  the first POD, where the converters expect it
+    db/GAS-MGP.csv, db/PSV_DA.csv, db/PSV_MA.csv
+    sources/GME/Anno/Anno{year}.zip        with --archives: GME yearly archives for
+                                           backfill.py --source-dir (every year but
+                                           the last, which stays XML-only)
+
+The same seed and options always produce byte-identical files.
+
+Usage:
+    python src/generate_synthetic_data.py --output synthetic --scale 10
+    python src/generate_synthetic_data.py --output synthetic --start-year 2016 --years 10 --pods 1000
+    python src/generate_synthetic_data.py --output synthetic --archives --xml-days 400
+"""
+import argparse
+import io
+import re
+import sys
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(str(Path(__file__).resolve().parent / 'py'))
+
+from download_and_read_excel import (
+    day_number_to_yyyymmdd, yyyymmdd_to_day_number, midnight_utc_offset_hours,
+    rome_utc_offset_hours, intervals_per_day
+)
+from cost_engine import meter_utc_minutes
+from backfill import PRICES_SHEET
+
+DEFAULT_SEED = 20250901
+DEFAULT_START_YEAR = 2024
+DEFAULT_YEARS = 2
+BASE_XML_DAYS = 21  # Daily XML files shipped with the repo
+FIRST_POD = 'IT012E00801406'
+ARCHIVE_ZONES = ['NORD', 'CNOR', 'CSUD', 'SUD', 'CALA', 'SICI', 'SARD']
+ARCHIVE_TIMESTAMP = (2000, 1, 1, 0, 0, 0)  # Fixed zip entry dates keep the archives reproducible
+
+ZONES = [
+    'NAT', 'CALA', 'CNOR', 'CSUD', 'NORD', 'SARD', 'SICI', 'SUD', 'AUST', 'COAC', 'COUP',
+    'CORS', 'FRAN', 'GREC', 'SLOV', 'SVIZ', 'BSP', 'MALT', 'XAUS', 'XFRA', 'MONT', 'XGRE'
+]
+METER_HEADER = [
+    'POD', 'DATA', 'ORA', 'FL_ORA_LEGALE', 'CONSUMO_ATTIVA_PRELEVATA', 'ATTIVA_IMMESSA',
+    'CONSUMO_REATTIVA_INDUTTIVA_PRELEVATA', 'REATTIVA_INDUTTIVA_IMMESSA',
+    'CONSUMO_REATTIVA_CAPACITIVA_PRELEVATA', 'REATTIVA_CAPACITIVA_IMMESSA',
+    'CONSUMO_PICCO_PRELEVATA', 'CONSUMO_PICCO_IMMESSA', 'TIPO_DATO'
+]
+
+XML_HEADER = '''<?xml version="1.0" standalone="yes"?>
+<NewDataSet>
+  <xs:schema id="NewDataSet" xmlns="" xmlns:xs="http://www.w3.org/2001/XMLSchema" xmlns:msdata="urn:schemas-microsoft-com:xml-msdata">
+    <xs:element name="NewDataSet" msdata:IsDataSet="true" msdata:UseCurrentLocale="true">
+      <xs:complexType>
+        <xs:choice minOccurs="0" maxOccurs="unbounded">
+          <xs:element name="Prezzi">
+            <xs:complexType>
+              <xs:sequence>
+{elements}
+              </xs:sequence>
+            </xs:complexType>
+          </xs:element>
+        </xs:choice>
+      </xs:complexType>
+    </xs:element>
+  </xs:schema>
+'''
+
+
+def day_range(start_year, years):
+    """Day numbers from 1 January of start_year for the given number of years"""
+    first = int(yyyymmdd_to_day_number([start_year * 10000 + 101])[0])
+    last = int(yyyymmdd_to_day_number([(start_year + years) * 10000 + 101])[0])
+    return np.arange(first, last, dtype='int64')
+
+
+def interval_axis(days, minutes=60):
+    """
+    Flatten (day, interval) for every local day
+
+    Returns:
+        tuple: (day numbers, 1-based interval of the day, local clock hour 0-23)
+    """
+    counts = intervals_per_day(days, minutes)
+    day_of_row = np.repeat(days, counts)
+    interval = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    utc_minutes = day_of_row * 1440 - midnight_utc_offset_hours(day_of_row) * 60 + interval * minutes
+    local_hour = ((utc_minutes + rome_utc_offset_hours(utc_minutes * 60) * 60) // 60) % 24
+    return day_of_row, interval + 1, local_hour
+
+
+def price_curve(rng, days, local_hour, minutes=60):
+    """
+    PUN-like prices: yearly level, seasonality, daily shape, weekend discount,
+    noise and rare spikes (EUR/MWh)
+    """
+    years = days.astype('datetime64[D]').astype('datetime64[Y]').astype('int64') + 1970
+    level = 60 + 40 * np.sin((years - 2016) * 0.9) ** 2
+    season = 15 * np.cos(2 * np.pi * ((days % 365) / 365.0))
+    shape = 18 * np.exp(-((local_hour - 9) ** 2) / 6) + 28 * np.exp(-((local_hour - 20) ** 2) / 5)
+    solar_dip = -12 * np.exp(-((local_hour - 13) ** 2) / 8)
+    weekend = np.where((days + 3) % 7 >= 5, -12.0, 0.0)
+    noise = rng.normal(0, 4 if minutes == 60 else 6, len(days))
+    spikes = np.where(rng.random(len(days)) < 0.002, rng.uniform(80, 250, len(days)), 0.0)
+    return np.round(np.maximum(level + season + shape + solar_dip + weekend + noise + spikes, 0.0), 6)
+
+
+def write_pun_csv(path, days, interval, prices, interval_col):
+    """PUN-MGP.csv layout (UTF-8 BOM, ';', point decimals, the 6 decimals GME publishes)"""
+    pd.DataFrame({
+        'Date': day_number_to_yyyymmdd(days),
+        interval_col: interval,
+        'PUN': prices,
+    }).to_csv(path, sep=';', index=False, encoding='utf-8-sig', float_format='%.6f')
+
+
+def write_mgp_xml(folder, day, hours, pun, zone_prices):
+    """One MGPPrezzi XML file for a day, in the GME layout (comma decimals)"""
+    date_text = str(int(day_number_to_yyyymmdd([day])[0]))
+    columns = ['Data', 'Mercato', 'Ora', 'PUN'] + ZONES
+    elements = '\n'.join(
+        f'                <xs:element name="{name}" type="xs:string" minOccurs="0" />' for name in columns
+    )
+    parts = [XML_HEADER.format(elements=elements)]
+    for i, hour in enumerate(hours):
+        parts.append('  <Prezzi>\n')
+        parts.append(f'    <Data>{date_text}</Data>\n    <Mercato>MGP</Mercato>\n    <Ora>{hour}</Ora>\n')
+        parts.append(f'    <PUN>{pun[i]:.6f}</PUN>\n'.replace('.', ','))
+        for z, zone in enumerate(ZONES):
+            parts.append(f'    <{zone}>{zone_prices[i, z]:.6f}</{zone}>\n'.replace('.', ','))
+        parts.append('  </Prezzi>\n')
+    parts.append('</NewDataSet>')
+    path = Path(folder) / f'{date_text}MGPPrezzi.xml'
+    path.write_text(''.join(parts), encoding='utf-8')
+    return path
+
+
+def _stable_xlsx(content):
+    """Repack an xlsx workbook with fixed entry and document dates"""
+    out = io.BytesIO()
+    with zipfile.ZipFile(io.BytesIO(content)) as source, \
+            zipfile.ZipFile(out, 'w', zipfile.ZIP_DEFLATED) as target:
+        for item in source.infolist():
+            data = source.read(item.filename)
+            if item.filename == 'docProps/core.xml':
+                data = re.sub(rb'\d{4}-\d\d-\d\dT\d\d:\d\d:\d\dZ', b'2000-01-01T00:00:00Z', data)
+            target.writestr(zipfile.ZipInfo(item.filename, ARCHIVE_TIMESTAMP), data, zipfile.ZIP_DEFLATED)
+    return out.getvalue()
+
+
+def write_annual_archive(folder, year, days, hours, pun, zone_prices):
+    """
+    Anno{year}.zip in the GME yearly layout: one workbook whose 'Prezzi-Prices'
+    sheet has the date (YYYYMMDD), the hour, the PUN and one column per zone
+    """
+    sheet = pd.DataFrame({
+        'Data/Date (YYYYMMDD)': day_number_to_yyyymmdd(days),
+        'Ora/Hour': hours,
+        'PUN': pun,
+        **{zone: zone_prices[:, z] for z, zone in enumerate(ARCHIVE_ZONES)},
+    })
+    workbook = io.BytesIO()
+    sheet.to_excel(workbook, sheet_name=PRICES_SHEET, index=False)
+
+    path = Path(folder) / f'Anno{year}.zip'
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr(zipfile.ZipInfo(f'Anno{year}.xlsx', ARCHIVE_TIMESTAMP),
+                         _stable_xlsx(workbook.getvalue()), zipfile.ZIP_DEFLATED)
+    return path
+
+
+def meter_frame(pod, pod_index, days, seed):
+    """
+    15-minute meter readings of one POD in the IT012E00801406 layout
+
+    DST days are written twice, once per FL_ORA_LEGALE flag, with zeros on the
+    slots that do not exist in that flag's offset, as in the real exports.
+    """
+    rng = np.random.default_rng([seed, pod_index])
+    utc_offsets = midnight_utc_offset_hours(days)
+    next_offsets = midnight_utc_offset_hours(days + 1)
+    switch_day = utc_offsets != next_offsets
+
+    # Day flag: 2 in legal time; DST days get both flags
+    flags = np.where(utc_offsets == 2, 2, 1)
+    day_rows = np.concatenate([days, days[switch_day]])
+    flag_rows = np.concatenate([flags, np.where(flags[switch_day] == 2, 1, 2)])
+    extra = np.concatenate([np.zeros(len(days)), np.ones(int(switch_day.sum()))])
+    order = np.lexsort((extra, day_rows))
+    day_rows, flag_rows = day_rows[order], flag_rows[order]
+
+    n = len(day_rows) * 96
+    day_of_row = np.repeat(day_rows, 96)
+    flag_of_row = np.repeat(flag_rows, 96)
+    slot = np.tile(np.arange(96), len(day_rows))
+    ora = (slot // 4) * 10000 + (slot % 4) * 1500
+    dates = day_number_to_yyyymmdd(day_of_row)
+    _, valid, _ = meter_utc_minutes(dates, ora, flag_of_row)
+
+    hour = slot / 4.0
+    base = rng.uniform(0.01, 0.05)
+    peak = rng.uniform(0.05, 0.6)
+    profile = base + peak * (np.exp(-((hour - 8) ** 2) / 3) + 1.2 * np.exp(-((hour - 20) ** 2) / 4))
+    season = 1 + 0.35 * np.cos(2 * np.pi * (day_of_row % 365) / 365.0) ** 2
+    consumo = np.round(np.maximum(profile * season * rng.lognormal(0, 0.35, n), 0), 3)
+
+    prosumer = pod_index % 4 == 3
+    if prosumer:
+        sun = np.clip(np.sin(np.pi * (hour - 6) / 13), 0, None) * (1 + 0.4 * np.sin(2 * np.pi * ((day_of_row % 365) - 80) / 365.0))
+        immessa = np.round(np.maximum(sun * rng.uniform(0.2, 1.0) * rng.uniform(0.3, 1.0, n) - consumo, 0), 3)
+    consumo = np.where(valid, consumo, 0.0)
+
+    frame = pd.DataFrame({
+        'POD': pod,
+        'DATA': dates,
+        'ORA': ora,
+        'FL_ORA_LEGALE': flag_of_row,
+        'CONSUMO_ATTIVA_PRELEVATA': consumo,
+        'ATTIVA_IMMESSA': np.where(valid, immessa, 0.0) if prosumer else np.nan,
+        'CONSUMO_REATTIVA_INDUTTIVA_PRELEVATA': np.where(valid, np.round(consumo * 0.05, 3), 0.0),
+        'REATTIVA_INDUTTIVA_IMMESSA': np.nan,
+        'CONSUMO_REATTIVA_CAPACITIVA_PRELEVATA': np.nan,
+        'REATTIVA_CAPACITIVA_IMMESSA': np.nan,
+        'CONSUMO_PICCO_PRELEVATA': np.round(1.5 + peak, 3),
+        'CONSUMO_PICCO_IMMESSA': 0,
+        # A few estimated readings, as in real exports
+        'TIPO_DATO': np.where(rng.random(n) < 0.001, 'S', 'E'),
+    })
+    return frame[METER_HEADER]
+
+
+def _write_pod(args):
+    pod, pod_index, days, seed, folder = args
+    path = Path(folder) / f'{pod}.csv'
+    meter_frame(pod, pod_index, days, seed).to_csv(path, sep=';', index=False, float_format='%.3f')
+    return path
+
+
+def pod_codes(n_pods):
+    """POD codes, the first one being the repo's IT012E00801406"""
+    return [FIRST_POD] + [f'IT001E{90000000 + i:08d}' for i in range(1, n_pods)]
+
+
+def write_gas(db_folder, days, rng):
+    """GAS-MGP.csv (with empty days), PSV_DA.csv (dd/mm/yyyy) and PSV_MA.csv (newest first)"""
+    trend = 30 + 15 * np.sin(np.arange(len(days)) / 180.0) ** 2
+    mgp_gas = np.round(trend + rng.normal(0, 1.5, len(days)), 3)
+    empty = rng.random(len(days)) < 0.03
+    dates = day_number_to_yyyymmdd(days)
+
+    with open(Path(db_folder) / 'GAS-MGP.csv', 'w', encoding='utf-8-sig', newline='') as f:
+        f.write('Date;MGP-GAS\n')
+        for date, value, is_empty in zip(dates, mgp_gas, empty):
+            f.write(f"{date};{'' if is_empty else f'{value:g}'}\n")
+
+    psv_da = np.round(trend / 95 + rng.normal(0, 0.01, len(days)), 5)
+    day_text = days.astype('datetime64[D]').astype(str)
+    with open(Path(db_folder) / 'PSV_DA.csv', 'w', encoding='utf-8', newline='') as f:
+        f.write('Date;PSV_DA [€/Smc]\n')
+        for text, value in zip(day_text, psv_da):
+            year, month, day = text.split('-')
+            f.write(f'{day}/{month}/{year};{value:.5f}\n')
+
+    months = np.unique(days.astype('datetime64[D]').astype('datetime64[M]'))
+    monthly = pd.Series(psv_da).groupby(days.astype('datetime64[D]').astype('datetime64[M]')).mean()
+    with open(Path(db_folder) / 'PSV_MA.csv', 'w', encoding='utf-8', newline='') as f:
+        f.write('YearMonth;PSV €/Smc\n')
+        for month in months[::-1]:
+            f.write(f"{str(month).replace('-', '')};{monthly[month]:.6f}\n")
+
+
+def generate(output, start_year=DEFAULT_START_YEAR, years=DEFAULT_YEARS, pods=1,
+             xml_days=BASE_XML_DAYS, seed=DEFAULT_SEED, workers=1, archives=False):
+    """
+    Write a full synthetic dataset under output/
+
+    Args:
+        output: Target folder (sources/ and db/ are created inside)
+        start_year: First year of the series
+        years: Number of years
+        pods: Number of POD meter files
+        xml_days: Number of daily XML files (the last days of the range)
+        seed: Random seed
+        workers: Processes used to write the POD files
+        archives: Also write the Anno{year}.zip archives of every year but the last
+
+    Returns:
+        dict: Counts of what was written
+    """
+    output = Path(output)
+    db_folder = output / 'db'
+    xml_folder = output / 'sources' / 'GME' / 'EE'
+    pod_folder = db_folder / 'pods'
+    for folder in (db_folder, xml_folder, pod_folder):
+        folder.mkdir(parents=True, exist_ok=True)
+
+    rng = np.random.default_rng(seed)
+    days = day_range(start_year, years)
+
+    # Hourly and quarter-hourly PUN
+    hour_days, hours, hour_clock = interval_axis(days, 60)
+    hourly = price_curve(rng, hour_days, hour_clock, 60)
+    write_pun_csv(db_folder / 'PUN-MGP.csv', hour_days, hours, hourly, 'Hour')
+
+    quarter_days, quarters, quarter_clock = interval_axis(days, 15)
+    quarterly = np.round(np.repeat(hourly, 4)[:len(quarter_days)] + rng.normal(0, 3, len(quarter_days)), 6)
+    write_pun_csv(db_folder / 'PUN-MGP-15.csv', quarter_days, quarters, np.maximum(quarterly, 0), 'Interval')
+
+    # Daily XML files with every zone
+    zone_factors = rng.uniform(0.85, 1.2, len(ZONES))
+    xml_start = max(len(days) - xml_days, 0)
+    for day in days[xml_start:]:
+        lo, hi = np.searchsorted(hour_days, [day, day + 1])
+        zone_prices = hourly[lo:hi, None] * zone_factors[None, :] + rng.normal(0, 2, (hi - lo, len(ZONES)))
+        write_mgp_xml(xml_folder, day, hours[lo:hi], hourly[lo:hi], np.round(np.maximum(zone_prices, 0), 6))
+
+    # Meter files
+    codes = pod_codes(pods)
+    jobs = [(pod, i, days, seed, pod_folder) for i, pod in enumerate(codes)]
+    if workers > 1 and pods > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            paths = list(pool.map(_write_pod, jobs, chunksize=8))
+    else:
+        paths = [_write_pod(job) for job in jobs]
+    (db_folder / f'{FIRST_POD}.csv').write_bytes(paths[0].read_bytes())
+
+    write_gas(db_folder, days, rng)
+
+    # Yearly archives (own generator, so the other files do not change with the flag)
+    archive_years = []
+    if archives:
+        archive_folder = output / 'sources' / 'GME' / 'Anno'
+        archive_folder.mkdir(parents=True, exist_ok=True)
+        archive_factors = np.random.default_rng(seed + 1).uniform(0.85, 1.2, len(ARCHIVE_ZONES))
+        years_of_row = hour_days.astype('datetime64[D]').astype('datetime64[Y]').astype('int64') + 1970
+        for year in range(start_year, start_year + years - 1):
+            rows = years_of_row == year
+            zone_prices = np.round(hourly[rows, None] * archive_factors[None, :], 6)
+            write_annual_archive(archive_folder, year, hour_days[rows], hours[rows], hourly[rows], zone_prices)
+            archive_years.append(year)
+
+    return {
+        'days': len(days),
+        'hourly_rows': len(hourly),
+        'quarter_hour_rows': len(quarterly),
+        'xml_files': len(days) - xml_start,
+        'pods': len(codes),
+        'meter_rows_per_pod': len(days) * 96 + 96 * int(np.sum(intervals_per_day(days) != 24)),
+        'archive_years': archive_years,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--output', default='synthetic', help='Output folder')
+    parser.add_argument('--scale', type=float, default=None,
+                        help='Multiplier of the repo volume: PODs and XML days (overrides --pods/--xml-days)')
+    parser.add_argument('--start-year', type=int, default=DEFAULT_START_YEAR)
+    parser.add_argument('--years', type=int, default=DEFAULT_YEARS)
+    parser.add_argument('--pods', type=int, default=1)
+    parser.add_argument('--xml-days', type=int, default=BASE_XML_DAYS)
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED)
+    parser.add_argument('--workers', type=int, default=1, help='Processes writing POD files')
+    parser.add_argument('--archives', action='store_true',
+                        help='Also write Anno{year}.zip archives for backfill.py --source-dir')
+    args = parser.parse_args(argv)
+
+    pods, xml_days = args.pods, args.xml_days
+    if args.scale:
+        pods = max(1, int(round(args.scale)))
+        xml_days = int(round(BASE_XML_DAYS * args.scale))
+
+    print(f"Generating synthetic data in {args.output} (seed {args.seed})...")
+    counts = generate(args.output, args.start_year, args.years, pods, xml_days, args.seed, args.workers,
+                      args.archives)
+    print(f"  - {counts['days']:,} days from {args.start_year}")
+    print(f"  - PUN: {counts['hourly_rows']:,} hourly rows, {counts['quarter_hour_rows']:,} quarter-hour rows")
+    print(f"  - {counts['xml_files']:,} MGPPrezzi XML files")
+    print(f"  - {counts['pods']:,} POD files x {counts['meter_rows_per_pod']:,} rows")
+    print("  - GAS-MGP, PSV_DA, PSV_MA")
+    if counts['archive_years']:
+        print(f"  - Anno archives: {', '.join(map(str, counts['archive_years']))}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,4 @@
-import React, { useState, useEffect, useCallback } from 'react';
+import React, { useState, useEffect, useCallback, useRef } from 'react';
 import { BarChart, Bar, XAxis, YAxis, CartesianGrid, Tooltip, Legend, ResponsiveContainer, Cell } from 'recharts';
 import { Calendar, TrendingUp, TrendingDown, Zap, Clock, Euro, Info, Upload, FileText } from 'lucide-react';
 
@@ -36,6 +36,48 @@ interface CalendarData {
   monthYear: string;
 }
 
+// Artefatti statici pubblicati da src/py/static_shards.py
+const SHARD_BASE_URL = '/data/pun';
+const SHARD_MONTHS = 3; // Mesi caricati all'avvio
+const FASCIA_CODES = ['', 'F1', 'F2', 'F3'];
+
+interface ShardEntry {
+  month: string;
+  file: string;
+  first_date: string;
+  days: number;
+  intervals: number[];
+}
+
+interface ShardIndex {
+  resolution_minutes: number;
+  stride: number;
+  months: ShardEntry[];
+}
+
+// Shard mensile: float32 PUN [giorni x stride] seguito da uint8 fasce [giorni x stride]
+const decodeShard = (buffer: ArrayBuffer, entry: ShardEntry, stride: number): DataRow[] => {
+    const cells = entry.days * stride;
+    const prices = new Float32Array(buffer, 0, cells);
+    const codes = new Uint8Array(buffer, cells * 4, cells);
+    const firstDay = Date.UTC(
+        parseInt(entry.first_date.substring(0, 4)),
+        parseInt(entry.first_date.substring(4, 6)) - 1,
+        parseInt(entry.first_date.substring(6, 8))
+    );
+
+    const rows: DataRow[] = [];
+    for (let day = 0; day < entry.days; day++) {
+        const data = new Date(firstDay + day * 86400000).toISOString().substring(0, 10).replace(/-/g, '');
+        for (let slot = 0; slot < entry.intervals[day]; slot++) {
+            const pun = prices[day * stride + slot];
+            if (isNaN(pun)) continue;
+            rows.push({ data, ora: slot + 1, pun, fascia: FASCIA_CODES[codes[day * stride + slot]] });
+        }
+    }
+    return rows;
+};
+
 const PunChart = () => {
     const [selectedDate, setSelectedDate] = useState('20250917');
     const [csvData, setCsvData] = useState<DataRow[] | null>(null);
@@ -118,6 +160,38 @@ const PunChart = () => {
         {data: "20250320", ora: 24, pun: 98.85}
     ];
     const rawData = csvData || defaultRawData;
+    const csvUploaded = useRef(false);
+
+    // Caricamento degli ultimi mesi dagli artefatti statici, se pubblicati
+    useEffect(() => {
+        let cancelled = false;
+        const loadShards = async () => {
+            try {
+                const response = await fetch(`${SHARD_BASE_URL}/index.json`);
+                if (!response.ok) return;
+                const index: ShardIndex = await response.json();
+                if (index.resolution_minutes !== 60) return;
+
+                const entries = index.months.slice(-SHARD_MONTHS);
+                const buffers = await Promise.all(entries.map(async entry => {
+                    const shard = await fetch(`${SHARD_BASE_URL}/${entry.file}`);
+                    if (!shard.ok) throw new Error(`Shard ${entry.file} non disponibile`);
+                    return shard.arrayBuffer();
+                }));
+                const rows = entries.flatMap((entry, i) => decodeShard(buffers[i], entry, index.stride));
+
+                // Un CSV caricato dall'utente ha la precedenza
+                if (!cancelled && !csvUploaded.current && rows.length > 0) {
+                    setCsvData(rows);
+                    setSelectedDate(rows[rows.length - 1].data);
+                }
+            } catch {
+                // Artefatti assenti o incompleti: restano i dati di default
+            }
+        };
+        loadShards();
+        return () => { cancelled = true; };
+    }, []);
 
     // Upload CSV
     const handleFileUpload = async (event: React.ChangeEvent<HTMLInputElement>) => {
@@ -171,6 +245,7 @@ const PunChart = () => {
                 });
             }
 
+            csvUploaded.current = true;
             setCsvData(parsedData);
             setSelectedDate(parsedData[0].data);
 
@@ -188,12 +263,18 @@ const PunChart = () => {
         let fasciaName = 'F3 - Fuori Punta';
         let fasciaBarColor = '#10B981';
 
-        if (row.ora >= 8 && row.ora <= 19) {
+        // Le fasce degli shard statici tengono conto di weekend e festivi
+        const fasciaCode = row.fascia || (
+            row.ora >= 8 && row.ora <= 19 ? 'F1' :
+            (row.ora >= 7 && row.ora < 8) || (row.ora >= 20 && row.ora <= 23) ? 'F2' : 'F3'
+        );
+
+        if (fasciaCode === 'F1') {
             fascia = 'F1';
             fasciaColor = '#EF4444';
             fasciaName = 'F1 - Punta';
             fasciaBarColor = '#EF4444';
-        } else if ((row.ora >= 7 && row.ora < 8) || (row.ora >= 20 && row.ora <= 23)) {
+        } else if (fasciaCode === 'F2') {
             fascia = 'F2';
             fasciaColor = '#F59E0B';
             fasciaName = 'F2 - Intermedia';
@@ -0,0 +1,389 @@
+"""
+Parallel backfill of the MGP price history from the GME yearly archives.
+
+GME publishes one Anno{year}.zip per year holding an Excel workbook whose
+'Prezzi-Prices' sheet has every hour (or quarter-hour) of the year: the date,
+the interval, the PUN and one column per zone. Rebuilding years of history
+from those archives takes one request per year instead of one per day.
+
+Each year is an independent job of a process pool: fetch the archive (through
+the on-disk HTTP cache, or from a local folder of archives), read the sheet
+with the calamine engine when python-calamine is installed, and write the
+whole year as one partition:
+
+    db/MGP-Prezzi/Year=YYYY/part-0.parquet
+
+The partition records the sha1 of the archive it came from, so a rerun skips
+the years whose archive did not change (closed years never do).
+
+The partitions are then reconciled against the daily XML files already in
+sources/GME/EE: intervals present in both are compared (the archive wins and
+differences are reported), intervals only in the XML are added to their
+year's partition. With --write-csv the PUN columns are written back to
+db/PUN-MGP.csv (and PUN-MGP-15.csv for quarter-hour years) for
+convert_to_parquet.
+
+src/generate_synthetic_data.py --archives writes synthetic Anno{year}.zip
+files (every year but the last, which stays XML-only) to exercise the whole
+path offline with --source-dir.
+"""
+import argparse
+import hashlib
+import io
+import os
+import sys
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import requests
+
+from download_and_read_excel import infer_resolution_minutes
+from gme_fetcher import GME_DATASETS, parse_gme_xml
+from http_cache import OFFLINE_ENV, OfflineError, cached_get
+from instrumentation import span
+from interval_store import RESOLUTION_KEY
+
+REPO_PATH = Path(__file__).resolve().parents[2]
+DEFAULT_DB_PATH = REPO_PATH / 'db'
+DEFAULT_XML_PATH = REPO_PATH / 'sources' / 'GME' / 'EE'
+HISTORY_DIRNAME = 'MGP-Prezzi'
+
+ANNUAL_ZIP_URL = ('https://www.mercatoelettrico.org/it-it/Home/Esiti/Elettricita/MGP/Statistiche/DatiStorici/'
+                  'moduleId/10874/controller/GmeDatiStoriciItem/action/DownloadFile?fileName=Anno{year}.zip')
+PRICES_SHEET = 'Prezzi-Prices'
+FIRST_YEAR = 2004  # First year of the Italian power exchange
+
+DEFAULT_WORKERS = min(4, os.cpu_count() or 1)
+DOWNLOAD_TIMEOUT = 120
+RECONCILE_TOLERANCE = 1e-3  # EUR/MWh
+
+# Parquet schema metadata of a partition
+ARCHIVE_KEY = b'oneenergy.archive_sha1'
+XML_ROWS_KEY = b'oneenergy.xml_rows'
+
+
+def excel_engine():
+    """'calamine' when python-calamine is installed, else None (pandas' default)"""
+    try:
+        import python_calamine  # noqa: F401
+    except ImportError:
+        return None
+    return 'calamine'
+
+
+def partition_path(db_path, year):
+    return Path(db_path) / HISTORY_DIRNAME / f'Year={year}' / 'part-0.parquet'
+
+
+def history_years(db_path=DEFAULT_DB_PATH):
+    """Years that have a partition"""
+    folder = Path(db_path) / HISTORY_DIRNAME
+    return sorted(int(p.parent.name.split('=')[1]) for p in folder.glob('Year=*/part-0.parquet'))
+
+
+def _metadata(path):
+    try:
+        return pq.read_schema(path).metadata or {}
+    except (OSError, pa.ArrowInvalid):
+        return {}
+
+
+def fetch_archive(year, source_dir=None):
+    """
+    Bytes of Anno{year}.zip
+
+    Args:
+        year: Year of the archive
+        source_dir: Folder holding the archives (instead of downloading them)
+
+    Returns:
+        bytes or None: None when the archive does not exist (yet)
+    """
+    if source_dir is not None:
+        path = Path(source_dir) / f'Anno{year}.zip'
+        return path.read_bytes() if path.exists() else None
+    try:
+        response = cached_get(ANNUAL_ZIP_URL.format(year=year), timeout=DOWNLOAD_TIMEOUT)
+    except OfflineError:
+        return None
+    if response.status_code == 404:
+        return None
+    response.raise_for_status()
+    return response.content
+
+
+def read_archive(content):
+    """
+    Prices of an Anno{year}.zip archive
+
+    Returns:
+        DataFrame: Date (datetime64), Hour or Interval, PUN and one float64
+        column per zone, sorted by date and interval
+    """
+    with zipfile.ZipFile(io.BytesIO(content)) as z:
+        excel_files = [f for f in z.namelist() if f.lower().endswith(('.xls', '.xlsx'))]
+        if not excel_files:
+            raise ValueError("No Excel file in the archive")
+        workbook = z.read(excel_files[0])
+
+    df = pd.read_excel(io.BytesIO(workbook), sheet_name=PRICES_SHEET, engine=excel_engine())
+    df = df.dropna(subset=[df.columns[0], df.columns[1]])
+
+    # Headers are like 'Data/Date (YYYYMMDD)', 'Ora/Hour', 'PUN', 'NORD', ...
+    dates, intervals = df.iloc[:, 0], df.iloc[:, 1].astype('int16')
+    if not pd.api.types.is_datetime64_any_dtype(dates):
+        dates = pd.to_datetime(dates.astype('int64').astype(str), format='%Y%m%d')
+    minutes = infer_resolution_minutes(intervals.to_numpy())
+    interval_col = 'Hour' if minutes == 60 else 'Interval'
+
+    prices = {}
+    for column in df.columns[2:]:
+        name = str(column).split()[0].upper() if str(column).strip() else None
+        values = pd.to_numeric(df[column], errors='coerce')
+        if name and name not in prices and values.notna().any():
+            prices[name] = values.astype('float64').to_numpy()
+    if 'PUN' not in prices:
+        raise ValueError(f"No PUN column in sheet {PRICES_SHEET}")
+
+    result = pd.DataFrame({'Date': dates.to_numpy(), interval_col: intervals.to_numpy(), **prices})
+    return result.sort_values(['Date', interval_col], ignore_index=True)
+
+
+def write_partition(df, path, archive_sha1='', xml_rows=0):
+    """Write one year atomically, with its resolution and provenance in the schema"""
+    interval_col = 'Hour' if 'Hour' in df.columns else 'Interval'
+    minutes = 60 if interval_col == 'Hour' else 15
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    table = table.replace_schema_metadata({
+        **(table.schema.metadata or {}),
+        RESOLUTION_KEY: str(minutes).encode(),
+        ARCHIVE_KEY: archive_sha1.encode(),
+        XML_ROWS_KEY: str(xml_rows).encode(),
+    })
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f'{path.name}.{os.getpid()}.tmp')
+    pq.write_table(table, tmp, compression='snappy')
+    os.replace(tmp, path)
+
+
+def backfill_year(year, db_path=DEFAULT_DB_PATH, source_dir=None, force=False):
+    """
+    Fetch, parse and store one year (runs in a worker process)
+
+    Returns:
+        dict: year, status ('written', 'unchanged' or 'missing'), rows, seconds
+    """
+    start = datetime.now()
+    path = partition_path(db_path, year)
+    with span('backfill.fetch') as s:
+        content = fetch_archive(year, source_dir)
+        s.add(bytes=len(content or b''))
+    if content is None:
+        return {'year': year, 'status': 'missing', 'rows': 0, 'seconds': 0.0}
+
+    sha1 = hashlib.sha1(content).hexdigest()
+    if not force and _metadata(path).get(ARCHIVE_KEY) == sha1.encode():
+        status, rows = 'unchanged', pq.read_metadata(path).num_rows
+    else:
+        with span('backfill.parse') as s:
+            df = read_archive(content)
+            s.add(rows=len(df))
+        write_partition(df, path, sha1)
+        status, rows = 'written', len(df)
+    return {'year': year, 'status': status, 'rows': rows,
+            'seconds': (datetime.now() - start).total_seconds()}
+
+
+def read_xml_prices(xml_file):
+    """Prices of one daily MGPPrezzi XML file, keyed like the partitions"""
+    records = parse_gme_xml(xml_file, GME_DATASETS['MGP-Prezzi']['record'], columns=None)
+    if not records:
+        return None
+    df = pd.DataFrame(records)
+    minutes = infer_resolution_minutes(df['Ora'].to_numpy())
+    df = df.rename(columns={'Data': 'Date', 'Ora': 'Hour' if minutes == 60 else 'Interval'})
+    df['Date'] = pd.to_datetime(df['Date'], format='%Y%m%d')
+    return df
+
+
+def reconcile(db_path=DEFAULT_DB_PATH, xml_path=DEFAULT_XML_PATH, executor=None, tolerance=RECONCILE_TOLERANCE):
+    """
+    Compare the partitions with the daily XML files and add what only the XML has
+
+    Args:
+        db_path: Database folder
+        xml_path: Folder of the daily MGPPrezzi XML files
+        executor: Optional executor to parse the XML files with
+        tolerance: PUN difference (EUR/MWh) counted as a mismatch
+
+    Returns:
+        DataFrame: One row per year with XmlRows, Compared, Mismatches,
+        MaxAbsDiff and Added
+    """
+    suffix = GME_DATASETS['MGP-Prezzi']['suffix']
+    files = sorted(Path(xml_path).glob(f'*{suffix}'))
+    with span('backfill.read_xml') as s:
+        frames = (executor.map(read_xml_prices, files, chunksize=32) if executor
+                  else map(read_xml_prices, files))
+        frames = [f for f in frames if f is not None]
+        s.add(files=len(files))
+
+    summary = []
+    for interval_col in ('Hour', 'Interval'):
+        parts = [f for f in frames if interval_col in f.columns]
+        if not parts:
+            continue
+        xml = pd.concat(parts, ignore_index=True).drop_duplicates(['Date', interval_col], keep='last')
+        keys = ['Date', interval_col]
+
+        for year, xml_year in xml.groupby(xml['Date'].dt.year):
+            path = partition_path(db_path, year)
+            meta = _metadata(path)
+            if meta and meta.get(RESOLUTION_KEY) != (b'60' if interval_col == 'Hour' else b'15'):
+                continue  # The archive of that year is at the other resolution
+            if meta:
+                archive = pq.read_table(path).to_pandas()
+                merged = xml_year.merge(archive[keys + ['PUN']], on=keys, how='left',
+                                        suffixes=('', '_archive'), indicator=True)
+                both = (merged['_merge'] == 'both').to_numpy()
+                diff = np.abs(merged['PUN'].to_numpy()[both] - merged['PUN_archive'].to_numpy()[both])
+            else:
+                # No archive for that year (yet): the partition starts from the XML
+                archive = xml_year.iloc[:0]
+                both, diff = np.zeros(len(xml_year), dtype=bool), np.empty(0)
+            added = xml_year[~both]
+
+            if len(added):
+                combined = pd.concat([archive, added.reindex(columns=archive.columns)], ignore_index=True)
+                combined = combined.sort_values(keys, ignore_index=True)
+                combined[interval_col] = combined[interval_col].astype('int16')
+                xml_rows = int(meta.get(XML_ROWS_KEY, b'0')) + len(added)
+                write_partition(combined, path, meta.get(ARCHIVE_KEY, b'').decode(), xml_rows)
+
+            summary.append({
+                'Year': int(year),
+                'XmlRows': len(xml_year),
+                'Compared': int(both.sum()),
+                'Mismatches': int((diff > tolerance).sum()),
+                'MaxAbsDiff': float(diff.max()) if len(diff) else 0.0,
+                'Added': len(added),
+            })
+
+    return pd.DataFrame(summary, columns=['Year', 'XmlRows', 'Compared', 'Mismatches', 'MaxAbsDiff', 'Added'])
+
+
+def write_history_csv(db_path=DEFAULT_DB_PATH):
+    """
+    Write the PUN of the partitions to PUN-MGP.csv / PUN-MGP-15.csv
+
+    Days the partitions cover replace the CSV rows; other CSV days are kept.
+
+    Returns:
+        dict: {csv filename: rows written}
+    """
+    db_path = Path(db_path)
+    written = {}
+    for interval_col, filename in (('Hour', 'PUN-MGP.csv'), ('Interval', 'PUN-MGP-15.csv')):
+        frames = []
+        for year in history_years(db_path):
+            path = partition_path(db_path, year)
+            if interval_col in pq.read_schema(path).names:
+                frames.append(pq.read_table(path, columns=['Date', interval_col, 'PUN']).to_pandas())
+        if not frames:
+            continue
+        history = pd.concat(frames, ignore_index=True)
+        history['Date'] = history['Date'].dt.strftime('%Y%m%d').astype('int64')
+
+        csv_path = db_path / filename
+        if csv_path.exists():
+            existing = pd.read_csv(csv_path, sep=';', encoding='utf-8-sig')
+            kept = existing[~existing['Date'].isin(history['Date'].unique())]
+            history = pd.concat([kept, history], ignore_index=True)
+        history = history.sort_values(['Date', interval_col], ignore_index=True)
+
+        tmp = csv_path.with_name(f'{csv_path.name}.{os.getpid()}.tmp')
+        history.to_csv(tmp, sep=';', index=False, encoding='utf-8-sig')
+        os.replace(tmp, csv_path)
+        written[filename] = len(history)
+    return written
+
+
+def backfill(years, db_path=DEFAULT_DB_PATH, xml_path=DEFAULT_XML_PATH, source_dir=None,
+             workers=DEFAULT_WORKERS, force=False, reconcile_xml=True):
+    """
+    Rebuild the partitions of several years in parallel, then reconcile them
+
+    Returns:
+        tuple: (list of backfill_year results, reconcile DataFrame or None)
+    """
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(backfill_year, year, db_path, source_dir, force) for year in years]
+        results = []
+        for future in futures:
+            result = future.result()
+            results.append(result)
+            print(f"  {result['year']}: {result['status']}, {result['rows']:,} rows ({result['seconds']:.1f}s)")
+
+        report = reconcile(db_path, xml_path, executor) if reconcile_xml else None
+    return results, report
+
+
+def main(argv=None):
+    current_year = datetime.now().year
+    parser = argparse.ArgumentParser(description='Backfill the MGP price history from the GME yearly archives')
+    parser.add_argument('--from', dest='first', type=int, default=current_year - 1, help='First year')
+    parser.add_argument('--to', dest='last', type=int, default=current_year, help='Last year')
+    parser.add_argument('--years', type=int, nargs='+', help='Explicit list of years (instead of --from/--to)')
+    parser.add_argument('--db', type=Path, default=DEFAULT_DB_PATH, help='Database folder')
+    parser.add_argument('--xml', type=Path, default=DEFAULT_XML_PATH, help='Daily GME XML folder to reconcile with')
+    parser.add_argument('--source-dir', type=Path, help='Read Anno{year}.zip from this folder instead of downloading')
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS, help='Parallel years')
+    parser.add_argument('--force', action='store_true', help='Rewrite partitions whose archive did not change')
+    parser.add_argument('--offline', action='store_true', help='Only use archives already in the HTTP cache')
+    parser.add_argument('--no-reconcile', action='store_true', help='Skip the comparison with the daily XML')
+    parser.add_argument('--write-csv', action='store_true', help='Write the PUN history back to db/PUN-MGP.csv')
+    args = parser.parse_args(argv)
+
+    years = args.years or list(range(max(args.first, FIRST_YEAR), args.last + 1))
+    if args.offline:
+        os.environ[OFFLINE_ENV] = '1'  # Inherited by the worker processes
+    if excel_engine() is None:
+        print("python-calamine not installed: reading the workbooks with the default (slower) Excel engine")
+
+    print(f"Backfilling {len(years)} year(s) with {args.workers} worker(s)...")
+    start = datetime.now()
+    try:
+        results, report = backfill(years, args.db, args.xml, args.source_dir, args.workers, args.force,
+                                   not args.no_reconcile)
+    except (requests.RequestException, ValueError, zipfile.BadZipFile) as e:
+        print(f"Error: {e}")
+        return 1
+
+    if report is not None and len(report):
+        print("\nReconciliation with the daily XML:")
+        print(report.to_string(index=False))
+        if report['Mismatches'].sum():
+            print(f"Warning: {report['Mismatches'].sum()} interval(s) differ by more than "
+                  f"{RECONCILE_TOLERANCE} EUR/MWh (the archive values are kept)")
+    if args.write_csv:
+        for filename, rows in write_history_csv(args.db).items():
+            print(f"Wrote {rows:,} rows to {filename}")
+        print("Run src/convert_to_parquet.py to refresh the Parquet files")
+
+    written = sum(r['status'] == 'written' for r in results)
+    missing = [r['year'] for r in results if r['status'] == 'missing']
+    print(f"\n{written} year(s) written, {len(results) - written - len(missing)} unchanged "
+          f"in {(datetime.now() - start).total_seconds():.1f}s")
+    if missing:
+        print(f"No archive for: {', '.join(map(str, missing))}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
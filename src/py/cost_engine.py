@@ -0,0 +1,229 @@
+"""
+Energy cost engine: 15-minute meter readings priced at the PUN.
+
+Meter rows and prices are both mapped to integer UTC interval numbers, so the
+join is a single PriceSeries lookup (price index = utc minutes // price
+resolution) instead of a DataFrame merge. Meter files are streamed in chunks and every
+aggregate is a plain sum, so partial results from any number of PODs and
+chunks combine with one final groupby.
+"""
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+
+from download_and_read_excel import (
+    FASCIA_LABELS, yyyymmdd_to_day_number, midnight_utc_offset_hours,
+    rome_utc_offset_hours, get_fascia_codes
+)
+from price_series import load_price_series
+
+DEFAULT_DB_PATH = Path(__file__).resolve().parents[2] / 'db'
+DEFAULT_CHUNK_ROWS = 500_000
+
+METER_COLUMNS = ['POD', 'DATA', 'ORA', 'FL_ORA_LEGALE', 'CONSUMO_ATTIVA_PRELEVATA']
+ENERGY_COLUMN = 'CONSUMO_ATTIVA_PRELEVATA'
+
+# resolution (minutes) -> price dataset in db/
+PRICE_DATASETS = {60: 'PUN-MGP', 15: 'PUN-MGP-15'}
+
+# level -> grouping keys of the aggregated output
+AGGREGATION_LEVELS = {
+    'interval': ['POD', 'UtcMinute'],
+    'day': ['POD', 'Date'],
+    'month': ['POD', 'Month'],
+    'fascia': ['POD', 'Month', 'Fascia'],
+}
+SUM_COLUMNS = ['kWh', 'CostEUR', 'Intervals', 'MissingPrice']
+
+
+def load_prices(db_path=DEFAULT_DB_PATH, price_col='PUN', minutes=60):
+    """
+    Load a price column of the store as a PriceSeries indexed by UTC interval
+
+    Args:
+        db_path: Folder with the price store (see PRICE_DATASETS)
+        price_col: Price column to load
+        minutes: Resolution of the series (60 for Hour 1-25, 15 for Interval 1-100)
+
+    Returns:
+        PriceSeries
+    """
+    return load_price_series(db_path, PRICE_DATASETS[minutes], price_col)
+
+
+def meter_utc_minutes(dates, times, legal_flags):
+    """
+    UTC minute of each meter reading, and whether the reading is real
+
+    Meter exports repeat DST days with both FL_ORA_LEGALE flags (1 = solar
+    time UTC+1, 2 = legal time UTC+2); only rows whose flag matches the
+    Europe/Rome offset at that instant are real readings.
+
+    Args:
+        dates: DATA column (YYYYMMDD)
+        times: ORA column (HHMMSS)
+        legal_flags: FL_ORA_LEGALE column
+
+    Returns:
+        tuple: (int64 UTC minutes, bool validity mask, int64 local day numbers)
+    """
+    days = yyyymmdd_to_day_number(dates)
+    times = np.asarray(times, dtype='int64')
+    offsets = np.where(np.asarray(legal_flags) == 2, 2, 1)
+
+    utc_minutes = days * 1440 + (times // 10000) * 60 + (times // 100) % 100 - offsets * 60
+    valid = rome_utc_offset_hours(utc_minutes * 60) == offsets
+    return utc_minutes, valid, days
+
+
+def interval_fascia_codes(utc_minutes, days):
+    """Fascia code of each reading from its UTC minute and local day"""
+    # GME hour of the day (1-25) from the UTC minute and the day's midnight
+    hours = (utc_minutes - (days * 1440 - midnight_utc_offset_hours(days) * 60)) // 60 + 1
+    return get_fascia_codes(days, hours)
+
+
+def price_intervals(chunk, prices):
+    """
+    Price every reading of a meter chunk
+
+    Args:
+        chunk: DataFrame with METER_COLUMNS
+        prices: PriceSeries returned by load_prices
+
+    Returns:
+        pd.DataFrame: One row per real reading with POD, UtcMinute, Date,
+        Month, Fascia, kWh, PUN and CostEUR
+    """
+    utc_minutes, valid, days = meter_utc_minutes(
+        chunk['DATA'].to_numpy(), chunk['ORA'].to_numpy(), chunk['FL_ORA_LEGALE'].to_numpy()
+    )
+    utc_minutes, days = utc_minutes[valid], days[valid]
+    energy = pd.to_numeric(chunk[ENERGY_COLUMN], errors='coerce').to_numpy(dtype='float64')[valid]
+
+    price = prices.lookup(utc_minutes)
+    dates = days.astype('datetime64[D]')
+
+    return pd.DataFrame({
+        'POD': chunk['POD'].to_numpy()[valid],
+        'UtcMinute': utc_minutes,
+        'Date': dates,
+        'Month': dates.astype('datetime64[M]'),
+        'Fascia': FASCIA_LABELS[interval_fascia_codes(utc_minutes, days)],
+        'kWh': energy,
+        'PUN': price,
+        'CostEUR': energy * price / 1000,
+    })
+
+
+def aggregate_costs(intervals, level='month'):
+    """
+    Sum priced intervals at one of AGGREGATION_LEVELS
+
+    Returns:
+        pd.DataFrame: kWh, CostEUR, Intervals, MissingPrice and the
+        energy-weighted AvgPrice (EUR/MWh) per group
+    """
+    keys = AGGREGATION_LEVELS[level]
+    frame = intervals.assign(
+        Intervals=1,
+        MissingPrice=intervals['PUN'].isna().astype('int64'),
+    )
+    result = frame.groupby(keys, sort=True, observed=True)[SUM_COLUMNS].sum().reset_index()
+    return _with_avg_price(result)
+
+
+def _with_avg_price(result):
+    """Add the energy-weighted average price in EUR/MWh"""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        result['AvgPrice'] = result['CostEUR'] * 1000 / result['kWh']
+    return result
+
+
+def iter_meter_chunks(path, chunk_rows=DEFAULT_CHUNK_ROWS, columns=METER_COLUMNS):
+    """
+    Stream a meter file (CSV in the IT012E00801406 layout or Parquet) in chunks
+
+    Yields:
+        pd.DataFrame: Up to chunk_rows readings with the requested columns
+    """
+    path = Path(path)
+    if path.suffix == '.parquet' or path.is_dir():
+        if path.is_dir():
+            files = sorted(path.rglob('*.parquet'))
+        else:
+            files = [path]
+        for file in files:
+            for batch in pq.ParquetFile(file).iter_batches(batch_size=chunk_rows, columns=columns):
+                yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(
+            path, sep=';', usecols=columns, chunksize=chunk_rows,
+            dtype={'POD': 'str', 'DATA': 'int64', 'ORA': 'int64', 'FL_ORA_LEGALE': 'int8'}
+        )
+
+
+def run_cost_engine(meter_paths, db_path=DEFAULT_DB_PATH, levels=('day', 'month', 'fascia'),
+                    chunk_rows=DEFAULT_CHUNK_ROWS, prices=None):
+    """
+    Compute energy costs for every POD in the given meter files
+
+    Args:
+        meter_paths: Meter CSV/Parquet files or partitioned folders
+        db_path: Folder with the PUN-MGP price store
+        levels: Aggregation levels to return
+        chunk_rows: Readings processed at a time
+        prices: Optional pre-loaded PriceSeries (see load_prices)
+
+    Returns:
+        dict: {level: aggregated DataFrame}
+    """
+    if prices is None:
+        prices = load_prices(db_path)
+    if isinstance(meter_paths, (str, Path)):
+        meter_paths = [meter_paths]
+
+    partials = {level: [] for level in levels}
+    for path in meter_paths:
+        for chunk in iter_meter_chunks(path, chunk_rows):
+            intervals = price_intervals(chunk, prices)
+            for level in levels:
+                partials[level].append(aggregate_costs(intervals, level))
+
+    results = {}
+    for level, frames in partials.items():
+        keys = AGGREGATION_LEVELS[level]
+        if not frames:
+            results[level] = pd.DataFrame(columns=keys + SUM_COLUMNS + ['AvgPrice'])
+            continue
+        combined = pd.concat(frames, ignore_index=True)
+        combined = combined.groupby(keys, sort=True, observed=True)[SUM_COLUMNS].sum().reset_index()
+        results[level] = _with_avg_price(combined)
+    return results
+
+
+def main():
+    """Price the POD file(s) in db/ (or the paths given on the command line)."""
+    meter_paths = sys.argv[1:] or [DEFAULT_DB_PATH / 'IT012E00801406.csv']
+
+    print("=== Energy Cost Engine ===")
+    results = run_cost_engine(meter_paths)
+
+    monthly = results['month']
+    print(f"\nMonthly costs ({monthly['POD'].nunique()} POD):")
+    print(monthly.to_string(index=False, float_format=lambda v: f"{v:,.2f}"))
+
+    by_fascia = results['fascia'].groupby(['POD', 'Fascia'])[['kWh', 'CostEUR']].sum().reset_index()
+    print("\nTotals by fascia:")
+    print(_with_avg_price(by_fascia).to_string(index=False, float_format=lambda v: f"{v:,.2f}"))
+
+    missing = int(monthly['MissingPrice'].sum())
+    if missing:
+        print(f"\nWarning: {missing:,} intervals without a price")
+
+
+if __name__ == "__main__":
+    main()
@@ -10,6 +10,12 @@ import sys
 import os
 sys.path.append(os.path.dirname(__file__))
 
+from downsample import build_minmax_rollup, downsample, uses_rollup, DEFAULT_CHART_WIDTH_PX
+from filter_index import FilterIndex
+from export import EXPORT_FORMATS, export_frame
+from http_cache import IMMUTABLE, ttl_for
+from interval_store import DEFAULT_DB_PATH, load_interval_store, source_signature
+
 st.set_page_config(
     page_title="Dashboard PUN - GME",
     page_icon="⚡",
@@ -20,21 +26,42 @@ st.set_page_config(
 st.title("⚡ Dashboard PUN - Mercato Elettrico GME")
 st.markdown("---")
 
-@st.cache_data
-def load_pun_data(year):
-    """Load PUN data for the specified year"""
-    # Import here to avoid circular imports
-    from download_and_read_excel import (
-        get_dst_dates, create_datetime_with_dst, 
-        get_italian_holidays, get_fascia
-    )
-    import requests
+ANNUAL_ZIP_URL = "https://www.mercatoelettrico.org/it-it/Home/Esiti/Elettricita/MGP/Statistiche/DatiStorici/moduleId/10874/controller/GmeDatiStoriciItem/action/DownloadFile?fileName=Anno{year}.zip"
+
+STORE_DATASET = 'PUN-MGP'  # Hourly store in db/, kept current by days.py (also in watch mode)
+
+def data_version(year):
+    """
+    Cache key of a year's data
+
+    Years GME still updates are read from db/PUN-MGP and keyed on the store
+    file's signature, so a new ingestion reaches the dashboard on the next
+    rerun. Closed years (and a missing store) use the yearly archive, key 0.
+    """
+    if ttl_for(ANNUAL_ZIP_URL.format(year=year)) is IMMUTABLE:
+        return 0
+    try:
+        return source_signature(DEFAULT_DB_PATH, STORE_DATASET)
+    except FileNotFoundError:
+        return 0
+
+def read_store_year(year):
+    """Date / Hour / PUN rows of one year from db/PUN-MGP (priced hours only)"""
+    store = load_interval_store(DEFAULT_DB_PATH, STORE_DATASET)
+    df = store.records(f'{year}-01-01', f'{year}-12-31').dropna(subset=['PUN'])
+    df = df.rename(columns={'Interval': 'Hour', 'PUN': 'PUN Index GME'})
+    df['Date'] = df['Date'].dt.date
+    return df.reset_index(drop=True)
+
+def read_archive_year(year):
+    """Date / Hour / PUN rows of one year from the GME yearly archive"""
+    from http_cache import cached_get
     import zipfile
     import io
     
-    url = f"https://www.mercatoelettrico.org/it-it/Home/Esiti/Elettricita/MGP/Statistiche/DatiStorici/moduleId/10874/controller/GmeDatiStoriciItem/action/DownloadFile?fileName=Anno{year}.zip"
+    url = ANNUAL_ZIP_URL.format(year=year)
     
-    response = requests.get(url)
+    response = cached_get(url)  # Closed years are served from the on-disk cache
     response.raise_for_status()
     
     with zipfile.ZipFile(io.BytesIO(response.content)) as z:
@@ -47,6 +74,20 @@ def load_pun_data(year):
     
     df.columns = ['Date', 'Hour', 'PUN Index GME']
     df['Date'] = pd.to_datetime(df['Date'], format='%Y%m%d').dt.date
+    return df
+
+@st.cache_data(max_entries=8)
+def load_pun_data(year, version=0):
+    """Load PUN data for the specified year (version: see data_version, non-zero reads db/)"""
+    # Import here to avoid circular imports
+    from download_and_read_excel import (
+        get_dst_dates, create_datetime_with_dst, 
+        get_italian_holidays, get_fascia
+    )
+    
+    df = read_store_year(year) if version else None
+    if df is None or df.empty:  # No store, or it does not reach this year yet
+        df = read_archive_year(year)
     
     march_dst, october_dst = get_dst_dates(year)
     df['DateTime'] = df.apply(lambda row: create_datetime_with_dst(row, march_dst, october_dst), axis=1)
@@ -62,17 +103,29 @@ def load_pun_data(year):
     
     return df[['DateTime', 'Date', 'Hour', 'Month', 'MonthName', 'Weekday', 'WeekdayNum', 'PUN Index GME', 'Fascia']]
 
+@st.cache_data(max_entries=8)
+def load_pun_rollup(year, version=0):
+    """Daily min/max rows per fascia, used to draw long ranges"""
+    return build_minmax_rollup(load_pun_data(year, version), 'PUN Index GME', ['Fascia'], period_col='Date')
+
+@st.cache_resource(max_entries=8)
+def load_filter_index(year, rollup=False, version=0):
+    """Bitmap filter index over the yearly data (or its rollup)"""
+    frame = load_pun_rollup(year, version) if rollup else load_pun_data(year, version)
+    return FilterIndex(frame, dimensions=['Month', 'WeekdayNum', 'Fascia'], date_col='Date')
+
 # Sidebar filters
 st.sidebar.header("🔧 Filtri")
 
 # Year selection
-available_years = [2024, 2023, 2022]  # Can be expanded
+available_years = list(range(datetime.now().year, 2021, -1))  # Can be expanded
 selected_year = st.sidebar.selectbox("Anno", available_years, index=0)
+data_key = data_version(selected_year)  # Changes (and reloads) when the store of the current year is rewritten
 
 # Load data
 try:
     with st.spinner(f'Caricamento dati {selected_year}...'):
-        df = load_pun_data(selected_year)
+        df = load_pun_data(selected_year, data_key)
     st.sidebar.success(f"✅ Dati {selected_year} caricati")
 except Exception as e:
     st.error(f"Errore nel caricamento dati: {e}")
@@ -123,19 +176,31 @@ date_range = st.sidebar.date_input(
     max_value=max_date
 )
 
+# Chart resolution
+chart_width = st.sidebar.number_input(
+    "Larghezza grafico (px)",
+    min_value=200,
+    max_value=4000,
+    value=DEFAULT_CHART_WIDTH_PX,
+    step=100
+)
+
 # Apply filters
-filtered_df = df[
-    (df['Month'].isin(selected_months)) &
-    (df['WeekdayNum'].isin(selected_weekdays)) &
-    (df['Fascia'].isin(selected_fasce))
-]
-
-if len(date_range) == 2:
-    start_date, end_date = date_range
-    filtered_df = filtered_df[
-        (filtered_df['Date'] >= start_date) & 
-        (filtered_df['Date'] <= end_date)
-    ]
+def apply_filters(frame, index):
+    """Apply the sidebar filters to the data (or to its rollup) through its bitmap index"""
+    start_date, end_date = date_range if len(date_range) == 2 else (None, None)
+    positions = index.select(
+        {
+            'Month': selected_months,
+            'WeekdayNum': selected_weekdays,
+            'Fascia': selected_fasce
+        },
+        start_date=start_date,
+        end_date=end_date
+    )
+    return frame.iloc[positions]
+
+filtered_df = apply_filters(df, load_filter_index(selected_year, version=data_key))
 
 st.sidebar.markdown("---")
 st.sidebar.markdown(f"📊 **Righe filtrate**: {len(filtered_df):,}")
@@ -192,8 +257,25 @@ st.markdown("---")
 # Time Series Plot
 st.header("📈 Andamento Temporale PUN")
 
+# Only filter the rollup on reruns that will actually draw from it
+chart_rollup = None
+if uses_rollup(filtered_df, 'Fascia', chart_width):
+    chart_rollup = apply_filters(
+        load_pun_rollup(selected_year, data_key),
+        load_filter_index(selected_year, True, data_key)
+    )
+
+chart_df = downsample(
+    filtered_df,
+    'DateTime',
+    'PUN Index GME',
+    group_col='Fascia',
+    width_px=chart_width,
+    rollup=chart_rollup
+)
+
 fig_ts = px.line(
-    filtered_df, 
+    chart_df, 
     x='DateTime', 
     y='PUN Index GME',
     color='Fascia',
@@ -210,6 +292,9 @@ fig_ts.update_layout(
 
 st.plotly_chart(fig_ts, use_container_width=True)
 
+if len(chart_df) < len(filtered_df):
+    st.caption(f"Visualizzati {len(chart_df):,} punti su {len(filtered_df):,} (minimi e massimi preservati)")
+
 # Two columns for additional charts
 col1, col2 = st.columns(2)
 
@@ -294,11 +379,27 @@ if len(filtered_df) > 1000:
     st.info(f"Mostrando le prime 1000 righe di {len(filtered_df):,} totali")
 
 # Export data option
-if st.button("📥 Scarica Dati Filtrati (CSV)"):
-    csv = filtered_df.to_csv(index=False)
-    st.download_button(
-        label="Clicca per scaricare",
-        data=csv,
-        file_name=f"pun_data_{selected_year}_filtered.csv",
-        mime="text/csv"
-    )
\ No newline at end of file
+st.subheader("📥 Esporta Dati Filtrati")
+
+col1, col2 = st.columns([1, 3])
+with col1:
+    export_format = st.selectbox("Formato", list(EXPORT_FORMATS), format_func=str.upper)
+with col2:
+    export_columns = st.multiselect(
+        "Colonne",
+        list(filtered_df.columns),
+        default=list(filtered_df.columns)
+    )
+
+if not export_columns:
+    st.caption("Seleziona almeno una colonna da esportare")
+if st.button(f"📥 Scarica Dati Filtrati ({export_format.upper()})", disabled=not export_columns):
+    mime, extension = EXPORT_FORMATS[export_format]
+    # Large exports are spooled to a temporary file, removed when it is closed
+    with export_frame(filtered_df, export_format, export_columns) as export_file:
+        st.download_button(
+            label="Clicca per scaricare",
+            data=export_file,
+            file_name=f"pun_data_{selected_year}_filtered.{extension}",
+            mime=mime
+        )
@@ -0,0 +1,373 @@
+"""
+Vectorized data-quality checks for the price, gas and meter datasets.
+
+Each dataset is scanned in a few whole-array passes (no per-row Python):
+
+    duplicate_keys        the same day and interval (or UTC reading) twice
+    missing_days          days without any row inside the dataset's range
+    missing_intervals     rows missing from partial days, against the DST
+                          calendar (23/24/25 hours, 92/96/100 quarter-hours)
+    extra_intervals       intervals that do not exist on their day
+    empty_values          rows without a value
+    out_of_range          values outside the plausible bounds of the dataset
+    non_actual_readings   meter rows whose TIPO_DATO is not 'E' (actual)
+
+The findings form a compact report (one row per dataset and check). A check
+fails when its count exceeds the threshold in DEFAULT_THRESHOLDS, which can be
+overridden per check ('out_of_range') or per dataset ('GAS-MGP:empty_values');
+None reports the finding without failing.
+
+The pipeline scripts run validate_database after every update; set
+ONEENERGY_QUALITY=warn to report without failing, or off to skip the checks.
+"""
+import argparse
+import os
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from cost_engine import iter_meter_chunks, meter_utc_minutes
+from download_and_read_excel import MAX_INTERVALS_PER_DAY, intervals_per_day, yyyymmdd_to_day_number
+from instrumentation import span
+from interval_store import DEFAULT_DB_PATH, read_interval_dataset
+
+QUALITY_ENV = 'ONEENERGY_QUALITY'
+QUALITY_MODES = ('fail', 'warn', 'off')
+
+CHECKS = ('duplicate_keys', 'missing_days', 'missing_intervals', 'extra_intervals',
+          'empty_values', 'out_of_range', 'non_actual_readings')
+
+# check -> largest count that still passes (None: report only)
+DEFAULT_THRESHOLDS = {
+    'duplicate_keys': 0,
+    'missing_days': 0,
+    'missing_intervals': 0,
+    'extra_intervals': 0,
+    'empty_values': None,
+    'out_of_range': 0,
+    'non_actual_readings': None,
+    # Gas day-ahead series have publication gaps; gas_series fills them explicitly
+    'GAS-MGP:missing_days': None,
+    'PSV_DA:missing_days': None,
+}
+
+# Plausible value bounds per dataset kind
+PRICE_BOUNDS = (-500.0, 4000.0)  # EUR/MWh, GME minimum and maximum clearing prices
+GAS_BOUNDS = (0.0, 1000.0)  # EUR/MWh
+PSV_BOUNDS = (0.0, 10.0)  # EUR/Smc
+ENERGY_BOUNDS = (0.0, 1e6)  # kWh per quarter-hour
+
+PRICE_DATASETS = ('PUN-MGP', 'PUN-MGP-15', 'PUN_CM', 'PUN_CM-15')
+MAX_EXAMPLES = 5
+METER_COLUMNS = ['POD', 'DATA', 'ORA', 'FL_ORA_LEGALE', 'CONSUMO_ATTIVA_PRELEVATA', 'TIPO_DATO']
+
+
+def _finding(findings, dataset, check, count, days=()):
+    """Append a finding with a few example dates, if count is not zero"""
+    count = int(count)
+    if count == 0:
+        return
+    examples = np.unique(np.asarray(days, dtype='int64'))[:MAX_EXAMPLES]
+    findings.append({
+        'Dataset': dataset,
+        'Check': check,
+        'Count': count,
+        'Examples': ','.join(np.datetime_as_string(examples.astype('datetime64[D]'))),
+    })
+
+
+def _calendar_counts(dataset, findings, days, keys, expected, first_day):
+    """
+    Duplicates, missing days and missing intervals of one keyed series
+
+    Args:
+        days: Day number of every row
+        keys: Integer key of every row, unique per real interval
+        expected: Intervals expected on each day from first_day on
+    """
+    order = np.argsort(keys, kind='stable')
+    sorted_keys, sorted_days = keys[order], days[order]
+    repeated = sorted_keys[1:] == sorted_keys[:-1]
+    _finding(findings, dataset, 'duplicate_keys', repeated.sum(), sorted_days[1:][repeated])
+
+    unique_days = sorted_days[np.r_[True, ~repeated]] if len(keys) else sorted_days
+    observed = np.bincount(unique_days - first_day, minlength=len(expected))[:len(expected)]
+    calendar = np.arange(first_day, first_day + len(expected))
+    absent = observed == 0
+    _finding(findings, dataset, 'missing_days', absent.sum(), calendar[absent])
+    partial = ~absent & (observed < expected)
+    _finding(findings, dataset, 'missing_intervals', (expected - observed)[partial].sum(), calendar[partial])
+
+
+def _value_checks(dataset, findings, days, values, bounds):
+    empty = np.isnan(values)
+    _finding(findings, dataset, 'empty_values', empty.sum(), days[empty])
+    with np.errstate(invalid='ignore'):
+        outside = ~empty & ((values < bounds[0]) | (values > bounds[1]))
+    _finding(findings, dataset, 'out_of_range', outside.sum(), days[outside])
+
+
+def check_interval_series(dataset, days, intervals, values, minutes, bounds=PRICE_BOUNDS):
+    """
+    Check a Date / interval / price series against the DST calendar
+
+    Args:
+        dataset: Name used in the report
+        days: Day numbers
+        intervals: 1-based hour or quarter-hour of the day
+        values: Prices
+        minutes: Resolution (60 or 15)
+        bounds: (min, max) plausible price
+
+    Returns:
+        list: Finding dicts
+    """
+    findings = []
+    days = np.asarray(days, dtype='int64')
+    if not len(days):
+        return findings
+    intervals = np.asarray(intervals, dtype='int64')
+    first_day = int(days.min())
+    expected = intervals_per_day(np.arange(first_day, days.max() + 1), minutes)
+
+    extra = (intervals < 1) | (intervals > expected[days - first_day])
+    _finding(findings, dataset, 'extra_intervals', extra.sum(), days[extra])
+
+    stride = MAX_INTERVALS_PER_DAY[minutes]
+    real = ~extra
+    keys = (days[real] - first_day) * stride + intervals[real] - 1
+    _calendar_counts(dataset, findings, days[real], keys, expected, first_day)
+    _value_checks(dataset, findings, days, np.asarray(values, dtype='float64'), bounds)
+    return findings
+
+
+def check_daily_series(dataset, days, values, bounds):
+    """Check a one-value-per-day series (GAS-MGP, PSV_DA)"""
+    findings = []
+    days = np.asarray(days, dtype='int64')
+    if not len(days):
+        return findings
+    first_day = int(days.min())
+    expected = np.ones(int(days.max()) - first_day + 1, dtype='int64')
+    _calendar_counts(dataset, findings, days, days - first_day, expected, first_day)
+    _value_checks(dataset, findings, days, np.asarray(values, dtype='float64'), bounds)
+    return findings
+
+
+def check_meter_file(dataset, path, chunk_rows=500_000):
+    """
+    Check a meter file: readings per day against the DST calendar, duplicate
+    readings, TIPO_DATO and consumption bounds
+
+    Readings are keyed by POD and UTC minute, so the repeated DST-day rows with
+    the other FL_ORA_LEGALE flag are not counted as duplicates.
+    """
+    findings = []
+    pods, utc_parts, day_parts = [], [], []
+    non_actual, empty_days, outside_days = [], [], []
+    empty_count = outside_count = off_grid = 0
+    off_grid_days = []
+
+    for chunk in iter_meter_chunks(path, chunk_rows, METER_COLUMNS):
+        utc_minutes, valid, days = meter_utc_minutes(
+            chunk['DATA'].to_numpy(), chunk['ORA'].to_numpy(), chunk['FL_ORA_LEGALE'].to_numpy()
+        )
+        flagged = (chunk['TIPO_DATO'].astype('str').str.strip() != 'E').to_numpy()
+        non_actual.append(days[flagged])
+
+        energy = pd.to_numeric(chunk['CONSUMO_ATTIVA_PRELEVATA'], errors='coerce').to_numpy(dtype='float64')[valid]
+        real_days = days[valid]
+        empty = np.isnan(energy)
+        outside = ~empty & ((energy < ENERGY_BOUNDS[0]) | (energy > ENERGY_BOUNDS[1]))
+        empty_count += int(empty.sum())
+        outside_count += int(outside.sum())
+        empty_days.append(real_days[empty])
+        outside_days.append(real_days[outside])
+
+        unaligned = utc_minutes[valid] % 15 != 0
+        off_grid += int(unaligned.sum())
+        off_grid_days.append(real_days[unaligned])
+
+        pods.append(chunk['POD'].to_numpy()[valid])
+        utc_parts.append(utc_minutes[valid])
+        day_parts.append(real_days)
+
+    if not pods:
+        return findings
+    non_actual = np.concatenate(non_actual)
+    _finding(findings, dataset, 'non_actual_readings', len(non_actual), non_actual)
+    _finding(findings, dataset, 'empty_values', empty_count, np.concatenate(empty_days))
+    _finding(findings, dataset, 'out_of_range', outside_count, np.concatenate(outside_days))
+    _finding(findings, dataset, 'extra_intervals', off_grid, np.concatenate(off_grid_days))
+
+    codes, labels = pd.factorize(np.concatenate(pods))
+    utc_minutes, days = np.concatenate(utc_parts), np.concatenate(day_parts)
+    for code, pod in enumerate(labels):
+        mine = codes == code
+        pod_days = days[mine]
+        first_day = int(pod_days.min())
+        expected = intervals_per_day(np.arange(first_day, pod_days.max() + 1), 15)
+        name = dataset if len(labels) == 1 else f'{dataset}:{pod}'
+        _calendar_counts(name, findings, pod_days, utc_minutes[mine] // 15, expected, first_day)
+    return findings
+
+
+def _daily_frame(path):
+    """(day numbers, values) of GAS-MGP (YYYYMMDD) or PSV_DA (dd/mm/yyyy) CSV"""
+    df = pd.read_csv(path, sep=';', encoding='utf-8-sig')
+    date_col, value_col = df.columns[0], df.columns[1]
+    if pd.api.types.is_integer_dtype(df[date_col]):
+        days = yyyymmdd_to_day_number(df[date_col].to_numpy())
+    else:
+        days = pd.to_datetime(df[date_col], format='%d/%m/%Y').to_numpy(dtype='datetime64[D]').astype('int64')
+    return days, pd.to_numeric(df[value_col], errors='coerce').to_numpy(dtype='float64')
+
+
+def _meter_files(db_path):
+    """Meter CSVs: IT*.csv in db/ and every file in db/pods/"""
+    files = sorted(db_path.glob('IT*.csv')) + sorted((db_path / 'pods').glob('*.csv'))
+    seen, unique = set(), []
+    for path in files:
+        if path.name not in seen:
+            seen.add(path.name)
+            unique.append(path)
+    return unique
+
+
+def validate_database(db_path=DEFAULT_DB_PATH, datasets=None, meters=True):
+    """
+    Run every check on the datasets found in a folder
+
+    Args:
+        db_path: Folder with the price, gas and meter files
+        datasets: Price datasets to check (default: those of PRICE_DATASETS present)
+        meters: Also check the meter files (True for every meter file of the
+            folder, or a list of meter file paths)
+
+    Returns:
+        pd.DataFrame: Findings with Dataset, Check, Count and Examples
+    """
+    db_path = Path(db_path)
+    findings = []
+
+    for dataset in PRICE_DATASETS if datasets is None else datasets:
+        if not any((db_path / f'{dataset}{suffix}').exists() for suffix in ('.parquet', '.csv')):
+            continue
+        with span('quality.prices', dataset=dataset) as s:
+            days, intervals, values, minutes = read_interval_dataset(db_path, dataset)
+            findings += check_interval_series(dataset, days, intervals, values, minutes)
+            s.add(rows=len(days))
+
+    for dataset, bounds in (('GAS-MGP', GAS_BOUNDS), ('PSV_DA', PSV_BOUNDS)):
+        if datasets is None and (db_path / f'{dataset}.csv').exists():
+            with span('quality.daily', dataset=dataset) as s:
+                days, values = _daily_frame(db_path / f'{dataset}.csv')
+                findings += check_daily_series(dataset, days, values, bounds)
+                s.add(rows=len(days))
+
+    if isinstance(meters, (list, tuple)):
+        meter_files = [Path(path) for path in meters]
+    else:
+        meter_files = _meter_files(db_path) if meters and datasets is None else []
+    for path in meter_files:
+        with span('quality.meter', dataset=path.stem):
+            findings += check_meter_file(path.stem, path)
+
+    return pd.DataFrame(findings, columns=['Dataset', 'Check', 'Count', 'Examples'])
+
+
+def parse_thresholds(items):
+    """CLI overrides like ['out_of_range=10', 'GAS-MGP:empty_values=none']"""
+    thresholds = {}
+    for item in items or ():
+        key, _, value = item.partition('=')
+        check = key.split(':')[-1]
+        if check not in CHECKS:
+            raise ValueError(f"Unknown check: {check}")
+        thresholds[key] = None if value.lower() == 'none' else int(value)
+    return thresholds
+
+
+def evaluate(report, thresholds=None):
+    """
+    Compare findings with their thresholds
+
+    Dataset-specific keys ('GAS-MGP:empty_values') take precedence over
+    check-wide ones; meter findings of one POD ('IT...:IT...') also match
+    the keys of their file.
+
+    Returns:
+        tuple: (report with Threshold and Status columns, True when nothing failed)
+    """
+    limits = dict(DEFAULT_THRESHOLDS, **(thresholds or {}))
+    report = report.copy()
+
+    def limit(dataset, check):
+        for key in (f'{dataset}:{check}', f"{dataset.split(':')[0]}:{check}"):
+            if key in limits:
+                return limits[key]
+        return limits.get(check)
+
+    limits_found = [limit(d, c) for d, c in zip(report['Dataset'], report['Check'])]
+    failed = [t is not None and n > t for n, t in zip(report['Count'], limits_found)]
+    report['Threshold'] = pd.Series(limits_found, index=report.index, dtype='object')
+    report['Status'] = pd.Series(np.where(failed, 'FAIL', 'warn'), index=report.index, dtype='str')
+    return report, not any(failed)
+
+
+def format_report(report):
+    """Compact text rendering of an evaluated report"""
+    if report.empty:
+        return "Data quality: no issues found"
+    lines = [f"Data quality: {len(report)} finding(s)"]
+    for row in report.itertuples(index=False):
+        limit = '-' if row.Threshold is None else row.Threshold
+        lines.append(f"  [{row.Status:4}] {row.Dataset:28} {row.Check:20} {row.Count:>8,} "
+                     f"(max {limit})  e.g. {row.Examples}")
+    return '\n'.join(lines)
+
+
+def quality_mode():
+    """Pipeline behaviour from ONEENERGY_QUALITY: fail (default), warn or off"""
+    mode = os.environ.get(QUALITY_ENV, 'fail').strip().lower()
+    return mode if mode in QUALITY_MODES else 'fail'
+
+
+def run_quality_gate(db_path=DEFAULT_DB_PATH, datasets=None, meters=True, thresholds=None):
+    """
+    Validate and print the report for a pipeline step
+
+    Returns:
+        bool: False when a threshold is exceeded and the mode is 'fail'
+    """
+    mode = quality_mode()
+    if mode == 'off':
+        return True
+    with span('quality'):
+        report, passed = evaluate(validate_database(db_path, datasets, meters), thresholds)
+    print(format_report(report))
+    return passed or mode == 'warn'
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Validate the OneEnergy datasets')
+    parser.add_argument('--db', type=Path, default=DEFAULT_DB_PATH, help='Folder with the datasets')
+    parser.add_argument('--dataset', action='append', help='Only check these price datasets')
+    parser.add_argument('--no-meters', action='store_true', help='Skip the meter files')
+    parser.add_argument('--threshold', action='append', metavar='[DATASET:]CHECK=N|none',
+                        help='Override a threshold')
+    parser.add_argument('--csv', type=Path, help='Also write the report to this CSV')
+    args = parser.parse_args(argv)
+
+    report, passed = evaluate(validate_database(args.db, args.dataset, not args.no_meters),
+                              parse_thresholds(args.threshold))
+    print(format_report(report))
+    if args.csv:
+        report.to_csv(args.csv, sep=';', index=False)
+    return 0 if passed else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
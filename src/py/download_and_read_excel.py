@@ -1,10 +1,12 @@
-import requests
 import zipfile
 import io
+import numpy as np
 import pandas as pd
 import pytz
 from datetime import date, datetime, timedelta, time
 
+from http_cache import cached_get
+
 def get_dst_dates(year):
     march_last_sunday = date(year, 3, 31)
     while march_last_sunday.weekday() != 6:
@@ -88,28 +90,123 @@ def get_fascia(row, holidays):
         return "F3"
 
 
-year = 2024
-
-url = f"https://www.mercatoelettrico.org/it-it/Home/Esiti/Elettricita/MGP/Statistiche/DatiStorici/moduleId/10874/controller/GmeDatiStoriciItem/action/DownloadFile?fileName=Anno{year}.zip"
-
-response = requests.get(url)
-response.raise_for_status()
-
-with zipfile.ZipFile(io.BytesIO(response.content)) as z:
-    excel_files = [f for f in z.namelist() if f.endswith('.xls') or f.endswith('.xlsx')]
-    if not excel_files:
-        raise Exception("Nessun file Excel trovato nello zip.")
-    excel_filename = excel_files[0]
-    with z.open(excel_filename) as excel_file:
-        df = pd.read_excel(excel_file, sheet_name='Prezzi-Prices', usecols=[0, 1, 2])
-
-df.columns = ['Date', 'Hour', 'PUN Index GME']
-df['Date'] = pd.to_datetime(df['Date'], format='%Y%m%d').dt.date
-
-march_dst, october_dst = get_dst_dates(year)
-df['DateTime'] = df.apply(lambda row: create_datetime_with_dst(row, march_dst, october_dst), axis=1)
-
-italian_holidays = get_italian_holidays(year)
-df['Fascia'] = df.apply(lambda row: get_fascia(row, italian_holidays), axis=1)
-
-df = df[['DateTime', 'Date', 'Hour', 'PUN Index GME', 'Fascia']]
\ No newline at end of file
+# Vectorized calendar helpers (day numbers are days since 1970-01-01)
+
+FASCIA_LABELS = np.array(['', 'F1', 'F2', 'F3'])
+HOLIDAY_MMDD = np.array([101, 106, 425, 501, 602, 815, 1101, 1208, 1225, 1226])
+
+def yyyymmdd_to_day_number(values):
+    """Convert integer YYYYMMDD dates to day numbers"""
+    values = np.asarray(values, dtype='int64')
+    months = (values // 10000 - 1970) * 12 + (values // 100) % 100 - 1
+    return (months.astype('datetime64[M]').astype('datetime64[D]').astype('int64')
+            + values % 100 - 1)
+
+def day_number_to_yyyymmdd(days):
+    """Convert day numbers to integer YYYYMMDD dates"""
+    days = np.asarray(days, dtype='int64').astype('datetime64[D]')
+    months = days.astype('datetime64[M]')
+    month_numbers = months.astype('int64')
+    return ((month_numbers // 12 + 1970) * 10000 + (month_numbers % 12 + 1) * 100
+            + (days - months.astype('datetime64[D]')).astype('int64') + 1)
+
+def get_dst_day_numbers(years):
+    """Day numbers of the last Sunday of March and October for each year"""
+    years = np.asarray(years, dtype='int64')
+    march_31 = yyyymmdd_to_day_number(years * 10000 + 331)
+    october_31 = yyyymmdd_to_day_number(years * 10000 + 1031)
+    # 1970-01-01 was a Thursday: weekday (Mon=0) is (day + 3) % 7
+    march_dst = march_31 - (march_31 + 4) % 7
+    october_dst = october_31 - (october_31 + 4) % 7
+    return march_dst, october_dst
+
+def midnight_utc_offset_hours(days):
+    """UTC offset of Europe/Rome at local midnight of each day (1 or 2)"""
+    days = np.asarray(days, dtype='int64')
+    years = days.astype('datetime64[D]').astype('datetime64[Y]').astype('int64') + 1970
+    march_dst, october_dst = get_dst_day_numbers(years)
+    return np.where((days > march_dst) & (days <= october_dst), 2, 1)
+
+def rome_utc_offset_hours(utc_seconds):
+    """UTC offset of Europe/Rome (1 or 2) at each UTC instant"""
+    utc_seconds = np.asarray(utc_seconds, dtype='int64')
+    years = utc_seconds.astype('datetime64[s]').astype('datetime64[Y]').astype('int64') + 1970
+    march_dst, october_dst = get_dst_day_numbers(years)
+    # Switches happen at 01:00 UTC on both last Sundays
+    dst_start = march_dst * 86400 + 3600
+    dst_end = october_dst * 86400 + 3600
+    return np.where((utc_seconds >= dst_start) & (utc_seconds < dst_end), 2, 1)
+
+def get_fascia_codes(days, hours):
+    """
+    Vectorized get_fascia: fascia code (1=F1, 2=F2, 3=F3) per day and GME hour
+
+    Args:
+        days: Day numbers
+        hours: GME hour of the day (1-24, 23/25 on DST days)
+
+    Returns:
+        np.ndarray: int8 codes, labels in FASCIA_LABELS
+    """
+    days = np.asarray(days, dtype='int64')
+    hours = np.asarray(hours, dtype='int64')
+    weekday = (days + 3) % 7
+    mmdd = day_number_to_yyyymmdd(days) % 10000
+
+    codes = np.full(np.broadcast(days, hours).shape, 3, dtype='int8')
+    weekdays = weekday <= 4
+    codes[weekdays & ((hours == 7) | ((hours >= 20) & (hours <= 23)))] = 2
+    codes[weekdays & (hours >= 8) & (hours <= 19)] = 1
+    codes[(weekday == 5) & (hours >= 7) & (hours <= 23)] = 2
+    return np.where(np.isin(mmdd, HOLIDAY_MMDD), 3, codes).astype('int8')
+
+# Interval resolution: minutes -> longest day (25 hours / 100 quarter-hours)
+MAX_INTERVALS_PER_DAY = {60: 25, 15: 100}
+
+def intervals_per_day(days, minutes=60):
+    """Intervals of each local day: 24/23/25 hours, 96/92/100 quarter-hours"""
+    days = np.asarray(days, dtype='int64')
+    hours = 24 + midnight_utc_offset_hours(days) - midnight_utc_offset_hours(days + 1)
+    return hours * (60 // minutes)
+
+def interval_utc_minutes(days, intervals, minutes=60):
+    """UTC minute at which the 1-based interval of each local day starts"""
+    days = np.asarray(days, dtype='int64')
+    intervals = np.asarray(intervals, dtype='int64')
+    return days * 1440 - midnight_utc_offset_hours(days) * 60 + (intervals - 1) * minutes
+
+def interval_gme_hours(intervals, minutes=60):
+    """GME hour (1-25) containing each 1-based interval"""
+    return (np.asarray(intervals, dtype='int64') - 1) * minutes // 60 + 1
+
+def infer_resolution_minutes(intervals):
+    """Resolution of a day-interval column: 60 if it fits GME hours, else 15"""
+    return 60 if int(np.max(intervals)) <= MAX_INTERVALS_PER_DAY[60] else 15
+
+
+if __name__ == "__main__":
+    year = 2024
+
+    url = f"https://www.mercatoelettrico.org/it-it/Home/Esiti/Elettricita/MGP/Statistiche/DatiStorici/moduleId/10874/controller/GmeDatiStoriciItem/action/DownloadFile?fileName=Anno{year}.zip"
+
+    response = cached_get(url)
+    response.raise_for_status()
+
+    with zipfile.ZipFile(io.BytesIO(response.content)) as z:
+        excel_files = [f for f in z.namelist() if f.endswith('.xls') or f.endswith('.xlsx')]
+        if not excel_files:
+            raise Exception("Nessun file Excel trovato nello zip.")
+        excel_filename = excel_files[0]
+        with z.open(excel_filename) as excel_file:
+            df = pd.read_excel(excel_file, sheet_name='Prezzi-Prices', usecols=[0, 1, 2])
+
+    df.columns = ['Date', 'Hour', 'PUN Index GME']
+    df['Date'] = pd.to_datetime(df['Date'], format='%Y%m%d').dt.date
+
+    march_dst, october_dst = get_dst_dates(year)
+    df['DateTime'] = df.apply(lambda row: create_datetime_with_dst(row, march_dst, october_dst), axis=1)
+
+    italian_holidays = get_italian_holidays(year)
+    df['Fascia'] = df.apply(lambda row: get_fascia(row, italian_holidays), axis=1)
+
+    df = df[['DateTime', 'Date', 'Hour', 'PUN Index GME', 'Fascia']]
@@ -0,0 +1,203 @@
+"""
+Server-side downsampling for the dashboard time-series charts.
+
+The line chart only needs as many points as there are horizontal pixels:
+every bucket of the visible range is reduced to the rows holding its minimum
+and maximum value, so price spikes are always drawn exactly while the payload
+sent to the browser stays proportional to the chart width, not to the history.
+"""
+import numpy as np
+import pandas as pd
+
+from filter_index import day_numbers
+
+DEFAULT_CHART_WIDTH_PX = 1200
+
+
+def _as_int64(values):
+    """Return datetime-like or numeric values as an int64/float numpy array."""
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return pd.DatetimeIndex(values).asi8
+    return np.asarray(values, dtype='float64')
+
+
+def minmax_indices(keys, y):
+    """
+    Positional indices of the min and max of y for every distinct key
+
+    Args:
+        keys: int64 array with the bucket of each point
+        y: values to preserve the extremes of
+
+    Returns:
+        np.ndarray: Sorted positions (at most two per bucket)
+    """
+    y = np.asarray(y, dtype='float64')
+    valid = np.flatnonzero(~np.isnan(y))
+    if len(valid) == 0:
+        return valid
+
+    order = valid[np.lexsort((y[valid], keys[valid]))]
+    sorted_keys = keys[order]
+    first = np.flatnonzero(np.r_[True, sorted_keys[1:] != sorted_keys[:-1]])
+    last = np.r_[first[1:] - 1, len(order) - 1]
+
+    return np.unique(np.concatenate([order[first], order[last]]))
+
+
+def lttb_indices(x, y, n_out):
+    """
+    Largest-Triangle-Three-Buckets selection of n_out points
+
+    Keeps the visual shape of smooth series with fewer points than min/max,
+    but does not guarantee every spike is kept.
+
+    Args:
+        x: int64/float x values, sorted ascending
+        y: y values
+        n_out: number of points to keep
+
+    Returns:
+        np.ndarray: Sorted positions of the selected points
+    """
+    x = np.asarray(x, dtype='float64')
+    y = np.asarray(y, dtype='float64')
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    edges = np.linspace(1, n - 1, n_out - 1).astype('int64')
+    selected = np.empty(n_out, dtype='int64')
+    selected[0] = 0
+    selected[-1] = n - 1
+    a = 0
+
+    for i in range(n_out - 2):
+        start, end = edges[i], edges[i + 1]
+        next_end = edges[i + 2] if i + 2 < len(edges) else n
+        avg_x = x[end:next_end].mean() if next_end > end else x[-1]
+        avg_y = y[end:next_end].mean() if next_end > end else y[-1]
+
+        area = np.abs(
+            (x[a] - avg_x) * (y[start:end] - y[a]) -
+            (x[a] - x[start:end]) * (avg_y - y[a])
+        )
+        a = start + int(np.nanargmax(area)) if end > start else start
+        selected[i + 1] = a
+
+    return np.unique(selected)
+
+
+def build_minmax_rollup(df, y_col, group_cols, period_col='Date'):
+    """
+    Keep only the rows holding the min and max of y_col per group and period
+
+    The result is a subset of df (same columns), so every filter that works
+    on whole periods or whole groups (month, weekday, date range, fascia)
+    can be applied to the rollup exactly as to the full data.
+
+    Args:
+        df: Source DataFrame
+        y_col: Value column whose extremes are preserved
+        group_cols: Columns that split the chart series (e.g. ['Fascia'])
+        period_col: Column identifying the rollup period (one row per day)
+
+    Returns:
+        pd.DataFrame: Rollup rows in the original order
+    """
+    keys = list(group_cols) + [period_col]
+    grouped = df.groupby(keys, sort=False, observed=True)[y_col]
+    idx = pd.Index(grouped.idxmin().dropna()).union(pd.Index(grouped.idxmax().dropna()))
+    return df.loc[df.index.isin(idx)]
+
+
+def uses_rollup(df, group_col=None, width_px=DEFAULT_CHART_WIDTH_PX, period_col='Date'):
+    """
+    Whether downsample would draw df from the min/max rollup
+
+    The rollup keeps two rows per period and series, so it pays off once the
+    raw rows outnumber the chart budget (more than two points per pixel) and
+    there are still at least half as many periods as buckets, which keeps one
+    period per two pixels on screen (a one-year range at the default width).
+
+    Args:
+        df: Filtered data to plot
+        group_col: Optional column splitting the chart into series
+        width_px: Chart width in pixels
+        period_col: Period column shared by df and rollup
+
+    Returns:
+        bool: True when the rollup should be bucketed instead of df
+    """
+    if df.empty:
+        return False
+    n_buckets = max(int(width_px) // 2, 1)
+    points = df[group_col].value_counts().max() if group_col else len(df)
+    return points > 2 * width_px and 2 * df[period_col].nunique() >= n_buckets
+
+
+def downsample(df, x_col, y_col, group_col=None, width_px=DEFAULT_CHART_WIDTH_PX,
+               rollup=None, period_col='Date', method='minmax'):
+    """
+    Reduce df to roughly width_px points per series for plotting
+
+    The resolution follows the visible range: the x span is split into
+    width_px / 2 buckets and each bucket keeps its min and max rows. When
+    uses_rollup holds, the pre-computed min/max rollup (see
+    build_minmax_rollup) is bucketed instead of the raw rows.
+
+    Args:
+        df: Filtered data to plot
+        x_col: Time column
+        y_col: Value column
+        group_col: Optional column splitting the chart into series
+        width_px: Chart width in pixels
+        rollup: Optional min/max rollup filtered like df
+        period_col: Period column shared by df and rollup
+        method: 'minmax' (spikes exact) or 'lttb'
+
+    Returns:
+        pd.DataFrame: Subset of df (or rollup) sorted by x_col
+    """
+    if df.empty:
+        return df
+
+    n_buckets = max(int(width_px) // 2, 1)
+    groups = df[group_col] if group_col else pd.Series(0, index=df.index)
+    if groups.value_counts().max() <= width_px:
+        return df.sort_values(x_col)
+
+    use_rollup = (
+        rollup is not None and not rollup.empty and
+        uses_rollup(df, group_col, width_px, period_col)
+    )
+    source = (rollup if use_rollup else df).sort_values(x_col)
+    group_codes = (
+        pd.factorize(source[group_col])[0].astype('int64') if group_col
+        else np.zeros(len(source), dtype='int64')
+    )
+
+    if method == 'lttb':
+        x = _as_int64(source[x_col]).astype('float64')
+        y = source[y_col].to_numpy(dtype='float64')
+        positions = []
+        for code in np.unique(group_codes):
+            members = np.flatnonzero(group_codes == code)
+            positions.append(members[lttb_indices(x[members], y[members], 2 * n_buckets)])
+        return source.iloc[np.sort(np.concatenate(positions))]
+
+    if not use_rollup:
+        x = _as_int64(source[x_col])
+        x0 = x.min()
+        span = max(int(x.max() - x0), 1)
+        buckets = ((x - x0).astype('float64') * n_buckets / (span + 1)).astype('int64')
+    else:
+        # Buckets aligned to whole periods keep the rollup extremes exact
+        periods = day_numbers(source[period_col]).astype('int64')
+        periods = periods - periods.min()
+        per_bucket = max(int(np.ceil((periods.max() + 1) / n_buckets)), 1)
+        buckets = periods // per_bucket
+
+    keys = group_codes * (n_buckets + 1) + buckets
+    positions = minmax_indices(keys, source[y_col].to_numpy(dtype='float64'))
+    return source.iloc[positions]
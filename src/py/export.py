@@ -0,0 +1,114 @@
+"""
+Chunked export of filtered data to CSV, Parquet and Arrow IPC.
+
+Rows are serialized a chunk at a time, so no full copy of the data as a
+single string (to_csv of the whole frame) is ever built. Small exports go to
+an in-memory buffer; above SPOOL_ROWS rows they are written to an anonymous
+temporary file, which is deleted when it is closed. Either way the result is
+an open binary file positioned at the start, which st.download_button reads.
+"""
+import io
+import tempfile
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# format -> (mime type, file extension)
+EXPORT_FORMATS = {
+    'csv': ('text/csv', 'csv'),
+    'parquet': ('application/vnd.apache.parquet', 'parquet'),
+    'arrow': ('application/vnd.apache.arrow.file', 'arrow'),
+}
+
+DEFAULT_CHUNK_ROWS = 100_000
+SPOOL_ROWS = 100_000  # Larger exports are written to a temporary file
+
+
+def iter_chunks(df, chunk_rows=DEFAULT_CHUNK_ROWS):
+    """Yield consecutive row slices of df (views, no copies)"""
+    for start in range(0, len(df), chunk_rows):
+        yield df.iloc[start:start + chunk_rows]
+
+
+def write_csv(df, sink, chunk_rows=DEFAULT_CHUNK_ROWS, sep=','):
+    """Write df to a binary file-like object as UTF-8 CSV, chunk by chunk"""
+    header = True
+    for chunk in iter_chunks(df, chunk_rows):
+        sink.write(chunk.to_csv(index=False, header=header, sep=sep).encode('utf-8'))
+        header = False
+    if header:
+        # Empty frame: still write the header row
+        sink.write(df.head(0).to_csv(index=False, sep=sep).encode('utf-8'))
+
+
+def _arrow_tables(df, schema, chunk_rows):
+    """Yield one Arrow table per chunk, all with the same schema"""
+    for chunk in iter_chunks(df, chunk_rows):
+        yield pa.Table.from_pandas(chunk, schema=schema, preserve_index=False)
+
+
+def write_parquet(df, sink, chunk_rows=DEFAULT_CHUNK_ROWS, compression='snappy'):
+    """Write df to a binary file-like object as Parquet, one row group per chunk"""
+    schema = pa.Schema.from_pandas(df.head(chunk_rows), preserve_index=False)
+    with pq.ParquetWriter(sink, schema, compression=compression) as writer:
+        for table in _arrow_tables(df, schema, chunk_rows):
+            writer.write_table(table)
+
+
+def write_arrow(df, sink, chunk_rows=DEFAULT_CHUNK_ROWS):
+    """Write df to a binary file-like object in the Arrow IPC file format"""
+    schema = pa.Schema.from_pandas(df.head(chunk_rows), preserve_index=False)
+    with pa.ipc.new_file(sink, schema) as writer:
+        for table in _arrow_tables(df, schema, chunk_rows):
+            writer.write_table(table, max_chunksize=chunk_rows)
+
+
+WRITERS = {
+    'csv': write_csv,
+    'parquet': write_parquet,
+    'arrow': write_arrow,
+}
+
+
+def export_frame(df, fmt='csv', columns=None, chunk_rows=DEFAULT_CHUNK_ROWS, spool_rows=SPOOL_ROWS):
+    """
+    Serialize df in the requested format
+
+    Args:
+        df: Data to export
+        fmt: One of EXPORT_FORMATS
+        columns: Columns to keep (in this order), None for all of them
+        chunk_rows: Rows serialized at a time
+        spool_rows: Exports with more rows are written to a temporary file
+
+    Returns:
+        Binary file object at position 0 (io.BytesIO, or an io.BufferedReader
+        over a temporary file), ready for st.download_button; close it when done
+
+    Raises:
+        ValueError: Unknown format, or an empty column selection
+    """
+    if fmt not in WRITERS:
+        raise ValueError(f"Unsupported export format: {fmt}")
+
+    if columns is not None:
+        if not len(columns):
+            raise ValueError("No columns selected for the export")
+        df = df[list(columns)]
+
+    if len(df) <= spool_rows:
+        sink = io.BytesIO()
+        WRITERS[fmt](df, sink, chunk_rows)
+        sink.seek(0)
+        return sink
+
+    sink = tempfile.TemporaryFile()
+    try:
+        WRITERS[fmt](df, sink, chunk_rows)
+        sink.flush()
+        raw = sink.detach()  # Same file, reopened read-only below
+    except BaseException:
+        sink.close()
+        raise
+    raw.seek(0)
+    return io.BufferedReader(raw)
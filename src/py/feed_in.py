@@ -0,0 +1,328 @@
+"""
+Feed-in valuation for prosumer PODs: injections priced at the zonal price.
+
+ATTIVA_IMMESSA (energy fed into the grid) of every 15-minute reading is
+valued at the hourly MGP price of the POD's market zone, and netted against
+CONSUMO_ATTIVA_PRELEVATA of the same interval:
+
+    Netted        min(withdrawn, injected): produced and consumed in the interval
+    NetWithdrawn  withdrawn - Netted, bought from the grid
+    NetInjected   injected - Netted, sold to the grid
+
+Zones come from db/pod_zones.csv (POD;Zone); PODs not listed there take the
+default zone, or the PUN when there is none (the CLI lists them). Zonal
+prices are the yearly history written by backfill (db/MGP-Prezzi) with the
+daily MGPPrezzi XML filling the days after it. Injections without a price are
+left out of the EUR sums (NaN when a group has no price at all) and out of
+kWhInjectedPriced, the divisor of AvgFeedInPrice.
+
+As in cost_engine, readings and prices meet on integer UTC interval numbers
+(one PriceSeries lookup per zone), meter files are streamed in chunks, and
+every aggregate is a sum, so chunks and PODs combine with one final groupby.
+"""
+import argparse
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+
+from backfill import history_years, partition_path
+from cost_engine import (
+    DEFAULT_CHUNK_ROWS, ENERGY_COLUMN, METER_COLUMNS, PRICE_DATASETS, interval_fascia_codes,
+    iter_meter_chunks, load_prices, meter_utc_minutes
+)
+from download_and_read_excel import FASCIA_LABELS
+from instrumentation import span
+from interval_store import INTERVAL_COLUMNS
+from price_series import PriceSeries, load_zone_series
+
+REPO_PATH = Path(__file__).resolve().parents[2]
+DEFAULT_DB_PATH = REPO_PATH / 'db'
+DEFAULT_XML_PATH = REPO_PATH / 'sources' / 'GME' / 'EE'
+POD_ZONES_FILENAME = 'pod_zones.csv'
+
+MARKET_ZONES = ('NORD', 'CNOR', 'CSUD', 'SUD', 'CALA', 'SICI', 'SARD')
+FALLBACK_PRICE = 'PUN'
+
+INJECTION_COLUMN = 'ATTIVA_IMMESSA'
+FEED_IN_COLUMNS = METER_COLUMNS + [INJECTION_COLUMN]
+
+# level -> grouping keys of the aggregated output
+AGGREGATION_LEVELS = {
+    'day': ['POD', 'Zone', 'Date'],
+    'month': ['POD', 'Zone', 'Month'],
+    'fascia': ['POD', 'Zone', 'Month', 'Fascia'],
+}
+EUR_COLUMNS = ['FeedInEUR', 'NettedEUR', 'NetInjectedEUR']
+SUM_COLUMNS = ['kWhWithdrawn', 'kWhInjected', 'kWhInjectedPriced', 'kWhNetted', 'kWhNetWithdrawn',
+               'kWhNetInjected'] + EUR_COLUMNS + ['Intervals', 'MissingPrice']
+
+
+def load_pod_zones(db_path=DEFAULT_DB_PATH):
+    """
+    {POD: market zone} from db/pod_zones.csv (empty when the file is missing)
+
+    Raises:
+        ValueError: A zone is not one of MARKET_ZONES
+    """
+    path = Path(db_path) / POD_ZONES_FILENAME
+    if not path.exists():
+        return {}
+    df = pd.read_csv(path, sep=';', encoding='utf-8-sig', dtype=str)
+    zones = dict(zip(df['POD'].str.strip(), df['Zone'].str.strip().str.upper()))
+    unknown = sorted(set(zones.values()) - set(MARKET_ZONES))
+    if unknown:
+        raise ValueError(f"Unknown market zones in {path.name}: {unknown}")
+    return zones
+
+
+def history_zone_series(db_path=DEFAULT_DB_PATH, zones=MARKET_ZONES):
+    """{zone: hourly PriceSeries} from the backfilled yearly partitions"""
+    frames = []
+    for year in history_years(db_path):
+        path = partition_path(db_path, year)
+        names = pq.read_schema(path).names
+        interval_col = next(c for c in INTERVAL_COLUMNS if c in names)
+        columns = ['Date', interval_col] + [zone for zone in zones if zone in names]
+        frames.append(pq.read_table(path, columns=columns).to_pandas().rename(columns={interval_col: 'Interval'})
+                      .assign(Minutes=60 if interval_col == 'Hour' else 15))
+    if not frames:
+        return {}
+
+    history = pd.concat(frames, ignore_index=True)
+    series = {}
+    for minutes, part in history.groupby('Minutes'):
+        days = part['Date'].to_numpy(dtype='datetime64[D]').astype('int64')
+        for zone in part.columns.intersection(zones):
+            built = PriceSeries.from_records(zone, days, part['Interval'].to_numpy(), part[zone].to_numpy(), minutes)
+            built = built.resample('hour')
+            series[zone] = series[zone].combine_first(built) if zone in series else built
+    return series
+
+
+def load_zone_prices(db_path=DEFAULT_DB_PATH, xml_path=DEFAULT_XML_PATH, zones=MARKET_ZONES):
+    """
+    Hourly price series of the market zones, plus the PUN fallback
+
+    Returns:
+        dict: {zone or FALLBACK_PRICE: PriceSeries}
+    """
+    with span('feed_in.prices'):
+        prices = history_zone_series(db_path, zones)
+        xml_series = load_zone_series(xml_path, list(zones)) if Path(xml_path).exists() else {}
+        for zone, recent in xml_series.items():
+            recent = recent.resample('hour')
+            prices[zone] = prices[zone].combine_first(recent) if zone in prices else recent
+        if any((Path(db_path) / f'{PRICE_DATASETS[60]}{suffix}').exists() for suffix in ('.parquet', '.csv')):
+            prices[FALLBACK_PRICE] = load_prices(db_path)
+    return prices
+
+
+def value_intervals(chunk, zone_prices, pod_zones, default_zone=None):
+    """
+    Value the injections of a meter chunk and net them against withdrawals
+
+    Args:
+        chunk: DataFrame with FEED_IN_COLUMNS
+        zone_prices: {zone: PriceSeries} from load_zone_prices
+        pod_zones: {POD: zone}
+        default_zone: Zone of PODs missing from pod_zones (None: the PUN)
+
+    Returns:
+        pd.DataFrame: One row per real reading with POD, Zone, UtcMinute,
+        Date, Month, Fascia, the kWh columns, Price and the EUR columns
+    """
+    utc_minutes, valid, days = meter_utc_minutes(
+        chunk['DATA'].to_numpy(), chunk['ORA'].to_numpy(), chunk['FL_ORA_LEGALE'].to_numpy()
+    )
+    utc_minutes, days = utc_minutes[valid], days[valid]
+    withdrawn = pd.to_numeric(chunk[ENERGY_COLUMN], errors='coerce').to_numpy(dtype='float64')[valid]
+    injected = pd.to_numeric(chunk[INJECTION_COLUMN], errors='coerce').to_numpy(dtype='float64')[valid]
+    withdrawn, injected = np.nan_to_num(withdrawn), np.nan_to_num(injected)  # Empty: no flow
+
+    # Zone of every reading through the zone of every distinct POD
+    pods = chunk['POD'].to_numpy()[valid]
+    codes, unique_pods = pd.factorize(pods)
+    pod_zone = np.array([pod_zones.get(pod, default_zone) or FALLBACK_PRICE for pod in unique_pods], dtype=object)
+    zones = pod_zone[codes] if len(codes) else np.empty(0, dtype=object)
+
+    price = np.full(len(utc_minutes), np.nan)
+    for zone in pd.unique(pod_zone):
+        if zone in zone_prices:
+            rows = zones == zone
+            price[rows] = zone_prices[zone].lookup(utc_minutes[rows])
+
+    netted = np.minimum(withdrawn, injected)
+    net_injected = injected - netted
+    dates = days.astype('datetime64[D]')
+
+    return pd.DataFrame({
+        'POD': pods,
+        'Zone': zones,
+        'UtcMinute': utc_minutes,
+        'Date': dates,
+        'Month': dates.astype('datetime64[M]'),
+        'Fascia': FASCIA_LABELS[interval_fascia_codes(utc_minutes, days)],
+        'kWhWithdrawn': withdrawn,
+        'kWhInjected': injected,
+        'kWhInjectedPriced': np.where(np.isnan(price), 0.0, injected),
+        'kWhNetted': netted,
+        'kWhNetWithdrawn': withdrawn - netted,
+        'kWhNetInjected': net_injected,
+        'Price': price,
+        'FeedInEUR': injected * price / 1000,
+        'NettedEUR': netted * price / 1000,
+        'NetInjectedEUR': net_injected * price / 1000,
+    })
+
+
+def sum_groups(frame, keys):
+    """
+    Sum SUM_COLUMNS per key; EUR columns stay NaN in groups without any price
+    """
+    grouped = frame.groupby(keys, sort=True, observed=True)
+    sums = grouped[[c for c in SUM_COLUMNS if c not in EUR_COLUMNS]].sum()
+    sums[EUR_COLUMNS] = grouped[EUR_COLUMNS].sum(min_count=1)
+    return sums[SUM_COLUMNS].reset_index()
+
+
+def aggregate_feed_in(intervals, level='month'):
+    """Sum valued intervals at one of AGGREGATION_LEVELS"""
+    frame = intervals.assign(
+        Intervals=1,
+        MissingPrice=(np.isnan(intervals['Price'].to_numpy()) & (intervals['kWhInjected'].to_numpy() > 0))
+        .astype('int64'),
+    )
+    return sum_groups(frame, AGGREGATION_LEVELS[level])
+
+
+def unlisted_pods(pods, pod_zones):
+    """PODs missing from pod_zones.csv (valued at the default zone, or the PUN)"""
+    return sorted(set(pods) - set(pod_zones))
+
+
+def _with_ratios(result):
+    """
+    Add the average feed-in price (EUR/MWh) over the priced injections and
+    the netted share of the injections
+    """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        result['AvgFeedInPrice'] = result['FeedInEUR'] * 1000 / result['kWhInjectedPriced']
+        result['NettedShare'] = result['kWhNetted'] / result['kWhInjected']
+    return result
+
+
+def run_feed_in_engine(meter_paths, db_path=DEFAULT_DB_PATH, xml_path=DEFAULT_XML_PATH,
+                       levels=('month', 'fascia'), chunk_rows=DEFAULT_CHUNK_ROWS, zone_prices=None,
+                       pod_zones=None, default_zone=None, prosumers_only=True):
+    """
+    Value the injections of every POD in the given meter files
+
+    Args:
+        meter_paths: Meter CSV/Parquet files or partitioned folders
+        db_path: Folder with the price store, the history and pod_zones.csv
+        xml_path: Folder with the MGPPrezzi XML files
+        levels: Aggregation levels to return
+        chunk_rows: Readings processed at a time
+        zone_prices: Optional pre-loaded prices (see load_zone_prices)
+        pod_zones: Optional {POD: zone} (default: db/pod_zones.csv)
+        default_zone: Zone of unlisted PODs (None: valued at the PUN)
+        prosumers_only: Drop PODs that never injected
+
+    Returns:
+        dict: {level: aggregated DataFrame}
+    """
+    if zone_prices is None:
+        zone_prices = load_zone_prices(db_path, xml_path)
+    if pod_zones is None:
+        pod_zones = load_pod_zones(db_path)
+    if isinstance(meter_paths, (str, Path)):
+        meter_paths = [meter_paths]
+
+    partials = {level: [] for level in levels}
+    for path in meter_paths:
+        with span('feed_in.meter', file=Path(path).name) as s:
+            for chunk in iter_meter_chunks(path, chunk_rows, FEED_IN_COLUMNS):
+                intervals = value_intervals(chunk, zone_prices, pod_zones, default_zone)
+                for level in levels:
+                    partials[level].append(aggregate_feed_in(intervals, level))
+                s.add(rows=len(chunk))
+
+    results = {}
+    for level, frames in partials.items():
+        keys = AGGREGATION_LEVELS[level]
+        if not frames:
+            results[level] = _with_ratios(pd.DataFrame(columns=keys + SUM_COLUMNS))
+            continue
+        combined = sum_groups(pd.concat(frames, ignore_index=True), keys)
+        if prosumers_only:
+            injected = combined.groupby('POD')['kWhInjected'].transform('sum')
+            combined = combined[injected > 0].reset_index(drop=True)
+        results[level] = _with_ratios(combined)
+    return results
+
+
+def default_meter_paths(db_path=DEFAULT_DB_PATH):
+    """Every POD file in db/pods/, or the IT*.csv meter files in db/"""
+    db_path = Path(db_path)
+    pods = sorted((db_path / 'pods').glob('*.csv'))
+    return pods or sorted(db_path.glob('IT*.csv'))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Value the grid injections of prosumer PODs at zonal prices')
+    parser.add_argument('meters', nargs='*', type=Path, help='Meter files or folders (default: db/pods or db/IT*.csv)')
+    parser.add_argument('--db', type=Path, default=DEFAULT_DB_PATH, help='Database folder')
+    parser.add_argument('--xml', type=Path, default=DEFAULT_XML_PATH, help='MGPPrezzi XML folder')
+    parser.add_argument('--zone', choices=MARKET_ZONES, help='Zone of PODs missing from pod_zones.csv')
+    parser.add_argument('--all-pods', action='store_true', help='Keep PODs without injections')
+    parser.add_argument('--output', type=Path, help='Write the month and fascia tables to this folder')
+    args = parser.parse_args(argv)
+
+    meter_paths = args.meters or default_meter_paths(args.db)
+    if not meter_paths:
+        print(f"No meter files in {args.db}")
+        return 1
+
+    print("=== Feed-in Valuation ===")
+    pod_zones = load_pod_zones(args.db)
+    results = run_feed_in_engine(meter_paths, args.db, args.xml, pod_zones=pod_zones, default_zone=args.zone,
+                                 prosumers_only=not args.all_pods)
+    monthly, by_fascia = results['month'], results['fascia']
+    if monthly.empty:
+        print("No POD injected energy in these files")
+        return 0
+
+    float_format = lambda v: f"{v:,.2f}"
+    columns = ['POD', 'Zone', 'Month', 'kWhInjected', 'kWhNetted', 'kWhNetInjected', 'FeedInEUR',
+               'AvgFeedInPrice', 'NettedShare']
+    print(f"\nMonthly feed-in ({monthly['POD'].nunique()} POD):")
+    print(monthly[columns].to_string(index=False, float_format=float_format))
+
+    totals = sum_groups(by_fascia, ['POD', 'Zone', 'Fascia'])
+    print("\nTotals by fascia:")
+    print(_with_ratios(totals)[['POD', 'Zone', 'Fascia', 'kWhInjected', 'kWhNetted', 'FeedInEUR', 'AvgFeedInPrice']]
+          .to_string(index=False, float_format=float_format))
+
+    unlisted = unlisted_pods(monthly['POD'].unique(), pod_zones)
+    if unlisted:
+        fallback = args.zone or FALLBACK_PRICE
+        print(f"\nWarning: {len(unlisted)} POD not in {POD_ZONES_FILENAME}, valued at {fallback} prices: "
+              f"{', '.join(unlisted)}")
+    missing = int(monthly['MissingPrice'].sum())
+    if missing:
+        unpriced = monthly.loc[monthly['FeedInEUR'].isna(), 'Month'].dt.strftime('%Y-%m').unique()
+        print(f"\nWarning: {missing:,} injecting intervals without a zonal price, left out of "
+              f"FeedInEUR and AvgFeedInPrice" + (f" (no price at all in {', '.join(unpriced)})" if len(unpriced) else ""))
+    if args.output:
+        args.output.mkdir(parents=True, exist_ok=True)
+        for level, frame in results.items():
+            frame.to_csv(args.output / f'feed_in_{level}.csv', sep=';', index=False)
+        print(f"\nWrote feed_in_month.csv and feed_in_fascia.csv to {args.output}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
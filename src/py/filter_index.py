@@ -0,0 +1,123 @@
+"""
+Precomputed bitmap indexes for the dashboard filters.
+
+Every distinct value of a filter dimension (month, weekday, fascia) gets a
+packed bitmap of the rows holding it, and dates are mapped once to an integer
+day number. A filter combination is then a few bitwise OR/AND over packed
+bytes restricted to the date slice, instead of chained isin masks and python
+date comparisons over the whole frame.
+"""
+import numpy as np
+import pandas as pd
+
+DEFAULT_DIMENSIONS = ('Month', 'WeekdayNum', 'Fascia')
+
+
+def to_day_number(value):
+    """Convert a date/datetime/string to days since 1970-01-01"""
+    return int(np.datetime64(pd.Timestamp(value).date(), 'D').astype('int64'))
+
+
+def day_numbers(dates):
+    """Vectorized to_day_number for a column of dates"""
+    days = pd.to_datetime(pd.Series(dates).reset_index(drop=True))
+    if days.dt.tz is not None:
+        days = days.dt.tz_localize(None)
+    return days.to_numpy(dtype='datetime64[D]').astype('int32')
+
+
+class FilterIndex:
+    """
+    Bitmap index over the filter dimensions of a DataFrame
+
+    Args:
+        df: Data to index (its row order defines the returned positions)
+        dimensions: Columns to build per-value bitmaps for
+        date_col: Column with the row dates
+    """
+
+    def __init__(self, df, dimensions=DEFAULT_DIMENSIONS, date_col='Date'):
+        self.n_rows = len(df)
+        self.dimensions = tuple(dimensions)
+
+        days = day_numbers(df[date_col])
+        if len(days) and np.any(np.diff(days) < 0):
+            # Keep rows grouped by day so date ranges stay contiguous slices
+            self.order = np.argsort(days, kind='stable')
+            days = days[self.order]
+        else:
+            self.order = None
+        self.days = days
+
+        self.bitmaps = {}
+        for dim in self.dimensions:
+            values = df[dim].to_numpy()
+            if self.order is not None:
+                values = values[self.order]
+            codes, uniques = pd.factorize(values)
+            self.bitmaps[dim] = {
+                (value.item() if hasattr(value, 'item') else value): np.packbits(codes == code)
+                for code, value in enumerate(uniques)
+            }
+
+        self._cache = {}
+
+    def values(self, dim):
+        """Distinct values of an indexed dimension"""
+        return sorted(self.bitmaps[dim])
+
+    def _dimension_bitmap(self, dim, selected):
+        """Packed OR of the bitmaps of the selected values (cached per selection)"""
+        key = (dim, frozenset(selected))
+        bitmap = self._cache.get(key)
+        if bitmap is None:
+            bitmap = np.zeros((self.n_rows + 7) // 8, dtype='uint8')
+            for value in selected:
+                value = value.item() if hasattr(value, 'item') else value
+                if value in self.bitmaps[dim]:
+                    bitmap |= self.bitmaps[dim][value]
+            if len(self._cache) > 256:
+                self._cache.clear()
+            self._cache[key] = bitmap
+        return bitmap
+
+    def date_slice(self, start_date=None, end_date=None):
+        """Row range [lo, hi) covering the inclusive date range"""
+        lo = 0 if start_date is None else int(np.searchsorted(self.days, to_day_number(start_date), 'left'))
+        hi = self.n_rows if end_date is None else int(np.searchsorted(self.days, to_day_number(end_date), 'right'))
+        return lo, max(lo, hi)
+
+    def select(self, filters=None, start_date=None, end_date=None):
+        """
+        Positions of the rows matching every filter
+
+        Args:
+            filters: Dict {dimension: selected values}; None or a missing
+                dimension means no restriction on it
+            start_date: Optional first date (inclusive)
+            end_date: Optional last date (inclusive)
+
+        Returns:
+            np.ndarray: Sorted row positions, usable with df.iloc
+        """
+        lo, hi = self.date_slice(start_date, end_date)
+        if hi <= lo:
+            return np.empty(0, dtype='int64')
+
+        byte_lo, byte_hi = lo // 8, (hi + 7) // 8
+        combined = None
+        for dim, selected in (filters or {}).items():
+            if selected is None:
+                continue
+            part = self._dimension_bitmap(dim, selected)[byte_lo:byte_hi]
+            combined = part.copy() if combined is None else (combined & part)
+
+        if combined is None:
+            positions = np.arange(lo, hi, dtype='int64')
+        else:
+            bits = np.unpackbits(combined)[lo - byte_lo * 8:hi - byte_lo * 8]
+            positions = lo + np.flatnonzero(bits)
+
+        if self.order is not None:
+            positions = np.sort(self.order[positions])
+        return positions
@@ -0,0 +1,205 @@
+"""
+Exact fixed-point encoding of prices in micro-euros/MWh.
+
+GME publishes prices with six decimals and a decimal comma ('111,543520').
+As float32 such a value keeps only about seven significant digits, and sums
+of float64 values drift from the published totals. Stored as int64 counts of
+micro-euros (value * MICRO) every published price is exact, and sums, group
+totals and means stay exact integers (interval_store.fixed_rollup computes
+the day, month and fascia rollups that way when the Parquet column is decimal).
+
+Text is parsed without going through float, in vectorized integer
+arithmetic over the characters of all values at once.
+
+In Parquet the values are a decimal128(DECIMAL_PRECISION, SCALE) column
+written with store_decimal_as_integer, so the file holds INT64 values (delta
+bit-packed by convert_to_parquet, smaller than float32) and every reader
+still sees the decimal type. The
+unscaled integers are taken straight from the Arrow buffers both ways, with
+no Python Decimal objects.
+"""
+import os
+
+import numpy as np
+import pyarrow as pa
+
+SCALE = 6
+MICRO = 10 ** SCALE
+DECIMAL_PRECISION = 18  # Largest precision stored as INT64 in Parquet
+DECIMAL_TYPE = pa.decimal128(DECIMAL_PRECISION, SCALE)
+MAX_INTEGER_DIGITS = DECIMAL_PRECISION - SCALE  # Larger values would overflow int64 micro-units
+
+FIXED_POINT_ENV = 'ONEENERGY_FIXED_POINT'  # 1 to write prices as fixed point
+
+POWERS_OF_TEN = 10 ** np.arange(19, dtype='int64')
+
+
+def parse_fixed(texts):
+    """
+    Parse decimal text ('111,543520' or '111.54352') to int64 micro-units
+
+    The texts are laid out as a (n, width) byte matrix and accumulated one
+    character column at a time (Horner's rule over all values at once);
+    digits beyond SCALE are rounded half away from zero. A sign may only
+    lead the number, blanks may only surround it, and at most
+    MAX_INTEGER_DIGITS significant integer digits are accepted.
+
+    Args:
+        texts: Iterable of strings (decimal comma or point)
+
+    Returns:
+        ndarray: int64 values * MICRO
+
+    Raises:
+        ValueError: A text is not a plain decimal number, or is out of range
+    """
+    texts = np.asarray(texts, dtype='S')
+    if not texts.size:
+        return np.zeros(0, dtype='int64')
+    # One row per character position, so each step reads a contiguous row
+    chars = np.ascontiguousarray(texts.reshape(-1, 1).view(np.uint8).T)
+
+    digit = (chars - np.uint8(ord('0'))) < 10
+    separator = (chars == ord(',')) | (chars == ord('.'))
+    sign = (chars == ord('-')) | (chars == ord('+'))
+    blank = (chars == 0) | (chars == ord(' '))
+    # Blanks only before the first and after the last character, a sign only first
+    position = np.arange(chars.shape[0])[:, None]
+    filled = ~blank
+    first = filled.argmax(axis=0)
+    last = chars.shape[0] - 1 - filled[::-1].argmax(axis=0)
+    inner_blank = (blank & (position > first) & (position < last)).any(axis=0)
+    misplaced_sign = (sign & (position != first)).any(axis=0)
+    invalid = (~(digit | separator | sign | blank)).any(axis=0) | (np.count_nonzero(separator, axis=0) > 1) \
+        | (np.count_nonzero(sign, axis=0) > 1) | ~digit.any(axis=0) | inner_blank | misplaced_sign
+    if invalid.any():
+        raise ValueError(f"Not a decimal number: {texts[invalid.argmax()].decode(errors='replace')!r}")
+
+    # Integer digits from the first non-zero one on
+    integer_digit = digit & (np.cumsum(separator, axis=0) == 0)
+    significant = integer_digit & (np.cumsum(integer_digit & (chars != ord('0')), axis=0) > 0)
+    too_large = np.count_nonzero(significant, axis=0) > MAX_INTEGER_DIGITS
+    if too_large.any():
+        raise ValueError(f"Out of range for {DECIMAL_TYPE}: {texts[too_large.argmax()].decode(errors='replace')!r}")
+
+    n = chars.shape[1]
+    values = np.zeros(n, dtype='int64')
+    decimals = np.zeros(n, dtype='int64')
+    in_fraction = np.zeros(n, dtype=bool)
+    round_up = np.zeros(n, dtype=bool)
+    for row, is_digit, is_separator in zip(chars, digit, separator):
+        value = row.astype('int64') - ord('0')
+        fraction_digit = is_digit & in_fraction
+        kept = is_digit & ~(fraction_digit & (decimals >= SCALE))
+        values = np.where(kept, values * 10 + value, values)
+        round_up |= fraction_digit & (decimals == SCALE) & (value >= 5)
+        decimals += fraction_digit
+        in_fraction |= is_separator
+
+    values = values * POWERS_OF_TEN[SCALE - np.minimum(decimals, SCALE)] + round_up
+    too_large = values >= POWERS_OF_TEN[DECIMAL_PRECISION]  # Rounded up past the precision
+    if too_large.any():
+        raise ValueError(f"Out of range for {DECIMAL_TYPE}: {texts[too_large.argmax()].decode(errors='replace')!r}")
+    return np.where((chars == ord('-')).any(axis=0), -values, values)
+
+
+def to_fixed(values):
+    """Float values to int64 micro-units (rounded to the nearest unit)"""
+    return np.round(np.asarray(values, dtype='float64') * MICRO).astype('int64')
+
+
+def from_fixed(micro):
+    """int64 micro-units to float64, correctly rounded"""
+    return np.asarray(micro, dtype='int64') / MICRO
+
+
+def to_decimal_array(micro, missing=None):
+    """
+    Arrow decimal128 array over int64 micro-units, built from the buffers
+
+    Args:
+        micro: int64 values * MICRO
+        missing: Optional bool mask of the values to store as null
+    """
+    micro = np.ascontiguousarray(micro, dtype='<i8')
+    words = np.empty(2 * len(micro), dtype='<i8')
+    words[0::2] = micro
+    words[1::2] = micro >> 63  # Sign extension of the high word
+    validity, null_count = None, 0
+    if missing is not None:
+        missing = np.asarray(missing, dtype=bool)
+        null_count = int(missing.sum())
+        if null_count:
+            validity = pa.py_buffer(np.packbits(~missing, bitorder='little'))
+    return pa.Array.from_buffers(DECIMAL_TYPE, len(micro), [validity, pa.py_buffer(words)], null_count)
+
+
+def decimal_to_fixed(array):
+    """
+    int64 micro-units of an Arrow decimal128 array (or chunked array)
+
+    Values are rescaled when the array's scale is not SCALE; nulls become 0.
+    """
+    if isinstance(array, pa.ChunkedArray):
+        array = array.combine_chunks()
+    words = np.frombuffer(array.buffers()[1], dtype='<i8')
+    micro = words[2 * array.offset:2 * (array.offset + len(array)):2].copy()
+    scale = array.type.scale
+    if scale < SCALE:
+        micro *= 10 ** (SCALE - scale)
+    elif scale > SCALE:
+        micro = np.floor_divide(micro + 10 ** (scale - SCALE) // 2, 10 ** (scale - SCALE))
+    if array.null_count:
+        micro[array.is_null().to_numpy(zero_copy_only=False)] = 0
+    return micro
+
+
+def price_values(column):
+    """
+    float64 values of an Arrow price column, float or fixed point
+
+    Decimal columns are converted through the integers (Arrow's own
+    decimal-to-float cast is not correctly rounded); nulls become NaN.
+    """
+    if isinstance(column, pa.ChunkedArray):
+        column = column.combine_chunks()
+    if pa.types.is_decimal(column.type):
+        values = from_fixed(decimal_to_fixed(column))
+        if column.null_count:
+            values[column.is_null().to_numpy(zero_copy_only=False)] = np.nan
+        return values
+    return column.to_numpy(zero_copy_only=False).astype('float64')
+
+
+def fixed_point_enabled():
+    return os.environ.get(FIXED_POINT_ENV, '').strip().lower() in ('1', 'true', 'yes')
+
+
+def group_stats(keys, micro):
+    """
+    Exact per-key sums, counts, minima and maxima of int64 micro-units
+
+    Args:
+        keys: Group key of every value (any sortable dtype)
+        micro: int64 values
+
+    Returns:
+        tuple: (unique keys, int64 sums, counts, int64 minima, int64 maxima)
+    """
+    keys = np.asarray(keys)
+    micro = np.asarray(micro, dtype='int64')
+    order = np.argsort(keys, kind='stable')
+    unique, starts, counts = np.unique(keys[order], return_index=True, return_counts=True)
+    if not len(unique):
+        empty = np.zeros(0, dtype='int64')
+        return unique, empty, counts, empty, empty
+    sorted_micro = micro[order]
+    return (unique, np.add.reduceat(sorted_micro, starts), counts,
+            np.minimum.reduceat(sorted_micro, starts), np.maximum.reduceat(sorted_micro, starts))
+
+
+def fixed_mean(sums, counts):
+    """Mean in micro-units from exact sums, rounded half away from zero"""
+    sums = np.asarray(sums, dtype='int64')
+    counts = np.asarray(counts, dtype='int64')
+    return np.sign(sums) * ((np.abs(sums) + counts // 2) // counts)
@@ -0,0 +1,283 @@
+"""
+Gas-day aligned daily series for GAS-MGP, PSV_DA and PSV_MA.
+
+The three sources are parsed once onto a single gas-day calendar (a gas day
+runs from 06:00 to 06:00 local time and is labelled with its start date) and
+kept as dense float64 arrays indexed by gas-day number (days since
+1970-01-01). Missing days are filled with an explicit policy per series,
+monthly PSV values are expanded to every day of their month, and the aligned
+arrays are cached next to the sources so later runs skip the CSV parsing.
+"""
+import json
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from download_and_read_excel import rome_utc_offset_hours
+from interval_store import day_number, range_positions
+
+DEFAULT_DB_PATH = Path(__file__).resolve().parents[2] / 'db'
+CACHE_FILENAME = 'gas_daily.npz'
+GAS_DAY_START_HOUR = 6
+
+# series -> (source file, unit)
+GAS_SOURCES = {
+    'MGP-GAS': ('GAS-MGP.csv', 'EUR/MWh'),
+    'PSV_DA': ('PSV_DA.csv', 'EUR/Smc'),
+    'PSV_MA': ('PSV_MA.csv', 'EUR/Smc'),
+}
+
+# Default fill policy per series (see fill_gaps)
+DEFAULT_FILL = {
+    'MGP-GAS': 'ffill',
+    'PSV_DA': 'ffill',
+    'PSV_MA': 'none',
+}
+FILL_POLICIES = ('none', 'ffill', 'bfill', 'linear')
+
+
+def read_gas_mgp(db_path=DEFAULT_DB_PATH):
+    """GAS-MGP.csv as (gas-day numbers, values), empty days dropped"""
+    df = pd.read_csv(Path(db_path) / 'GAS-MGP.csv', sep=';', encoding='utf-8-sig')
+    df = df.dropna(subset=[df.columns[1]])
+    days = pd.to_datetime(df.iloc[:, 0].astype(str), format='%Y%m%d')
+    return days.to_numpy(dtype='datetime64[D]').astype('int64'), df.iloc[:, 1].to_numpy(dtype='float64')
+
+
+def read_psv_da(db_path=DEFAULT_DB_PATH):
+    """PSV_DA.csv (dd/mm/yyyy) as (gas-day numbers, values)"""
+    df = pd.read_csv(Path(db_path) / 'PSV_DA.csv', sep=';', encoding='utf-8')
+    df = df.dropna(subset=[df.columns[1]])
+    days = pd.to_datetime(df.iloc[:, 0], format='%d/%m/%Y')
+    return days.to_numpy(dtype='datetime64[D]').astype('int64'), df.iloc[:, 1].to_numpy(dtype='float64')
+
+
+def read_psv_ma(db_path=DEFAULT_DB_PATH):
+    """
+    PSV_MA.csv (YearMonth, newest first) expanded to one value per day
+
+    Returns:
+        tuple: (gas-day numbers, values) in ascending order
+    """
+    df = pd.read_csv(Path(db_path) / 'PSV_MA.csv', sep=';', encoding='utf-8')
+    df = df.dropna(subset=[df.columns[1]])
+    months = pd.to_datetime(df.iloc[:, 0].astype(str), format='%Y%m').to_numpy(dtype='datetime64[M]')
+    order = np.argsort(months)
+    months, values = months[order], df.iloc[:, 1].to_numpy(dtype='float64')[order]
+
+    starts = months.astype('datetime64[D]').astype('int64')
+    lengths = (months + 1).astype('datetime64[D]').astype('int64') - starts
+    offsets = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    return np.repeat(starts, lengths) + offsets, np.repeat(values, lengths)
+
+
+READERS = {
+    'MGP-GAS': read_gas_mgp,
+    'PSV_DA': read_psv_da,
+    'PSV_MA': read_psv_ma,
+}
+
+
+def fill_gaps(values, observed, policy='none', limit=None):
+    """
+    Fill the missing days of a dense daily array
+
+    Args:
+        values: float64 array (NaN where not observed)
+        observed: bool array of real observations
+        policy: 'none', 'ffill', 'bfill' or 'linear'
+        limit: Max consecutive days to fill (ffill/bfill), None for no limit
+
+    Returns:
+        np.ndarray: Filled copy of values
+    """
+    if policy not in FILL_POLICIES:
+        raise ValueError(f"Unknown fill policy: {policy}")
+    n = len(values)
+    if policy == 'none' or not observed.any():
+        return values.copy()
+
+    positions = np.arange(n)
+    if policy == 'linear':
+        filled = np.interp(positions, positions[observed], values[observed])
+        inside = (positions >= positions[observed][0]) & (positions <= positions[observed][-1])
+        return np.where(inside, filled, np.nan)
+
+    if policy == 'bfill':
+        return fill_gaps(values[::-1], observed[::-1], 'ffill', limit)[::-1]
+
+    last = np.maximum.accumulate(np.where(observed, positions, -1))
+    filled = np.where(last >= 0, values[np.maximum(last, 0)], np.nan)
+    if limit is not None:
+        filled[(positions - last) > limit] = np.nan
+    return filled
+
+
+def gas_day_from_utc_minutes(utc_minutes):
+    """Gas-day number of each UTC minute (day starts at 06:00 Europe/Rome)"""
+    utc_minutes = np.asarray(utc_minutes, dtype='int64')
+    local = utc_minutes + rome_utc_offset_hours(utc_minutes * 60) * 60
+    return (local - GAS_DAY_START_HOUR * 60) // 1440
+
+
+def gas_day_from_local(timestamps):
+    """Gas-day number of local (Europe/Rome) wall-clock timestamps"""
+    stamps = pd.to_datetime(pd.Series(timestamps).reset_index(drop=True))
+    if stamps.dt.tz is not None:
+        stamps = stamps.dt.tz_convert('Europe/Rome').dt.tz_localize(None)
+    shifted = stamps - pd.Timedelta(hours=GAS_DAY_START_HOUR)
+    return shifted.to_numpy(dtype='datetime64[D]').astype('int64')
+
+
+class GasSeries:
+    """
+    Dense gas-day aligned series sharing one calendar
+
+    Attributes:
+        first_day: Gas-day number of position 0
+        values: {series: filled float64 array}
+        observed: {series: bool array of real observations}
+    """
+
+    def __init__(self, first_day, values, observed):
+        self.first_day = int(first_day)
+        self.values = values
+        self.observed = observed
+        self.n_days = len(next(iter(values.values()))) if values else 0
+
+    @property
+    def names(self):
+        return list(self.values)
+
+    @property
+    def last_day(self):
+        return self.first_day + self.n_days - 1
+
+    def _bounds(self, start, end):
+        """Array positions [lo, hi) of the inclusive gas-day range"""
+        return range_positions(self.first_day, self.n_days, None if start is None else day_number(start),
+                               None if end is None else day_number(end) + 1)
+
+    def slice(self, name, start=None, end=None):
+        """Values of one series for the inclusive gas-day range (array view)"""
+        lo, hi = self._bounds(start, end)
+        return self.values[name][lo:hi]
+
+    def at(self, name, gas_days):
+        """Vectorized lookup of gas-day numbers (NaN outside the calendar)"""
+        positions = np.asarray(gas_days, dtype='int64') - self.first_day
+        inside = (positions >= 0) & (positions < self.n_days)
+        result = np.full(positions.shape, np.nan)
+        result[inside] = self.values[name][positions[inside]]
+        return result
+
+    def at_utc_minutes(self, name, utc_minutes):
+        """Price of the gas day containing each UTC minute (interval data join)"""
+        return self.at(name, gas_day_from_utc_minutes(utc_minutes))
+
+    def frame(self, start=None, end=None, names=None, observed=False):
+        """
+        Aligned DataFrame of several series for the inclusive range
+
+        Args:
+            start, end: Gas days (dates or day numbers), None for open ends
+            names: Series to include (default all)
+            observed: Add an <name>_observed flag column per series
+        """
+        names = names or self.names
+        lo, hi = self._bounds(start, end)
+
+        data = {'GasDay': (np.arange(lo, hi) + self.first_day).astype('datetime64[D]')}
+        for name in names:
+            data[name] = self.values[name][lo:hi]
+            if observed:
+                data[f'{name}_observed'] = self.observed[name][lo:hi]
+        return pd.DataFrame(data)
+
+
+def _source_signature(db_path, fill, limits):
+    """Identify the sources and the fill settings the cache was built from"""
+    files = {}
+    for name, (filename, _) in GAS_SOURCES.items():
+        path = Path(db_path) / filename
+        if path.exists():
+            stat = path.stat()
+            files[name] = [stat.st_mtime_ns, stat.st_size]
+    return json.dumps({'files': files, 'fill': fill, 'limits': limits}, sort_keys=True)
+
+
+def build_gas_series(db_path=DEFAULT_DB_PATH, fill=None, limits=None):
+    """
+    Parse the gas sources onto one dense gas-day calendar
+
+    Args:
+        db_path: Folder with the gas CSV files
+        fill: {series: policy}, merged over DEFAULT_FILL
+        limits: {series: max days to fill}
+
+    Returns:
+        GasSeries
+    """
+    fill = dict(DEFAULT_FILL, **(fill or {}))
+    limits = limits or {}
+
+    parsed = {}
+    for name, (filename, _) in GAS_SOURCES.items():
+        if (Path(db_path) / filename).exists():
+            parsed[name] = READERS[name](db_path)
+    if not parsed:
+        raise FileNotFoundError(f"No gas sources found in {db_path}")
+
+    first_day = min(int(days.min()) for days, _ in parsed.values())
+    last_day = max(int(days.max()) for days, _ in parsed.values())
+    n_days = last_day - first_day + 1
+
+    values, observed = {}, {}
+    for name, (days, data) in parsed.items():
+        dense = np.full(n_days, np.nan)
+        dense[days - first_day] = data
+        mask = ~np.isnan(dense)
+        values[name] = fill_gaps(dense, mask, fill.get(name, 'none'), limits.get(name))
+        observed[name] = mask
+    return GasSeries(first_day, values, observed)
+
+
+def load_gas_series(db_path=DEFAULT_DB_PATH, fill=None, limits=None, use_cache=True):
+    """
+    GasSeries from the cached arrays, rebuilt when a source or setting changed
+    """
+    db_path = Path(db_path)
+    cache_path = db_path / CACHE_FILENAME
+    signature = _source_signature(db_path, dict(DEFAULT_FILL, **(fill or {})), limits or {})
+
+    if use_cache and cache_path.exists():
+        with np.load(cache_path, allow_pickle=False) as cached:
+            if str(cached['signature']) == signature:
+                names = [str(n) for n in cached['names']]
+                return GasSeries(
+                    int(cached['first_day']),
+                    {name: cached[f'values_{i}'] for i, name in enumerate(names)},
+                    {name: cached[f'observed_{i}'] for i, name in enumerate(names)},
+                )
+
+    series = build_gas_series(db_path, fill, limits)
+    if use_cache:
+        arrays = {}
+        for i, name in enumerate(series.names):
+            arrays[f'values_{i}'] = series.values[name]
+            arrays[f'observed_{i}'] = series.observed[name]
+        np.savez(cache_path, signature=signature, names=np.array(series.names),
+                 first_day=series.first_day, **arrays)
+    return series
+
+
+if __name__ == "__main__":
+    series = load_gas_series()
+    print(f"Gas calendar: {np.datetime64(series.first_day, 'D')} "
+          f"to {np.datetime64(series.last_day, 'D')} ({series.n_days:,} gas days)")
+    for name in series.names:
+        observed = series.observed[name]
+        print(f"  - {name} [{GAS_SOURCES[name][1]}]: {int(observed.sum()):,} observed days, "
+              f"policy '{DEFAULT_FILL[name]}'")
+    print(series.frame(start=series.last_day - 9, observed=True))
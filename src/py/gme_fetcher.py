@@ -0,0 +1,382 @@
+"""
+Registry-driven downloader for the GME market results.
+
+Every GME product is one entry of GME_DATASETS: the request parameters of the
+download API (Mercato, Settore, the referring results page and its module/tab
+headers), the XML element its records are stored in, the file suffix of the
+daily files and the folder they are extracted to. Adding a market means adding
+an entry there. Only entries marked 'verified' have had their ModuleId/TabId
+headers checked against the live results page; the others reuse the MGP
+values as placeholders and are not offered by the command line.
+
+A single GMEFetcher serves all products: one requests session with a pooled,
+retrying connection adapter, one CSRF token per results page, and a thread
+pool that schedules the date ranges of every product together. The session
+is the shared on-disk HTTP cache (see http_cache), so ranges that were already
+downloaded cost no request, not even the CSRF page visit.
+"""
+import argparse
+import io
+import os
+import re
+import sys
+import threading
+import xml.etree.ElementTree as ET
+import zipfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from fixed_point import parse_fixed
+from http_cache import default_session
+from instrumentation import span
+
+GME_HOST = 'https://gme.mercatoelettrico.org'
+DOWNLOAD_URL = f'{GME_HOST}/DesktopModules/GmeDownload/API/ExcelDownload/downloadzipfile'
+RESULTS_PAGE = f'{GME_HOST}/en-us/Home/Results/{{page}}/Download'
+SOURCES_PATH = Path(__file__).resolve().parents[2] / 'sources' / 'GME'
+
+DEFAULT_WORKERS = 4
+MAX_RANGE_DAYS = 31  # Longer ranges are split into requests of at most a month
+PAGE_TIMEOUT = 10
+DOWNLOAD_TIMEOUT = 30
+
+BASE_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0.0.0 Safari/537.36',
+    'Accept': 'application/json, text/plain, */*',
+    'Accept-Language': 'en-US,en;q=0.9',
+    'Cache-Control': 'no-cache',
+    'Sec-Fetch-Dest': 'empty',
+    'Sec-Fetch-Mode': 'cors',
+    'Sec-Fetch-Site': 'same-origin',
+    'UserId': '-1',
+}
+CSRF_PATTERN = re.compile(r'<input[^>]*name=["\']__RequestVerificationToken["\'][^>]*value=["\']([^"\']+)["\']')
+
+# Record elements that identify a row rather than hold a value
+XML_KEY_ELEMENTS = ('Data', 'Mercato', 'Ora', 'Periodo')
+
+# product -> download parameters, XML record element, daily file suffix and target folder;
+# 'verified' is False where module_id/tab_id are copied from MGP-Prezzi and not yet checked
+GME_DATASETS = {
+    'MGP-Prezzi': {
+        'page': 'Electricity/MGP', 'valore': 'Prezzi', 'module_id': '12103', 'tab_id': '1749',
+        'market': 'MGP', 'sector': 'Prezzi', 'record': 'Prezzi',
+        'suffix': 'MGPPrezzi.xml', 'folder': SOURCES_PATH / 'EE', 'verified': True,
+    },
+    'MGP-Quantita': {
+        'page': 'Electricity/MGP', 'valore': 'Quantita', 'module_id': '12103', 'tab_id': '1749',
+        'market': 'MGP', 'sector': 'Quantita', 'record': 'Quantita',
+        'suffix': 'MGPQuantita.xml', 'folder': SOURCES_PATH / 'EE', 'verified': False,
+    },
+    **{
+        f'{session}-Prezzi': {
+            'page': 'Electricity/MI', 'valore': 'Prezzi', 'module_id': '12103', 'tab_id': '1749',
+            'market': session, 'sector': 'Prezzi', 'record': 'Prezzi',
+            'suffix': f'{session}Prezzi.xml', 'folder': SOURCES_PATH / 'EE', 'verified': False,
+        }
+        for session in ('MI-A1', 'MI-A2', 'MI-A3')
+    },
+    'MGP-GAS': {
+        'page': 'Gas/MGP-GAS', 'valore': 'Prezzi', 'module_id': '12103', 'tab_id': '1749',
+        'market': 'MGP-GAS', 'sector': 'Prezzi', 'record': 'Prezzi',
+        'suffix': 'MGP-GASPrezzi.xml', 'folder': SOURCES_PATH / 'GAS', 'verified': False,
+    },
+}
+VERIFIED_DATASETS = sorted(name for name, spec in GME_DATASETS.items() if spec['verified'])
+
+
+def parse_gme_xml(xml_file, record='Prezzi', columns=None, fixed_point=False):
+    """
+    Extract the records of a GME XML file
+
+    Hourly files number the intervals of the day in <Ora> (1-25); quarter-hour
+    files number them in <Periodo> (or <Ora>) from 1 to 100.
+
+    Args:
+        xml_file: Path to the XML file
+        record: Element holding one record (GME_DATASETS 'record')
+        columns: Value elements to extract (None for every non-key element);
+            records missing one of them are skipped
+        fixed_point: Return exact int micro-units (see fixed_point), parsed
+            from the text of the whole file at once, instead of floats
+
+    Returns:
+        list: Dicts with Data (YYYYMMDD), Ora (interval of the day) and one
+        float (or int) per value column
+    """
+    records = []
+    texts, targets = [], []
+    root = ET.parse(xml_file).getroot()
+
+    for row in root.findall(record):
+        data_elem = row.find('Data')
+        ora_elem = row.find('Periodo')
+        if ora_elem is None:
+            ora_elem = row.find('Ora')
+        if data_elem is None or ora_elem is None:
+            continue
+
+        if columns is None:
+            value_elems = [e for e in row if e.tag not in XML_KEY_ELEMENTS]
+        else:
+            value_elems = [row.find(column) for column in columns]
+            if any(e is None for e in value_elems):
+                continue
+
+        entry = {'Data': data_elem.text, 'Ora': int(ora_elem.text)}
+        for elem in value_elems:
+            if fixed_point:
+                texts.append(elem.text)
+                targets.append((entry, elem.tag))
+            else:
+                # Values use a decimal comma
+                entry[elem.tag] = float(elem.text.replace(',', '.'))
+        records.append(entry)
+
+    if texts:
+        for (entry, tag), value in zip(targets, parse_fixed(texts).tolist()):
+            entry[tag] = value
+    return records
+
+
+def existing_dates(folder, suffix):
+    """YYYYMMDD dates of the daily files already in folder"""
+    pattern = re.compile(rf'(\d{{8}}){re.escape(suffix)}$')
+    dates = set()
+    if os.path.isdir(folder):
+        for name in os.listdir(folder):
+            match = pattern.search(name)
+            if match:
+                dates.add(match.group(1))
+    return dates
+
+
+def missing_date_ranges(folder, suffix, max_days_back=30, until=None):
+    """
+    Gaps in the daily files of a product, up to tomorrow by default
+
+    The server decides whether the last days are published yet, so the range
+    always reaches tomorrow. With no files, it starts max_days_back days earlier.
+
+    Returns:
+        list: (start, end) YYYYMMDD tuples, inclusive
+    """
+    end = (until or datetime.now() + timedelta(days=1)).date()
+    dates = existing_dates(folder, suffix)
+    if not dates:
+        start = end - timedelta(days=max_days_back)
+        return [(start.strftime('%Y%m%d'), end.strftime('%Y%m%d'))]
+
+    ranges = []
+    day = datetime.strptime(min(dates), '%Y%m%d').date()
+    gap_start = None
+    while day <= end:
+        missing = day.strftime('%Y%m%d') not in dates
+        if missing and gap_start is None:
+            gap_start = day
+        elif not missing and gap_start is not None:
+            ranges.append((gap_start.strftime('%Y%m%d'), (day - timedelta(days=1)).strftime('%Y%m%d')))
+            gap_start = None
+        day += timedelta(days=1)
+    if gap_start is not None:
+        ranges.append((gap_start.strftime('%Y%m%d'), end.strftime('%Y%m%d')))
+    return ranges
+
+
+def split_range(start, end, max_days=MAX_RANGE_DAYS):
+    """Split an inclusive YYYYMMDD range into pieces of at most max_days"""
+    first = datetime.strptime(start, '%Y%m%d')
+    last = datetime.strptime(end, '%Y%m%d')
+    pieces = []
+    while first <= last:
+        piece_end = min(first + timedelta(days=max_days - 1), last)
+        pieces.append((first.strftime('%Y%m%d'), piece_end.strftime('%Y%m%d')))
+        first = piece_end + timedelta(days=1)
+    return pieces
+
+
+def previous_month_start(date):
+    """First day of the month before a YYYYMMDD date (the API's Date parameter)"""
+    first = datetime.strptime(date, '%Y%m%d').replace(day=1)
+    return (first - timedelta(days=1)).replace(day=1).strftime('%Y%m%d')
+
+
+class GMEFetcher:
+    """
+    Pooled downloader shared by every GME product
+
+    Args:
+        workers: Concurrent requests
+        session: Optional requests.Session (default: http_cache.default_session())
+    """
+
+    def __init__(self, workers=DEFAULT_WORKERS, session=None):
+        self.workers = workers
+        self.session = session or default_session()
+        retry = Retry(total=3, backoff_factor=0.5, status_forcelist=(429, 500, 502, 503, 504),
+                      allowed_methods=('GET',))
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=max(workers, 1), max_retries=retry)
+        self.session.mount('https://', adapter)
+        self.session.headers.update(BASE_HEADERS)
+        self._tokens = {}
+        self._lock = threading.Lock()
+
+    def _headers(self, spec):
+        return {
+            'Referer': f"{RESULTS_PAGE.format(page=spec['page'])}?valore={spec['valore']}",
+            'ModuleId': spec['module_id'],
+            'TabId': spec['tab_id'],
+        }
+
+    def csrf_token(self, spec):
+        """Anti-forgery token of a product's results page, fetched once per page
+
+        A failed page visit is not remembered: the next call tries again.
+        """
+        page = spec['page']
+        with self._lock:
+            if self._tokens.get(page):
+                return self._tokens[page]
+            token = None
+            try:
+                response = self.session.get(RESULTS_PAGE.format(page=page), timeout=PAGE_TIMEOUT)
+                if response.status_code == 200:
+                    match = CSRF_PATTERN.search(response.text)
+                    token = match.group(1) if match else None
+                else:
+                    print(f"Page visit failed: {response.status_code}")
+            except requests.RequestException as e:
+                print(f"Warning: Could not get CSRF token: {e}")
+            if token:
+                self._tokens[page] = token
+            return token
+
+    def fetch(self, dataset, start, end):
+        """
+        Download the ZIP of one product and date range
+
+        Returns:
+            bytes: ZIP content, or None on an HTTP error
+        """
+        spec = GME_DATASETS[dataset]
+        params = {
+            'DataInizio': start,
+            'DataFine': end,
+            'Date': previous_month_start(start),
+            'Mercato': spec['market'],
+            'Settore': spec['sector'],
+            'FiltroDate': 'InizioFine',
+        }
+        # The token is only needed when the cache cannot answer on its own
+        is_fresh = getattr(self.session, 'is_fresh', None)
+        if not (is_fresh and is_fresh(DOWNLOAD_URL, params)):
+            token = self.csrf_token(spec)
+            if token:
+                params['__RequestVerificationToken'] = token
+
+        with span('download', dataset=dataset, start=start, end=end) as s:
+            response = self.session.get(DOWNLOAD_URL, params=params, headers=self._headers(spec),
+                                        timeout=DOWNLOAD_TIMEOUT)
+            s.add(bytes=len(response.content), http_status=response.status_code)
+        if response.status_code != 200:
+            print(f"HTTP Error {response.status_code} for {dataset} {start}-{end}")
+            return None
+        return response.content
+
+    def extract(self, dataset, content, output_path=None, overwrite=False):
+        """
+        Write the XML files of a downloaded ZIP
+
+        Returns:
+            list: Paths of the files written
+        """
+        output_path = output_path or GME_DATASETS[dataset]['folder']
+        os.makedirs(output_path, exist_ok=True)
+        written = []
+        with span('unzip', dataset=dataset) as s, zipfile.ZipFile(io.BytesIO(content), 'r') as zip_ref:
+            for name in zip_ref.namelist():
+                if not name.endswith('.xml'):
+                    continue
+                path = os.path.join(output_path, name)
+                if os.path.exists(path) and not overwrite:
+                    print(f"Skipped existing: {name}")
+                    continue
+                xml_content = zip_ref.read(name)
+                with open(path, 'wb') as f:
+                    f.write(xml_content)
+                written.append(path)
+                s.add(rows=1, bytes=len(xml_content))
+                print(f"Downloaded: {name} ({len(xml_content)} bytes)")
+        return written
+
+    def _job(self, dataset, start, end, output_path, overwrite):
+        try:
+            content = self.fetch(dataset, start, end)
+            return self.extract(dataset, content, output_path, overwrite) if content else []
+        except (requests.RequestException, zipfile.BadZipFile) as e:
+            print(f"Error downloading {dataset} {start}-{end}: {e}")
+            return []
+
+    def download(self, jobs, output_paths=None, overwrite=False):
+        """
+        Run (dataset, start, end) jobs of any products on the shared pool
+
+        Args:
+            jobs: Iterable of (dataset, start YYYYMMDD, end YYYYMMDD)
+            output_paths: Optional {dataset: folder} overriding GME_DATASETS
+            overwrite: Replace files that already exist
+
+        Returns:
+            dict: {dataset: list of written XML paths}
+        """
+        output_paths = output_paths or {}
+        pieces = [(dataset, *piece) for dataset, start, end in jobs for piece in split_range(start, end)]
+        results = {dataset: [] for dataset, _, _ in pieces}
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            futures = {
+                pool.submit(self._job, dataset, start, end, output_paths.get(dataset), overwrite): dataset
+                for dataset, start, end in pieces
+            }
+            for future in as_completed(futures):
+                results[futures[future]].extend(future.result())
+        for paths in results.values():
+            paths.sort()
+        return results
+
+
+def plan_missing(datasets, max_days_back=30, output_paths=None):
+    """(dataset, start, end) jobs covering the missing days of each product"""
+    output_paths = output_paths or {}
+    jobs = []
+    for dataset in datasets:
+        spec = GME_DATASETS[dataset]
+        folder = output_paths.get(dataset, spec['folder'])
+        jobs += [(dataset, start, end) for start, end in missing_date_ranges(folder, spec['suffix'], max_days_back)]
+    return jobs
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Download missing GME market results')
+    parser.add_argument('--dataset', action='append', choices=VERIFIED_DATASETS,
+                        help='Products to update (default: MGP-Prezzi)')
+    parser.add_argument('--days-back', type=int, default=30, help='History to fetch for a new product')
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS, help='Concurrent requests')
+    args = parser.parse_args(argv)
+
+    jobs = plan_missing(args.dataset or ['MGP-Prezzi'], args.days_back)
+    if not jobs:
+        print("No missing dates found - all data is up to date!")
+        return 0
+    results = GMEFetcher(args.workers).download(jobs)
+    for dataset, paths in results.items():
+        print(f"{dataset}: {len(paths)} new files")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,278 @@
+"""
+Persistent on-disk cache for the GME HTTP downloads.
+
+Responses are stored under cache/http/ keyed by method, URL and parameters
+(the per-session CSRF token is left out of the key). How long an entry stays
+fresh depends on what it holds (see ttl_for):
+
+    Anno{year}.zip of a closed year              immutable
+    downloadzipfile range ending before this month  immutable
+    range ending this month, before today        CURRENT_TTL seconds
+    range ending today or later                  PENDING_TTL seconds
+    current year archive                         CURRENT_TTL seconds
+    anything else                                not cached
+
+A range reaching today or tomorrow may be answered before GME has published
+its last days, so it is only reused for a few minutes and the next poll sees
+the publication.
+
+A stale entry is revalidated with If-None-Match / If-Modified-Since when the
+server sent an ETag or Last-Modified, so an unchanged file costs a 304. The
+cache is bounded in bytes; the least recently used entries are evicted first.
+
+In offline mode (ONEENERGY_OFFLINE=1) every request is served from the cache,
+stale or not, and a miss raises OfflineError.
+"""
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from urllib.parse import urlencode
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+DEFAULT_CACHE_PATH = Path(__file__).resolve().parents[2] / 'cache' / 'http'
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+CACHE_ENV = 'ONEENERGY_HTTP_CACHE'  # Cache folder, or 'off'
+OFFLINE_ENV = 'ONEENERGY_OFFLINE'
+
+CURRENT_TTL = 3600  # Seconds an entry that may still change stays fresh
+PENDING_TTL = 300  # Ranges that may still be missing their last days (today, tomorrow)
+IMMUTABLE = None
+VOLATILE_PARAMS = ('__RequestVerificationToken',)
+STORED_HEADERS = ('Content-Type', 'ETag', 'Last-Modified', 'Content-Disposition')
+
+ANNUAL_ZIP = re.compile(r'fileName=Anno(\d{4})\.zip', re.IGNORECASE)
+
+
+class OfflineError(requests.ConnectionError):
+    """Offline mode and the response is not cached"""
+
+
+def ttl_for(url, params=None, now=None):
+    """
+    Freshness of a response in seconds (IMMUTABLE for None, 0 to not cache)
+
+    Args:
+        url: Request URL
+        params: Query parameters
+        now: Reference time (default: now)
+    """
+    now = now or datetime.now()
+    params = params or {}
+
+    match = ANNUAL_ZIP.search(url)
+    if match:
+        return IMMUTABLE if int(match.group(1)) < now.year else CURRENT_TTL
+
+    if url.endswith('/downloadzipfile') and 'DataFine' in params:
+        end = str(params['DataFine'])
+        if end < now.strftime('%Y%m01'):
+            return IMMUTABLE
+        return CURRENT_TTL if end < now.strftime('%Y%m%d') else PENDING_TTL
+
+    return 0
+
+
+def cache_key(method, url, params=None):
+    """Stable key of a request, ignoring the per-session parameters"""
+    stable = sorted((k, str(v)) for k, v in (params or {}).items() if k not in VOLATILE_PARAMS)
+    return hashlib.sha256(f"{method.upper()} {url}?{urlencode(stable)}".encode()).hexdigest()
+
+
+class HTTPCache:
+    """
+    Content-addressed store of response bodies and their metadata
+
+    Args:
+        path: Cache folder
+        max_bytes: Total body size kept before evicting
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_bytes=DEFAULT_MAX_BYTES):
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+    def _files(self, key):
+        folder = self.path / key[:2]
+        return folder / f'{key}.body', folder / f'{key}.json'
+
+    def meta(self, key):
+        """Metadata of a cached response (without reading the body), or None"""
+        body_path, meta_path = self._files(key)
+        try:
+            meta = json.loads(meta_path.read_text(encoding='utf-8'))
+        except (OSError, ValueError):
+            return None
+        return meta if body_path.exists() else None
+
+    def get(self, key):
+        """(metadata, body) of a cached response, or None"""
+        body_path, meta_path = self._files(key)
+        try:
+            meta = json.loads(meta_path.read_text(encoding='utf-8'))
+            body = body_path.read_bytes()
+        except (OSError, ValueError):
+            return None
+        if len(body) != meta.get('size'):
+            return None
+        os.utime(body_path)  # Recency for the LRU eviction
+        return meta, body
+
+    def put(self, key, url, body, headers, ttl):
+        """Store a response body and its revalidation headers"""
+        body_path, meta_path = self._files(key)
+        body_path.parent.mkdir(parents=True, exist_ok=True)
+        now = time.time()
+        meta = {
+            'url': url,
+            'size': len(body),
+            'stored_at': now,
+            'expires_at': None if ttl is IMMUTABLE else now + ttl,
+            'headers': {name: headers[name] for name in STORED_HEADERS if name in headers},
+        }
+        # Body first, then metadata, each replaced atomically
+        tmp = body_path.with_name(f'{key}.{os.getpid()}.{threading.get_ident()}.tmp')
+        tmp.write_bytes(body)
+        os.replace(tmp, body_path)
+        tmp = meta_path.with_name(f'{key}.{os.getpid()}.{threading.get_ident()}.tmp')
+        tmp.write_text(json.dumps(meta), encoding='utf-8')
+        os.replace(tmp, meta_path)
+        self.evict()
+        return meta
+
+    def refresh(self, key, meta, ttl):
+        """Extend a revalidated (304) entry"""
+        now = time.time()
+        meta = dict(meta, stored_at=now, expires_at=None if ttl is IMMUTABLE else now + ttl)
+        _, meta_path = self._files(key)
+        meta_path.write_text(json.dumps(meta), encoding='utf-8')
+        return meta
+
+    def entries(self):
+        """(last use time, size, key) of every cached body"""
+        result = []
+        for body_path in self.path.glob('*/*.body'):
+            try:
+                stat = body_path.stat()
+            except OSError:
+                continue
+            result.append((stat.st_mtime, stat.st_size, body_path.stem))
+        return result
+
+    def size(self):
+        return sum(size for _, size, _ in self.entries())
+
+    def evict(self):
+        """Drop least recently used entries until the cache fits max_bytes"""
+        with self._lock:
+            entries = sorted(self.entries())
+            total = sum(size for _, size, _ in entries)
+            for _, size, key in entries:
+                if total <= self.max_bytes:
+                    break
+                for path in self._files(key):
+                    path.unlink(missing_ok=True)
+                total -= size
+
+    def clear(self):
+        for _, _, key in self.entries():
+            for path in self._files(key):
+                path.unlink(missing_ok=True)
+
+
+def _cached_response(url, meta, body, status=200):
+    response = requests.Response()
+    response.status_code = status
+    response._content = body
+    response.url = url
+    response.headers = CaseInsensitiveDict(meta.get('headers', {}))
+    response.from_cache = True
+    return response
+
+
+class CachedSession(requests.Session):
+    """
+    requests.Session that answers GETs from an HTTPCache
+
+    Args:
+        cache: HTTPCache (default: the shared on-disk cache)
+        offline: Serve only from the cache (default: ONEENERGY_OFFLINE)
+        ttl: Freshness policy, ttl_for by default
+    """
+
+    def __init__(self, cache=None, offline=None, ttl=ttl_for):
+        super().__init__()
+        self.cache = cache or HTTPCache()
+        self.offline = offline_mode() if offline is None else offline
+        self.ttl = ttl
+
+    def is_fresh(self, url, params=None):
+        """True when a GET would be answered from the cache without a request"""
+        meta = self.cache.meta(cache_key('GET', url, params))
+        if meta is None:
+            return False
+        expires = meta.get('expires_at')
+        return self.offline or expires is None or expires > time.time()
+
+    def request(self, method, url, params=None, headers=None, **kwargs):
+        ttl = self.ttl(url, params) if method.upper() == 'GET' else 0
+        if ttl == 0:
+            if self.offline:
+                raise OfflineError(f"Offline: {method} {url} is not cacheable")
+            response = super().request(method, url, params=params, headers=headers, **kwargs)
+            response.from_cache = False
+            return response
+
+        key = cache_key(method, url, params)
+        entry = self.cache.get(key)
+        if entry is not None:
+            meta, body = entry
+            expires = meta.get('expires_at')
+            if self.offline or expires is None or expires > time.time():
+                return _cached_response(url, meta, body)
+        elif self.offline:
+            raise OfflineError(f"Offline: {url} is not in the cache")
+
+        # Miss or stale entry: ask the server, conditionally when possible
+        headers = dict(headers or {})
+        if entry is not None:
+            stored = entry[0].get('headers', {})
+            if 'ETag' in stored:
+                headers['If-None-Match'] = stored['ETag']
+            if 'Last-Modified' in stored:
+                headers['If-Modified-Since'] = stored['Last-Modified']
+        response = super().request(method, url, params=params, headers=headers, **kwargs)
+
+        if response.status_code == 304 and entry is not None:
+            meta = self.cache.refresh(key, entry[0], ttl)
+            return _cached_response(url, meta, entry[1])
+        if response.status_code == 200:
+            self.cache.put(key, url, response.content, response.headers, ttl)
+        response.from_cache = False
+        return response
+
+
+def offline_mode():
+    return os.environ.get(OFFLINE_ENV, '').strip().lower() in ('1', 'true', 'yes')
+
+
+def default_session():
+    """CachedSession on the shared cache, or a plain session with ONEENERGY_HTTP_CACHE=off"""
+    setting = os.environ.get(CACHE_ENV, '').strip()
+    if setting.lower() == 'off':
+        return requests.Session()
+    return CachedSession(HTTPCache(setting or DEFAULT_CACHE_PATH))
+
+
+def cached_get(url, params=None, **kwargs):
+    """requests.get through the shared on-disk cache"""
+    with default_session() as session:
+        return session.get(url, params=params, **kwargs)
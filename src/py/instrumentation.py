@@ -0,0 +1,275 @@
+"""
+Per-stage metrics and profiling hooks for the data pipeline.
+
+Wrap a stage in a span (context manager or decorator) to record its wall and
+CPU time, rows, bytes and memory. Each finished span is appended as one JSON
+line to the metrics file, tagged with the run id, so successive nightly runs
+can be compared stage by stage.
+
+Environment variables:
+    ONEENERGY_METRICS         metrics file path, or 'off' (default logs/pipeline_metrics.jsonl)
+    ONEENERGY_TRACE_MEMORY=1  also record peak Python allocations (tracemalloc)
+    ONEENERGY_PROFILE=<span>  profile the named span (pyinstrument if installed, else cProfile)
+
+Usage:
+    with span('parse', files=len(xml_files)) as s:
+        ...
+        s.add(rows=len(records), bytes=total_size)
+
+    @instrumented('convert.pun_mgp')
+    def convert_pun_mgp(db_path): ...
+
+    python src/py/instrumentation.py [metrics_file]   # compare the last two runs
+"""
+import functools
+import json
+import os
+import socket
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parents[2]
+DEFAULT_METRICS_PATH = REPO_ROOT / 'logs' / 'pipeline_metrics.jsonl'
+PROFILE_DIR = REPO_ROOT / 'logs' / 'profiles'
+
+RUN_ID = f"{datetime.now().strftime('%Y%m%dT%H%M%S')}-{os.getpid()}"
+
+_config = {
+    'metrics_path': os.environ.get('ONEENERGY_METRICS', str(DEFAULT_METRICS_PATH)),
+    'trace_memory': os.environ.get('ONEENERGY_TRACE_MEMORY') == '1',
+    'profile': os.environ.get('ONEENERGY_PROFILE'),
+}
+_local = threading.local()
+_write_lock = threading.Lock()
+
+
+def configure(metrics_path=None, trace_memory=None, profile=None):
+    """
+    Override the environment settings
+
+    Args:
+        metrics_path: JSON lines file, or 'off' to disable writing
+        trace_memory: Record peak Python allocations per span
+        profile: Name of the span to profile
+    """
+    if metrics_path is not None:
+        _config['metrics_path'] = str(metrics_path)
+    if trace_memory is not None:
+        _config['trace_memory'] = trace_memory
+    if profile is not None:
+        _config['profile'] = profile
+
+
+def peak_rss_mb():
+    """Peak resident set size of the process in MB (None if unavailable)"""
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 1024 / 1024 if sys.platform == 'darwin' else peak / 1024
+    except ImportError:
+        pass
+    try:
+        import psutil
+        info = psutil.Process().memory_info()
+        return getattr(info, 'peak_wset', info.rss) / 1024 / 1024
+    except ImportError:
+        return None
+
+
+class Span:
+    """A running stage; counters can be added until it ends"""
+
+    def __init__(self, name, parent=None, **attrs):
+        self.name = name
+        self.path = f"{parent.path}/{name}" if parent else name
+        self.attrs = attrs
+        self.rows = 0
+        self.bytes = 0
+        self.peak_alloc = 0
+
+    def add(self, rows=0, bytes=0, **attrs):
+        """Accumulate rows/bytes processed and extra attributes"""
+        self.rows += rows or 0
+        self.bytes += bytes or 0
+        self.attrs.update(attrs)
+
+
+def _emit(record):
+    path = _config['metrics_path']
+    if not path or path == 'off':
+        return
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with _write_lock, open(path, 'a', encoding='utf-8') as f:
+        f.write(json.dumps(record, default=str) + '\n')
+
+
+@contextmanager
+def _profiler(span_obj):
+    """Profile the block if it is the selected span"""
+    target = _config['profile']
+    if not target or target not in (span_obj.name, span_obj.path):
+        yield
+        return
+
+    PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+    stem = PROFILE_DIR / f"{span_obj.path.replace('/', '.')}-{RUN_ID}"
+    try:
+        from pyinstrument import Profiler
+    except ImportError:
+        Profiler = None
+
+    if Profiler is not None:
+        # Sampling profiler: low overhead, readable call tree
+        profiler = Profiler()
+        profiler.start()
+        try:
+            yield
+        finally:
+            profiler.stop()
+            Path(f"{stem}.html").write_text(profiler.output_html(), encoding='utf-8')
+            span_obj.attrs['profile'] = f"{stem}.html"
+    else:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            profiler.dump_stats(f"{stem}.prof")
+            span_obj.attrs['profile'] = f"{stem}.prof"
+
+
+@contextmanager
+def span(name, **attrs):
+    """
+    Measure a pipeline stage
+
+    Args:
+        name: Stage name (nested spans are recorded as parent/child)
+        **attrs: Extra attributes stored with the record
+
+    Yields:
+        Span: call .add(rows=..., bytes=...) to record volumes
+    """
+    stack = getattr(_local, 'stack', None)
+    if stack is None:
+        stack = _local.stack = []
+    parent = stack[-1] if stack else None
+    current = Span(name, parent, **attrs)
+    stack.append(current)
+
+    trace = _config['trace_memory']
+    started_tracing = False
+    if trace:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            started_tracing = True
+        # Resetting the peak would hide the parent's peak so far: keep it on the parent
+        if parent is not None:
+            parent.peak_alloc = max(parent.peak_alloc, tracemalloc.get_traced_memory()[1])
+        tracemalloc.reset_peak()
+
+    status = 'ok'
+    start_wall, start_cpu = time.perf_counter(), time.process_time()
+    started_at = datetime.now().isoformat(timespec='milliseconds')
+    try:
+        with _profiler(current):
+            yield current
+    except BaseException as e:
+        status = f"error: {type(e).__name__}"
+        raise
+    finally:
+        wall = time.perf_counter() - start_wall
+        cpu = time.process_time() - start_cpu
+        record = {
+            'run_id': RUN_ID,
+            'host': socket.gethostname(),
+            'span': current.path,
+            'started_at': started_at,
+            'wall_s': round(wall, 6),
+            'cpu_s': round(cpu, 6),
+            'rows': current.rows,
+            'bytes': current.bytes,
+            'rows_per_s': round(current.rows / wall, 1) if current.rows and wall > 0 else None,
+            'peak_rss_mb': peak_rss_mb(),
+            'status': status,
+        }
+        if trace and tracemalloc.is_tracing():
+            current.peak_alloc = max(current.peak_alloc, tracemalloc.get_traced_memory()[1])
+            record['peak_alloc_mb'] = round(current.peak_alloc / 1024 / 1024, 3)
+            if parent is not None:
+                parent.peak_alloc = max(parent.peak_alloc, current.peak_alloc)
+            if started_tracing:
+                tracemalloc.stop()
+        record.update(current.attrs)
+        stack.pop()
+        _emit(record)
+
+
+def instrumented(name=None):
+    """Decorator running the function inside a span (named after it by default)"""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name or fn.__name__):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def read_metrics(path=None):
+    """Load every record of a metrics file"""
+    path = Path(path or _config['metrics_path'])
+    if not path.exists():
+        return []
+    with open(path, encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def stage_totals(records, run_id):
+    """Wall/CPU seconds and rows per span for one run"""
+    totals = {}
+    for record in records:
+        if record['run_id'] != run_id:
+            continue
+        total = totals.setdefault(record['span'], {'wall_s': 0.0, 'cpu_s': 0.0, 'rows': 0, 'calls': 0})
+        total['wall_s'] += record['wall_s']
+        total['cpu_s'] += record['cpu_s']
+        total['rows'] += record.get('rows') or 0
+        total['calls'] += 1
+    return totals
+
+
+def compare_runs(path=None):
+    """Print the last run's stages next to the previous run's"""
+    records = read_metrics(path)
+    run_ids = list(dict.fromkeys(record['run_id'] for record in records))
+    if not run_ids:
+        print("No metrics recorded yet")
+        return
+
+    current = stage_totals(records, run_ids[-1])
+    previous = stage_totals(records, run_ids[-2]) if len(run_ids) > 1 else {}
+
+    print(f"Run {run_ids[-1]}" + (f" vs {run_ids[-2]}" if previous else ""))
+    print(f"{'stage':<40}{'calls':>6}{'wall s':>10}{'cpu s':>10}{'rows':>12}{'prev wall s':>13}{'change':>9}")
+    print("-" * 100)
+    for stage, total in current.items():
+        before = previous.get(stage)
+        change = ""
+        if before and before['wall_s'] > 0:
+            change = f"{(total['wall_s'] / before['wall_s'] - 1) * 100:+.0f}%"
+        prev_wall = f"{before['wall_s']:.3f}" if before else "-"
+        print(f"{stage:<40}{total['calls']:>6}{total['wall_s']:>10.3f}{total['cpu_s']:>10.3f}"
+              f"{total['rows']:>12,}{prev_wall:>13}{change:>9}")
+
+
+if __name__ == "__main__":
+    compare_runs(sys.argv[1] if len(sys.argv) > 1 else None)
@@ -0,0 +1,408 @@
+"""
+Dense day x interval storage for price series at any resolution.
+
+A series is kept as a float32 matrix with one row per local day and a fixed
+stride of MAX_INTERVALS_PER_DAY[minutes] columns (25 hours or 100
+quarter-hours), so the longest DST day fits and every other day is padded
+with NaN. Day and month rollups become reductions along an axis, hourly
+values of a quarter-hour series are a reshape, and a date range is a row
+slice whatever the resolution.
+
+Because local days are contiguous in UTC, the valid slots read row by row
+are exactly the consecutive UTC intervals of the series (see utc_array).
+
+The matrix is cached under db/dense/ as a .npy file (memory-mapped on load),
+keyed by the source file's mtime and size, next to its flat UTC-ordered copy
+(utc.npy) which utc_array maps instead of copying, so a PriceSeries over the
+cache is backed by that file too.
+"""
+import json
+import os
+import warnings
+from contextlib import contextmanager
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from download_and_read_excel import (
+    FASCIA_LABELS, MAX_INTERVALS_PER_DAY, yyyymmdd_to_day_number, midnight_utc_offset_hours,
+    get_fascia_codes, intervals_per_day, interval_gme_hours, infer_resolution_minutes
+)
+from fixed_point import decimal_to_fixed, fixed_mean, from_fixed, group_stats, price_values
+
+DEFAULT_DB_PATH = Path(__file__).resolve().parents[2] / 'db'
+CACHE_DIRNAME = 'dense'
+
+# Parquet schema metadata key holding the resolution of a price file
+RESOLUTION_KEY = b'oneenergy.resolution_minutes'
+# Day-interval column names, hourly first
+INTERVAL_COLUMNS = ('Hour', 'Interval')
+
+ROLLUP_LEVELS = ('day', 'month', 'fascia')
+
+
+def day_number(day):
+    """Day number of a date, timestamp or day number"""
+    if isinstance(day, (int, np.integer)):
+        return int(day)
+    return int(np.datetime64(pd.Timestamp(day).date(), 'D').astype('int64'))
+
+
+def range_positions(first, length, start=None, end=None):
+    """
+    Array positions [lo, hi) of the numbers [start, end) in an array whose
+    position 0 holds number first, clipped to the array (None: open end)
+    """
+    lo = 0 if start is None else min(max(int(start) - first, 0), length)
+    hi = length if end is None else min(max(int(end) - first, lo), length)
+    return lo, hi
+
+
+@contextmanager
+def _ignore_nan_warnings():
+    """Silence 'All-NaN slice' / 'Mean of empty slice' on fully missing days"""
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        yield
+
+
+class IntervalStore:
+    """
+    One price series as a dense (days x stride) matrix
+
+    Attributes:
+        first_day: Day number of row 0
+        minutes: Resolution (60 or 15)
+        values: float32 array of shape (n_days, stride), NaN where missing
+    """
+
+    def __init__(self, first_day, minutes, values):
+        if minutes not in MAX_INTERVALS_PER_DAY:
+            raise ValueError(f"Unsupported resolution: {minutes} minutes")
+        self.first_day = int(first_day)
+        self.minutes = int(minutes)
+        self.values = values
+        self.n_days, self.stride = values.shape
+        self.days = np.arange(self.n_days, dtype='int64') + self.first_day
+        self.counts = intervals_per_day(self.days, self.minutes)
+        self._fascia = None
+        self._utc_file = None  # Saved flat UTC copy (see save), mapped by utc_array
+        self._mmap_mode = None
+
+    @classmethod
+    def from_records(cls, days, intervals, values, minutes=None):
+        """
+        Build from long (day, 1-based interval, value) records
+
+        Args:
+            days: Day numbers
+            intervals: Interval of the day (GME hour 1-25, or quarter-hour 1-100)
+            values: Prices
+            minutes: Resolution, inferred from the intervals if None
+
+        Raises:
+            ValueError: If an interval does not exist on its day
+        """
+        days = np.asarray(days, dtype='int64')
+        intervals = np.asarray(intervals, dtype='int64')
+        minutes = minutes or infer_resolution_minutes(intervals)
+
+        bad = (intervals < 1) | (intervals > intervals_per_day(days, minutes))
+        if bad.any():
+            first_bad = int(np.argmax(bad))
+            raise ValueError(
+                f"{int(bad.sum())} intervals outside their day, first: day "
+                f"{np.datetime64(days[first_bad], 'D')} interval {intervals[first_bad]}"
+            )
+
+        first_day = int(days.min())
+        dense = np.full((int(days.max()) - first_day + 1, MAX_INTERVALS_PER_DAY[minutes]),
+                        np.nan, dtype='float32')
+        dense[days - first_day, intervals - 1] = np.asarray(values, dtype='float32')
+        return cls(first_day, minutes, dense)
+
+    @property
+    def last_day(self):
+        return self.first_day + self.n_days - 1
+
+    @property
+    def mask(self):
+        """True on the slots that exist on their day (not the DST padding)"""
+        return np.arange(self.stride)[None, :] < self.counts[:, None]
+
+    def _bounds(self, start, end):
+        """Row positions [lo, hi) of the inclusive day range"""
+        return range_positions(self.first_day, self.n_days, None if start is None else day_number(start),
+                               None if end is None else day_number(end) + 1)
+
+    def slice(self, start=None, end=None):
+        """(days x stride) view of the inclusive day range"""
+        lo, hi = self._bounds(start, end)
+        return self.values[lo:hi]
+
+    def records(self, start=None, end=None, value_col='PUN'):
+        """Long Date / Interval / value frame of the existing slots in the range"""
+        lo, hi = self._bounds(start, end)
+        rows, slots = np.nonzero(self.mask[lo:hi])
+        return pd.DataFrame({
+            'Date': (self.days[lo:hi][rows]).astype('datetime64[D]'),
+            'Interval': (slots + 1).astype('int16'),
+            value_col: self.values[lo:hi][rows, slots],
+        })
+
+    def utc_array(self, dtype='float64'):
+        """
+        The series as a flat array indexed by UTC interval number
+
+        A store opened from the cache returns its saved float32 copy memory-mapped
+        (no heap copy); otherwise the valid slots are gathered into a new array.
+
+        Returns:
+            tuple: (first interval number, minutes, array with NaN gaps)
+        """
+        first_minute = self.first_day * 1440 - int(midnight_utc_offset_hours(self.first_day)) * 60
+        if self._utc_file is not None and np.dtype(dtype) == np.float32:
+            values = np.load(self._utc_file, mmap_mode=self._mmap_mode)
+        else:
+            values = self.values[self.mask].astype(dtype, copy=False)
+        return first_minute // self.minutes, self.minutes, values
+
+    def resample(self, minutes):
+        """Coarser copy (mean of the sub-intervals), e.g. quarter-hours to hours"""
+        if minutes == self.minutes:
+            return self
+        factor, remainder = divmod(minutes, self.minutes)
+        if remainder or minutes not in MAX_INTERVALS_PER_DAY:
+            raise ValueError(f"Cannot resample {self.minutes} to {minutes} minutes")
+        blocks = self.values.reshape(self.n_days, self.stride // factor, factor)
+        with _ignore_nan_warnings():
+            coarse = np.nanmean(blocks, axis=2).astype('float32')
+        return IntervalStore(self.first_day, minutes, coarse)
+
+    def fascia_codes(self):
+        """(days x stride) fascia codes of every slot (0 on the padding)"""
+        if self._fascia is None:
+            hours = interval_gme_hours(np.arange(1, self.stride + 1), self.minutes)
+            codes = get_fascia_codes(self.days[:, None], hours[None, :])
+            codes[~self.mask] = 0
+            self._fascia = codes
+        return self._fascia
+
+    def rollup(self, level='day', start=None, end=None):
+        """
+        Mean, min, max and observed count per day, month or (month, fascia)
+
+        Returns:
+            pd.DataFrame: Keys of the level, Mean, Min, Max, Count
+        """
+        if level not in ROLLUP_LEVELS:
+            raise ValueError(f"Unknown rollup level: {level}")
+        lo, hi = self._bounds(start, end)
+        block = self.values[lo:hi]
+        days = self.days[lo:hi].astype('datetime64[D]')
+
+        if level == 'fascia':
+            observed = ~np.isnan(block)
+            rows, slots = np.nonzero(observed)
+            frame = pd.DataFrame({
+                'Month': days[rows].astype('datetime64[M]'),
+                'Fascia': FASCIA_LABELS[self.fascia_codes()[lo:hi][rows, slots]],
+                'Value': block[rows, slots],
+            })
+            result = frame.groupby(['Month', 'Fascia'], sort=True)['Value'].agg(['mean', 'min', 'max', 'count'])
+            return result.rename(columns=str.capitalize).reset_index()
+
+        counts = (~np.isnan(block)).sum(axis=1)
+        sums = np.nansum(block, axis=1, dtype='float64')
+        with _ignore_nan_warnings():
+            mins, maxs = np.nanmin(block, axis=1), np.nanmax(block, axis=1)
+
+        if level == 'day':
+            keys = {'Date': days}
+        elif len(days):
+            # Rows are consecutive days, so months are contiguous runs
+            months = days.astype('datetime64[M]')
+            starts = np.flatnonzero(np.r_[True, months[1:] != months[:-1]])
+            keys = {'Month': months[starts]}
+            counts = np.add.reduceat(counts, starts)
+            sums = np.add.reduceat(sums, starts)
+            mins = np.fmin.reduceat(mins, starts)
+            maxs = np.fmax.reduceat(maxs, starts)
+        else:
+            keys = {'Month': days.astype('datetime64[M]')}
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            means = np.where(counts > 0, sums / counts, np.nan)
+        return pd.DataFrame(dict(keys, Mean=means, Min=mins, Max=maxs, Count=counts))
+
+    def save(self, folder, signature=''):
+        """Write values.npy, the flat float32 UTC copy utc.npy and meta.json to folder"""
+        folder = Path(folder)
+        folder.mkdir(parents=True, exist_ok=True)
+        # Replace files atomically (values first) so concurrent readers never see a partial store
+        arrays = {'values': np.ascontiguousarray(self.values), 'utc': self.utc_array('float32')[2]}
+        for name, array in arrays.items():
+            tmp = folder / f'{name}.{os.getpid()}.tmp'
+            with open(tmp, 'wb') as f:
+                np.save(f, array)
+            os.replace(tmp, folder / f'{name}.npy')
+        meta = {'first_day': self.first_day, 'minutes': self.minutes, 'signature': signature}
+        tmp = folder / f'meta.{os.getpid()}.tmp'
+        tmp.write_text(json.dumps(meta), encoding='utf-8')
+        os.replace(tmp, folder / 'meta.json')
+
+    @classmethod
+    def load(cls, folder, mmap_mode='r'):
+        """Open a saved store (memory-mapped by default)"""
+        folder = Path(folder)
+        meta = json.loads((folder / 'meta.json').read_text(encoding='utf-8'))
+        values = np.load(folder / 'values.npy', mmap_mode=mmap_mode)
+        store = cls(meta['first_day'], meta['minutes'], values)
+        if (folder / 'utc.npy').exists():  # Caches written before utc.npy existed rebuild it on demand
+            store._utc_file, store._mmap_mode = folder / 'utc.npy', mmap_mode
+        return store
+
+
+def read_interval_dataset(db_path, dataset='PUN-MGP', value_col='PUN'):
+    """
+    Read a Date / interval / price file, Parquet first, CSV otherwise
+
+    Args:
+        db_path: Folder with <dataset>.parquet or <dataset>.csv
+        dataset: File stem (PUN-MGP, PUN-MGP-15, ...)
+        value_col: Price column
+
+    Returns:
+        tuple: (day numbers, 1-based intervals, values, minutes)
+    """
+    db_path = Path(db_path)
+    parquet_path = db_path / f'{dataset}.parquet'
+    if parquet_path.exists():
+        schema = pq.read_schema(parquet_path)
+        interval_col = next(c for c in INTERVAL_COLUMNS if c in schema.names)
+        table = pq.read_table(parquet_path, columns=['Date', interval_col, value_col])
+        df = table.select(['Date', interval_col]).to_pandas()
+        days = df['Date'].to_numpy(dtype='datetime64[D]').astype('int64')
+        values = price_values(table[value_col])  # float or fixed-point decimal
+        stored = (schema.metadata or {}).get(RESOLUTION_KEY)
+        minutes = int(stored) if stored else None
+    else:
+        df = pd.read_csv(db_path / f'{dataset}.csv', sep=';', encoding='utf-8-sig')
+        df = df.rename(columns={'Data': 'Date', 'Ora': 'Hour'})  # PUN_CM files written by days.py
+        interval_col = next(c for c in INTERVAL_COLUMNS if c in df.columns)
+        days = yyyymmdd_to_day_number(df['Date'].to_numpy())
+        values = df[value_col].to_numpy(dtype='float64')
+        minutes = None
+
+    intervals = df[interval_col].to_numpy(dtype='int64')
+    minutes = minutes or infer_resolution_minutes(intervals)
+    return days, intervals, values, minutes
+
+
+def read_fixed_dataset(db_path, dataset='PUN-MGP', value_col='PUN'):
+    """
+    Exact prices of a Parquet file written in fixed point (see fixed_point)
+
+    Returns:
+        tuple: (day numbers, 1-based intervals, int64 micro-units, minutes) of
+        the priced rows, or None when there is no Parquet file or the price
+        column is not decimal
+    """
+    parquet_path = Path(db_path) / f'{dataset}.parquet'
+    if not parquet_path.exists():
+        return None
+    schema = pq.read_schema(parquet_path)
+    if value_col not in schema.names or not pa.types.is_decimal(schema.field(value_col).type):
+        return None
+    interval_col = next(c for c in INTERVAL_COLUMNS if c in schema.names)
+    table = pq.read_table(parquet_path, columns=['Date', interval_col, value_col])
+    priced = table[value_col].is_valid().to_numpy(zero_copy_only=False)
+    days = table['Date'].to_numpy().astype('datetime64[D]').astype('int64')[priced]
+    intervals = table[interval_col].to_numpy().astype('int64')[priced]
+    micro = decimal_to_fixed(table[value_col])[priced]
+    stored = (schema.metadata or {}).get(RESOLUTION_KEY)
+    minutes = int(stored) if stored else infer_resolution_minutes(intervals)
+    return days, intervals, micro, minutes
+
+
+def fixed_rollup(days, intervals, micro, minutes, level='day', start=None, end=None):
+    """
+    IntervalStore.rollup computed on exact micro-units (see read_fixed_dataset)
+
+    Sums and means are exact integers, so totals match the published prices
+    to the last decimal; the mean is rounded half away from zero.
+
+    Returns:
+        pd.DataFrame: Keys of the level, Mean, Min, Max, Count
+    """
+    if level not in ROLLUP_LEVELS:
+        raise ValueError(f"Unknown rollup level: {level}")
+    lo = -np.inf if start is None else day_number(start)
+    hi = np.inf if end is None else day_number(end)
+    keep = (days >= lo) & (days <= hi)
+    days, intervals, micro = days[keep], intervals[keep], micro[keep]
+
+    if level == 'day':
+        keys = days
+    else:
+        keys = days.astype('datetime64[D]').astype('datetime64[M]').astype('int64')
+        if level == 'fascia':
+            codes = get_fascia_codes(days, interval_gme_hours(intervals, minutes))
+            keys = keys * len(FASCIA_LABELS) + codes
+    unique, sums, counts, mins, maxs = group_stats(keys, micro)
+
+    if level == 'day':
+        columns = {'Date': unique.astype('datetime64[D]')}
+    elif level == 'month':
+        columns = {'Month': unique.astype('datetime64[M]')}
+    else:
+        months, codes = np.divmod(unique, len(FASCIA_LABELS))
+        columns = {'Month': months.astype('datetime64[M]'), 'Fascia': FASCIA_LABELS[codes]}
+    return pd.DataFrame(dict(columns, Mean=from_fixed(fixed_mean(sums, counts)),
+                             Min=from_fixed(mins), Max=from_fixed(maxs), Count=counts))
+
+
+def source_signature(db_path, dataset):
+    """Identify the source file the cache was built from"""
+    for suffix in ('.parquet', '.csv'):
+        path = Path(db_path) / f'{dataset}{suffix}'
+        if path.exists():
+            stat = path.stat()
+            return f"{path.name}:{stat.st_mtime_ns}:{stat.st_size}"
+    raise FileNotFoundError(f"No {dataset}.parquet or {dataset}.csv in {db_path}")
+
+
+def load_interval_store(db_path=DEFAULT_DB_PATH, dataset='PUN-MGP', value_col='PUN', use_cache=True):
+    """
+    IntervalStore of a price dataset, from the dense cache when up to date
+    """
+    db_path = Path(db_path)
+    signature = source_signature(db_path, dataset)
+    cache = db_path / CACHE_DIRNAME / f'{dataset}.{value_col}'
+
+    if use_cache and (cache / 'meta.json').exists():
+        meta = json.loads((cache / 'meta.json').read_text(encoding='utf-8'))
+        if meta.get('signature') == signature:
+            return IntervalStore.load(cache)
+
+    days, intervals, values, minutes = read_interval_dataset(db_path, dataset, value_col)
+    store = IntervalStore.from_records(days, intervals, values, minutes)
+    if use_cache:
+        store.save(cache, signature)
+        store = IntervalStore.load(cache)  # Memory-mapped, like a cache hit
+    return store
+
+
+if __name__ == "__main__":
+    for dataset in ('PUN-MGP', 'PUN-MGP-15'):
+        try:
+            store = load_interval_store(dataset=dataset)
+        except FileNotFoundError:
+            continue
+        print(f"{dataset}: {store.minutes}-minute intervals, {store.n_days:,} days "
+              f"({np.datetime64(store.first_day, 'D')} to {np.datetime64(store.last_day, 'D')}), "
+              f"stride {store.stride}")
+        print(store.rollup('month').tail(3).to_string(index=False))
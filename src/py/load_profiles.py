@@ -0,0 +1,494 @@
+"""
+Load-profile similarity index across PODs.
+
+Every POD-day of 15-minute CONSUMO_ATTIVA_PRELEVATA readings becomes a load
+shape: 96 quarter-hours of local clock time, divided by the day's mean, so a
+flat day is all ones and the shape does not depend on the POD's size. On the
+short DST day the missing 02:00-03:00 slots are interpolated, on the long day
+the repeated hour is averaged.
+
+Shapes are clustered with mini-batch k-means (vectorized distance matrices
+over batches of BATCH_DAYS shapes, centroids moved as running means), so
+an update costs one pass over the new days only. The index keeps, as sums
+that later months simply add to:
+
+    per POD        shape sums per day type, days per cluster
+    per cluster    shape sums per day type (the typical shapes)
+
+A POD's profile is its mean weekday, Saturday and holiday shape side by side.
+Similarity queries compare one profile with all of them in a single
+matrix-vector product, so they stay in milliseconds for thousands of PODs
+without any pairwise table.
+
+The index is saved as db/profiles/load_profiles.npz with the (mtime, size)
+of every meter file it has read and the last day taken from each POD: an
+update skips unchanged files and adds only the days after a POD's last day.
+
+    python src/py/load_profiles.py                        # build or update
+    python src/py/load_profiles.py --similar IT001E90000003
+    python src/py/load_profiles.py --cluster 2 --day-type weekday
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from cost_engine import DEFAULT_CHUNK_ROWS, ENERGY_COLUMN, METER_COLUMNS, iter_meter_chunks, meter_utc_minutes
+from download_and_read_excel import HOLIDAY_MMDD, day_number_to_yyyymmdd
+from instrumentation import span
+
+DEFAULT_DB_PATH = Path(__file__).resolve().parents[2] / 'db'
+PROFILES_DIRNAME = 'profiles'
+INDEX_FILENAME = 'load_profiles.npz'
+INDEX_FORMAT = 1
+
+SLOTS = 96  # Quarter-hours of local clock time
+MIN_SLOTS = 88  # Days with more missing slots are left out
+DAY_TYPES = ('weekday', 'saturday', 'holiday')  # Sundays and HOLIDAY_MMDD are holidays
+
+DEFAULT_CLUSTERS = 8
+BATCH_DAYS = 4096  # Shapes per mini-batch
+FLUSH_DAYS = 200_000  # New shapes held in memory before they are clustered
+INIT_EPOCHS = 5  # Passes over the first shapes after k-means++ seeding
+
+
+def day_type_codes(days):
+    """Index into DAY_TYPES of each day number"""
+    days = np.asarray(days, dtype='int64')
+    weekday = (days + 3) % 7
+    codes = np.where(weekday == 5, 1, 0)
+    holiday = (weekday == 6) | np.isin(day_number_to_yyyymmdd(days) % 10000, HOLIDAY_MMDD)
+    return np.where(holiday, 2, codes).astype('int8')
+
+
+def day_shapes(pods, days, slots, values):
+    """
+    Normalized load shape of every complete POD-day
+
+    Args:
+        pods: POD of each reading
+        days: Local day number of each reading
+        slots: Quarter-hour of local clock time (0-95)
+        values: kWh of each reading
+
+    Returns:
+        tuple: (POD array, int64 day numbers, float32 (n, SLOTS) shapes with mean 1)
+    """
+    pod_codes, unique_pods = pd.factorize(np.asarray(pods))
+    keys = pod_codes.astype('int64') << 32 | np.asarray(days, dtype='int64')
+    unique_keys, rows = np.unique(keys, return_inverse=True)
+    n = len(unique_keys)
+    cells = rows * SLOTS + slots
+    sums = np.bincount(cells, weights=values, minlength=n * SLOTS).reshape(n, SLOTS)
+    counts = np.bincount(cells, minlength=n * SLOTS).reshape(n, SLOTS)
+
+    present = counts > 0
+    with np.errstate(invalid='ignore', divide='ignore'):
+        shapes = sums / counts  # The repeated DST hour is averaged
+    complete = present.sum(axis=1) >= MIN_SLOTS
+    for row in np.flatnonzero(complete & ~present.all(axis=1)):
+        known = np.flatnonzero(present[row])
+        shapes[row] = np.interp(np.arange(SLOTS), known, shapes[row, known])
+
+    totals = np.where(complete, np.nan_to_num(shapes).sum(axis=1), 0)
+    keep = totals > 0
+    shapes = (shapes[keep] * (SLOTS / totals[keep, None])).astype('float32')
+    return unique_pods[unique_keys[keep] >> 32], unique_keys[keep] & 0xFFFFFFFF, shapes
+
+
+def read_day_shapes(path, chunk_rows=DEFAULT_CHUNK_ROWS):
+    """
+    Day shapes of a meter file (CSV or Parquet), see day_shapes
+
+    Readings are gathered over all chunks first, since a day may span two.
+    """
+    parts = []
+    for chunk in iter_meter_chunks(path, chunk_rows, METER_COLUMNS):
+        times = chunk['ORA'].to_numpy(dtype='int64')
+        _, valid, days = meter_utc_minutes(chunk['DATA'].to_numpy(), times, chunk['FL_ORA_LEGALE'].to_numpy())
+        values = pd.to_numeric(chunk[ENERGY_COLUMN], errors='coerce').to_numpy(dtype='float64')
+        valid &= ~np.isnan(values)
+        slots = (times // 10000) * 4 + (times // 100) % 100 // 15
+        parts.append((chunk['POD'].to_numpy()[valid], days[valid], slots[valid], values[valid]))
+    if not parts:
+        return np.empty(0, dtype=object), np.zeros(0, dtype='int64'), np.zeros((0, SLOTS), dtype='float32')
+    return day_shapes(*(np.concatenate(columns) for columns in zip(*parts)))
+
+
+def squared_distances(points, centroids):
+    """(n, k) squared Euclidean distances as one matrix product"""
+    distances = (points * points).sum(axis=1)[:, None] - 2 * points @ centroids.T \
+        + (centroids * centroids).sum(axis=1)[None, :]
+    return np.maximum(distances, 0)
+
+
+def add_grouped(target, keys, values):
+    """target[key] += the sum of values per key (a sort and reduceat instead of np.add.at)"""
+    order = np.argsort(keys, kind='stable')
+    unique, starts = np.unique(keys[order], return_index=True)
+    target[unique] += np.add.reduceat(values[order], starts, axis=0)
+
+
+def file_signature(path):
+    """[mtime_ns, size] of a meter file; latest mtime and total size of a partitioned folder"""
+    path = Path(path)
+    stats = [file.stat() for file in sorted(path.rglob('*.parquet'))] if path.is_dir() else [path.stat()]
+    return [max((stat.st_mtime_ns for stat in stats), default=0), sum(stat.st_size for stat in stats)]
+
+
+def kmeans_plus_plus(points, k, rng):
+    """k-means++ seeding: each next centroid drawn with probability ~ squared distance"""
+    centroids = [points[rng.integers(len(points))]]
+    closest = squared_distances(points, centroids[0][None, :])[:, 0]
+    for _ in range(1, k):
+        total = closest.sum()
+        pick = rng.integers(len(points)) if total <= 0 else rng.choice(len(points), p=closest / total)
+        centroids.append(points[pick])
+        closest = np.minimum(closest, squared_distances(points, points[pick][None, :])[:, 0])
+    return np.array(centroids, dtype='float32')
+
+
+class ProfileIndex:
+    """
+    Clustered load shapes and POD profiles, updated month by month
+
+    Args:
+        centroids: (clusters, SLOTS) cluster centres
+        centroid_days: (clusters,) shapes each centre has absorbed
+        cluster_sums: (clusters, day types, SLOTS) shape sums of the members
+        cluster_days: (clusters, day types) member days
+        pods: POD codes
+        pod_sums: (PODs, day types, SLOTS) shape sums
+        pod_days: (PODs, day types) days
+        pod_clusters: (PODs, clusters) days per cluster
+        last_days: (PODs,) last day number taken from each POD
+        fingerprints: {meter file: [mtime_ns, size]} already read
+        seed: Random seed of the k-means seeding
+    """
+
+    ARRAYS = ('centroids', 'centroid_days', 'cluster_sums', 'cluster_days',
+              'pods', 'pod_sums', 'pod_days', 'pod_clusters', 'last_days')
+
+    def __init__(self, n_clusters=DEFAULT_CLUSTERS, seed=0, fingerprints=None, **arrays):
+        self.n_clusters = int(n_clusters)
+        self.seed = int(seed)
+        self.fingerprints = fingerprints or {}
+        k, types = self.n_clusters, len(DAY_TYPES)
+        self.centroids = arrays.get('centroids', np.zeros((0, SLOTS), dtype='float32'))
+        self.centroid_days = arrays.get('centroid_days', np.zeros(k, dtype='int64'))
+        self.cluster_sums = arrays.get('cluster_sums', np.zeros((k, types, SLOTS)))
+        self.cluster_days = arrays.get('cluster_days', np.zeros((k, types), dtype='int64'))
+        self.pods = arrays.get('pods', np.zeros(0, dtype='U'))
+        self.pod_sums = arrays.get('pod_sums', np.zeros((0, types, SLOTS)))
+        self.pod_days = arrays.get('pod_days', np.zeros((0, types), dtype='int64'))
+        self.pod_clusters = arrays.get('pod_clusters', np.zeros((0, k), dtype='int64'))
+        self.last_days = arrays.get('last_days', np.zeros(0, dtype='int64'))
+        self._pod_rows = {pod: row for row, pod in enumerate(self.pods)}
+        self._profiles = None
+
+    @property
+    def n_days(self):
+        return int(self.pod_days.sum())
+
+    def _pod_row(self, pods):
+        """Row of each POD, growing the POD arrays for new ones"""
+        codes, unique = pd.factorize(np.asarray(pods))
+        new = [pod for pod in unique if pod not in self._pod_rows]
+        if new:
+            for pod in new:
+                self._pod_rows[pod] = len(self._pod_rows)
+            n, types = len(new), len(DAY_TYPES)
+            self.pods = np.concatenate([self.pods, np.array(new, dtype='U')])
+            self.pod_sums = np.concatenate([self.pod_sums, np.zeros((n, types, SLOTS))])
+            self.pod_days = np.concatenate([self.pod_days, np.zeros((n, types), dtype='int64')])
+            self.pod_clusters = np.concatenate([self.pod_clusters, np.zeros((n, self.n_clusters), dtype='int64')])
+            self.last_days = np.concatenate([self.last_days, np.full(n, np.iinfo('int64').min)])
+        return np.array([self._pod_rows[pod] for pod in unique], dtype='int64')[codes]
+
+    def _fit_batches(self, shapes):
+        """One mini-batch k-means pass: centres move to the running mean of their shapes"""
+        for start in range(0, len(shapes), BATCH_DAYS):
+            batch = shapes[start:start + BATCH_DAYS]
+            labels = squared_distances(batch, self.centroids).argmin(axis=1)
+            counts = np.bincount(labels, minlength=self.n_clusters)
+            members = labels == np.arange(self.n_clusters)[:, None]
+            sums = members.astype('float32') @ batch
+            moved = counts > 0
+            total = self.centroid_days[moved] + counts[moved]
+            self.centroids[moved] = ((self.centroids[moved] * self.centroid_days[moved, None] + sums[moved])
+                                     / total[:, None]).astype('float32')
+            self.centroid_days[moved] = total
+
+    def add_shapes(self, pods, days, shapes):
+        """
+        Cluster new POD-day shapes and add them to the sums
+
+        Days up to a POD's last_day are already in the index and skipped.
+
+        Returns:
+            int: Days added
+        """
+        rows = self._pod_row(pods)
+        new = days > self.last_days[rows]
+        rows, days, shapes = rows[new], days[new], shapes[new]
+        if not len(days):
+            return 0
+        rng = np.random.default_rng([self.seed, len(self.centroid_days), self.n_days])
+        order = rng.permutation(len(days))  # Batches mixing PODs and seasons
+
+        if not len(self.centroids):
+            self.n_clusters = min(self.n_clusters, len(days))
+            self.centroid_days = self.centroid_days[:self.n_clusters]
+            self.cluster_sums = self.cluster_sums[:self.n_clusters]
+            self.cluster_days = self.cluster_days[:self.n_clusters]
+            self.pod_clusters = self.pod_clusters[:, :self.n_clusters]
+            self.centroids = kmeans_plus_plus(shapes[order[:BATCH_DAYS]], self.n_clusters, rng)
+            for _ in range(INIT_EPOCHS - 1):
+                self._fit_batches(shapes[order])
+                order = rng.permutation(len(days))
+        self._fit_batches(shapes[order])
+
+        labels = np.concatenate([squared_distances(shapes[start:start + BATCH_DAYS], self.centroids).argmin(axis=1)
+                                 for start in range(0, len(shapes), BATCH_DAYS)])
+        types = day_type_codes(days)
+        n_types = len(DAY_TYPES)
+        add_grouped(self.pod_sums.reshape(-1, SLOTS), rows * n_types + types, shapes)
+        self.pod_days += np.bincount(rows * n_types + types, minlength=self.pod_days.size).reshape(self.pod_days.shape)
+        self.pod_clusters += np.bincount(rows * self.n_clusters + labels,
+                                         minlength=self.pod_clusters.size).reshape(self.pod_clusters.shape)
+        add_grouped(self.cluster_sums.reshape(-1, SLOTS), labels * n_types + types, shapes)
+        self.cluster_days += np.bincount(labels * n_types + types,
+                                         minlength=self.cluster_days.size).reshape(self.cluster_days.shape)
+        last = pd.Series(days).groupby(rows).max()
+        self.last_days[last.index] = np.maximum(self.last_days[last.index], last.to_numpy())
+        self._profiles = None
+        return len(days)
+
+    def profiles(self):
+        """
+        (PODs, day types * SLOTS) profile matrix: mean shape of each day type
+
+        A day type without days takes the POD's mean over all its days.
+        """
+        if self._profiles is None:
+            totals = self.pod_days.sum(axis=1)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                overall = self.pod_sums.sum(axis=1) / totals[:, None]
+                means = self.pod_sums / self.pod_days[:, :, None]
+            means = np.where(self.pod_days[:, :, None] > 0, means, overall[:, None, :])
+            self._profiles = np.nan_to_num(means).reshape(len(self.pods), -1).astype('float32')
+        return self._profiles
+
+    def similar(self, pod=None, profile=None, n=10):
+        """
+        PODs whose profile is closest (Euclidean) to a POD's or a given one
+
+        Args:
+            pod: POD code to compare with (it is left out of the result)
+            profile: Profile vector (len(DAY_TYPES) * SLOTS), or one shape of
+                SLOTS values used for every day type
+            n: Number of PODs returned
+
+        Returns:
+            pd.DataFrame: POD, Distance, Cluster (most frequent), ClusterShare
+        """
+        profiles = self.profiles()
+        if pod is not None:
+            if pod not in self._pod_rows:
+                raise KeyError(f"POD not in the profile index: {pod}")
+            profile = profiles[self._pod_rows[pod]]
+        profile = np.asarray(profile, dtype='float32').ravel()
+        if len(profile) == SLOTS:
+            profile = np.tile(profile, len(DAY_TYPES))
+        distances = np.sqrt(squared_distances(profile[None, :], profiles)[0])
+        if pod is not None:
+            distances[self._pod_rows[pod]] = np.inf
+        n = min(n, len(distances) - (pod is not None))
+        nearest = np.argpartition(distances, n - 1)[:n] if n > 0 else np.zeros(0, dtype='int64')
+        nearest = nearest[np.argsort(distances[nearest])]
+        return pd.DataFrame({'POD': self.pods[nearest], 'Distance': distances[nearest], **self._dominant(nearest)})
+
+    def _dominant(self, rows):
+        counts = self.pod_clusters[rows]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            share = counts.max(axis=1, initial=0) / counts.sum(axis=1)
+        return {'Cluster': counts.argmax(axis=1) if counts.size else np.zeros(0, dtype='int64'), 'ClusterShare': share}
+
+    def segments(self):
+        """Every POD with its most frequent cluster, the cluster's share of its days and its day count"""
+        rows = np.arange(len(self.pods))
+        return pd.DataFrame({'POD': self.pods, **self._dominant(rows), 'Days': self.pod_days.sum(axis=1)})
+
+    def typical_shape(self, cluster, day_type='weekday'):
+        """
+        Mean shape of the cluster's days of one day type ('all' for every day)
+
+        Returns:
+            pd.DataFrame: Time (local HH:MM) and Shape (1 = the day's mean)
+        """
+        if not 0 <= cluster < self.n_clusters:
+            raise ValueError(f"Cluster must be between 0 and {self.n_clusters - 1}")
+        if day_type == 'all':
+            sums, count = self.cluster_sums[cluster].sum(axis=0), self.cluster_days[cluster].sum()
+        elif day_type in DAY_TYPES:
+            t = DAY_TYPES.index(day_type)
+            sums, count = self.cluster_sums[cluster, t], self.cluster_days[cluster, t]
+        else:
+            raise ValueError(f"Unknown day type: {day_type}")
+        shape = sums / count if count else np.full(SLOTS, np.nan)
+        minutes = np.arange(SLOTS) * 15
+        return pd.DataFrame({'Time': [f'{m // 60:02d}:{m % 60:02d}' for m in minutes], 'Shape': shape})
+
+    def cluster_summary(self):
+        """Days of every cluster per day type, and the number of PODs it dominates"""
+        summary = pd.DataFrame(self.cluster_days, columns=[t.capitalize() for t in DAY_TYPES])
+        summary.insert(0, 'Cluster', np.arange(self.n_clusters))
+        summary['Days'] = self.cluster_days.sum(axis=1)
+        summary['PODs'] = np.bincount(self.segments()['Cluster'], minlength=self.n_clusters)[:self.n_clusters] \
+            if len(self.pods) else 0
+        return summary
+
+    def update(self, meter_paths, chunk_rows=DEFAULT_CHUNK_ROWS):
+        """
+        Read new or changed meter files and add their new days
+
+        Shapes are gathered over several files and clustered FLUSH_DAYS at a time.
+
+        Returns:
+            int: Days added
+        """
+        added = 0
+        pending = []
+
+        def flush():
+            nonlocal added
+            if pending:
+                added += self.add_shapes(*(np.concatenate(columns) for columns in zip(*pending)))
+                pending.clear()
+
+        for path in meter_paths:
+            signature = file_signature(path)
+            if self.fingerprints.get(str(path)) == signature:
+                continue
+            with span('profiles.meter', file=Path(path).name) as s:
+                pods, days, shapes = read_day_shapes(path, chunk_rows)
+                pending.append((pods, days, shapes))
+                s.add(rows=len(days))
+            self.fingerprints[str(path)] = signature
+            if sum(len(days) for _, days, _ in pending) >= FLUSH_DAYS:
+                flush()
+        flush()
+        return added
+
+    def save(self, path):
+        """Write the index atomically to an .npz file"""
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        meta = {'format': INDEX_FORMAT, 'slots': SLOTS, 'n_clusters': self.n_clusters, 'seed': self.seed,
+                'fingerprints': self.fingerprints}
+        tmp = path.with_name(f'{path.stem}.{os.getpid()}.tmp.npz')
+        np.savez_compressed(tmp, meta=np.array(json.dumps(meta)), **{name: getattr(self, name) for name in self.ARRAYS})
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path):
+        """Open a saved index, or None when missing or of another format"""
+        path = Path(path)
+        if not path.exists():
+            return None
+        with np.load(path) as data:
+            meta = json.loads(str(data['meta']))
+            if (meta.get('format'), meta.get('slots')) != (INDEX_FORMAT, SLOTS):
+                return None
+            arrays = {name: data[name] for name in cls.ARRAYS}
+        return cls(meta['n_clusters'], meta['seed'], meta['fingerprints'], **arrays)
+
+
+def index_path(db_path=DEFAULT_DB_PATH):
+    return Path(db_path) / PROFILES_DIRNAME / INDEX_FILENAME
+
+
+def default_meter_paths(db_path=DEFAULT_DB_PATH):
+    """Every POD file in db/pods/, or the IT*.csv meter files in db/"""
+    db_path = Path(db_path)
+    pods = sorted((db_path / 'pods').glob('*.csv'))
+    return pods or sorted(db_path.glob('IT*.csv'))
+
+
+def update_profile_index(db_path=DEFAULT_DB_PATH, meter_paths=None, n_clusters=DEFAULT_CLUSTERS, rebuild=False):
+    """
+    Load the saved index, add the new meter days and save it again
+
+    Args:
+        db_path: Database folder holding profiles/load_profiles.npz
+        meter_paths: Meter files or folders (default: default_meter_paths)
+        n_clusters: Clusters of a new index (a saved index keeps its own)
+        rebuild: Start from an empty index
+
+    Returns:
+        tuple: (ProfileIndex, days added)
+    """
+    path = index_path(db_path)
+    index = None if rebuild else ProfileIndex.load(path)
+    if index is None:
+        index = ProfileIndex(n_clusters)
+    if meter_paths is None:
+        meter_paths = default_meter_paths(db_path)
+    with span('profiles.update') as s:
+        added = index.update(meter_paths)
+        s.add(rows=added)
+    if added or not path.exists():
+        index.save(path)
+    return index, added
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Load-profile clusters and similar PODs')
+    parser.add_argument('meters', nargs='*', type=Path, help='Meter files or folders (default: db/pods or db/IT*.csv)')
+    parser.add_argument('--db', type=Path, default=DEFAULT_DB_PATH, help='Database folder')
+    parser.add_argument('--clusters', type=int, default=DEFAULT_CLUSTERS, help='Clusters of a new index')
+    parser.add_argument('--rebuild', action='store_true', help='Rebuild the index from scratch')
+    parser.add_argument('--similar', metavar='POD', help='List the PODs with the closest profile')
+    parser.add_argument('-n', type=int, default=10, help='PODs listed by --similar')
+    parser.add_argument('--cluster', type=int, help='Print the typical shape of a cluster')
+    parser.add_argument('--day-type', choices=DAY_TYPES + ('all',), default='weekday', help='Day type of --cluster')
+    parser.add_argument('--segments', action='store_true', help='Print the cluster of every POD')
+    args = parser.parse_args(argv)
+
+    index, added = update_profile_index(args.db, args.meters or None, args.clusters, args.rebuild)
+    print(f"Profile index: {len(index.pods)} POD, {index.n_days:,} days, {index.n_clusters} clusters "
+          f"({added:,} days added)")
+    if not len(index.pods):
+        print("No complete meter days found")
+        return 1
+
+    float_format = lambda v: f"{v:.3f}"
+    if args.similar:
+        start = time.perf_counter()
+        try:
+            result = index.similar(args.similar, n=args.n)
+        except KeyError as e:
+            print(e.args[0])
+            return 1
+        print(f"\nPODs most similar to {args.similar} ({(time.perf_counter() - start) * 1000:.1f} ms):")
+        print(result.to_string(index=False, float_format=float_format))
+    if args.cluster is not None:
+        shape = index.typical_shape(args.cluster, args.day_type)
+        hourly = shape.groupby(np.arange(SLOTS) // 4).agg(Time=('Time', 'first'), Shape=('Shape', 'mean'))
+        print(f"\nTypical {args.day_type} shape of cluster {args.cluster} (hourly, 1 = daily mean):")
+        print(hourly.to_string(index=False, float_format=float_format))
+    if args.segments:
+        print("\nPOD segments:")
+        print(index.segments().to_string(index=False, float_format=float_format))
+    if not (args.similar or args.cluster is not None or args.segments):
+        print(index.cluster_summary().to_string(index=False))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,378 @@
+"""
+Measured Parquet layouts (codec, encodings, row-group size) per dataset.
+
+A layout is a small dict of writer choices:
+
+    compression, compression_level   snappy, zstd (levels 1/3/9), lz4, none
+    dictionary                       dictionary-encode the columns without an explicit encoding
+    byte_stream_split                BYTE_STREAM_SPLIT for float columns
+    delta                            DELTA_BINARY_PACKED for timestamp and date columns
+    row_group_size                   rows per row group (None: the writer default)
+
+DEFAULT_LAYOUT is what the converters always wrote (snappy, dictionaries,
+default encodings). tune_dataset rewrites a converted file with candidate
+layouts into a scratch folder and measures, for each one, the file size, the
+write time, a full read and the dataset's benchmark query (the last
+QUERY_DAYS days of the value column, read with a filter). Candidates are
+ranked by a weighted sum of the four measures, each divided by its best
+value (OBJECTIVES), so no unit dominates.
+
+The search is a greedy coordinate descent: starting from the default it
+tries every value of one choice at a time (encodings, then codec, then
+row-group size) and keeps the best, until a round changes nothing. The
+exhaustive grid is available for small datasets.
+
+Winners are saved in db/parquet_layouts.json with their measures, and
+write_table / write_dataset apply them (DEFAULT_LAYOUT for datasets never
+tuned):
+
+    python src/py/parquet_layout.py                   # tune every converted dataset
+    python src/py/parquet_layout.py PUN-MGP --objective size
+    python src/convert_to_parquet.py --tune           # convert, tune, rewrite
+"""
+import argparse
+import itertools
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from instrumentation import span
+
+DEFAULT_DB_PATH = Path(__file__).resolve().parents[2] / 'db'
+LAYOUTS_FILENAME = 'parquet_layouts.json'
+
+# Converted file of every dataset (Consumi, the partitioned copy, follows IT012E00801406)
+DATASET_FILES = {
+    'PUN-MGP': 'PUN-MGP.parquet',
+    'PUN-MGP-15': 'PUN-MGP-15.parquet',
+    'IT012E00801406': 'IT012E00801406.parquet',
+    'GAS-MGP': 'GAS-MGP.parquet',
+    'PSV_DA': 'PSV_DA.parquet',
+    'PSV_MA': 'PSV_MA.parquet',
+}
+
+DEFAULT_LAYOUT = {
+    'compression': 'snappy',
+    'compression_level': None,
+    'dictionary': True,
+    'byte_stream_split': False,
+    'delta': False,
+    'row_group_size': None,
+}
+
+# Choices searched one at a time, in this order
+CODECS = [('snappy', None), ('zstd', 1), ('zstd', 3), ('zstd', 9), ('lz4', None), ('none', None)]
+ENCODINGS = list(itertools.product([True, False], repeat=3))  # dictionary, byte_stream_split, delta
+ROW_GROUP_SIZES = [None, 16_384, 131_072, 1_048_576]
+
+# Weights of size, write, read and query time (each relative to the best candidate)
+OBJECTIVES = {
+    'balanced': {'bytes': 1.0, 'write_ms': 0.25, 'read_ms': 0.5, 'query_ms': 1.0},
+    'size': {'bytes': 1.0, 'write_ms': 0.0, 'read_ms': 0.1, 'query_ms': 0.1},
+    'speed': {'bytes': 0.1, 'write_ms': 0.1, 'read_ms': 1.0, 'query_ms': 1.0},
+}
+
+QUERY_DAYS = 90
+DEFAULT_REPEAT = 3
+DEFAULT_MAX_ROWS = 2_000_000  # Larger files are tuned on their first rows
+MAX_ROUNDS = 3
+
+
+def layouts_path(db_path=DEFAULT_DB_PATH):
+    return Path(db_path) / LAYOUTS_FILENAME
+
+
+def load_layouts(db_path=DEFAULT_DB_PATH):
+    """{dataset: layout} saved by tuning (empty when never tuned)"""
+    path = layouts_path(db_path)
+    if not path.exists():
+        return {}
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_layouts(layouts, db_path=DEFAULT_DB_PATH):
+    """Write the layouts atomically"""
+    path = layouts_path(db_path)
+    tmp = path.with_name(f'{path.name}.{os.getpid()}.tmp')
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(layouts, f, indent=2, sort_keys=True)
+        f.write('\n')
+    os.replace(tmp, path)
+
+
+def layout_for(dataset, db_path=DEFAULT_DB_PATH, layouts=None):
+    """Saved layout of a dataset, or DEFAULT_LAYOUT"""
+    layouts = load_layouts(db_path) if layouts is None else layouts
+    saved = layouts.get(dataset, {})
+    return {key: saved.get(key, value) for key, value in DEFAULT_LAYOUT.items()}
+
+
+def write_options(schema, layout, exclude=()):
+    """
+    pyarrow.parquet writer arguments of a layout for a schema
+
+    Args:
+        schema: Arrow schema of the table
+        layout: Layout dict (missing keys take DEFAULT_LAYOUT)
+        exclude: Columns not stored in the files (partition columns)
+
+    Returns:
+        dict: compression, compression_level, use_dictionary, column_encoding,
+        row_group_size and store_decimal_as_integer keyword arguments
+    """
+    layout = {**DEFAULT_LAYOUT, **layout}
+    encoding = {}
+    for field in schema:
+        if field.name in exclude:
+            continue
+        if pa.types.is_decimal(field.type):
+            encoding[field.name] = 'DELTA_BINARY_PACKED'  # Fixed-point prices stored as INT64
+        elif layout['byte_stream_split'] and pa.types.is_floating(field.type):
+            encoding[field.name] = 'BYTE_STREAM_SPLIT'
+        elif layout['delta'] and (pa.types.is_timestamp(field.type) or pa.types.is_date(field.type)):
+            encoding[field.name] = 'DELTA_BINARY_PACKED'
+    others = [name for name in schema.names if name not in encoding and name not in exclude]
+    options = {
+        'compression': layout['compression'],
+        'compression_level': layout['compression_level'],
+        # Columns with an explicit encoding must not be dictionary encoded
+        'use_dictionary': others if layout['dictionary'] else False,
+        'store_decimal_as_integer': True,
+    }
+    if encoding:
+        options['column_encoding'] = encoding
+    if layout['row_group_size']:
+        options['row_group_size'] = layout['row_group_size']
+    return options
+
+
+def write_table(table, path, dataset, db_path=DEFAULT_DB_PATH, layouts=None):
+    """pq.write_table with the dataset's layout"""
+    pq.write_table(table, path, **write_options(table.schema, layout_for(dataset, db_path, layouts)))
+
+
+def write_dataset(table, root_path, partition_cols, dataset, db_path=DEFAULT_DB_PATH, layouts=None):
+    """
+    pq.write_to_dataset with the dataset's layout
+
+    The partitions written replace their previous files instead of adding
+    another copy of the rows next to them.
+    """
+    options = write_options(table.schema, layout_for(dataset, db_path, layouts), exclude=partition_cols)
+    pq.write_to_dataset(table, root_path=str(root_path), partition_cols=partition_cols,
+                        existing_data_behavior='delete_matching', **options)
+
+
+def describe(layout):
+    """Short label of a layout, e.g. 'zstd-3 dict+bss rg=131072'"""
+    layout = {**DEFAULT_LAYOUT, **layout}
+    codec = layout['compression'] + (f"-{layout['compression_level']}" if layout['compression_level'] else '')
+    encodings = [name for name, key in (('dict', 'dictionary'), ('bss', 'byte_stream_split'), ('delta', 'delta'))
+                 if layout[key]]
+    rows = f"rg={layout['row_group_size']}" if layout['row_group_size'] else 'rg=default'
+    return f"{codec} {'+'.join(encodings) or 'plain'} {rows}"
+
+
+def benchmark_query(table):
+    """
+    Filter and columns of the dataset's benchmark query: the last QUERY_DAYS
+    days of the first value column, or None without a date column
+    """
+    time_col = next((f.name for f in table.schema
+                     if pa.types.is_timestamp(f.type) or pa.types.is_date(f.type)), None)
+    value_col = next((f.name for f in table.schema
+                      if pa.types.is_floating(f.type) or pa.types.is_decimal(f.type)), None)
+    if time_col is None or not len(table):
+        return None
+    last = pc.max(table[time_col]).as_py()
+    if last is None:
+        return None
+    start = last - timedelta(days=QUERY_DAYS)
+    columns = [time_col] + ([value_col] if value_col else [])
+    return [(time_col, '>=', start)], columns
+
+
+def _best_ms(fn, repeat):
+    """Fastest of repeat timed calls in milliseconds"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def measure(table, layout, work_dir, repeat=DEFAULT_REPEAT, query=None):
+    """
+    Write table with a layout and time it
+
+    Returns:
+        dict: bytes, write_ms, read_ms and query_ms (0 without a query)
+    """
+    path = Path(work_dir) / 'candidate.parquet'
+    options = write_options(table.schema, layout)
+    write_ms = _best_ms(lambda: pq.write_table(table, path, **options), repeat)
+    result = {
+        'bytes': path.stat().st_size,
+        'write_ms': write_ms,
+        'read_ms': _best_ms(lambda: pq.read_table(path), repeat),
+        'query_ms': 0.0,
+    }
+    if query is not None:
+        filters, columns = query
+        result['query_ms'] = _best_ms(lambda: pq.read_table(path, columns=columns, filters=filters), repeat)
+    return result
+
+
+def score(measures, best, weights):
+    """Weighted sum of the measures relative to the best value of each"""
+    return sum(weight * measures[key] / best[key] for key, weight in weights.items() if weight and best[key] > 0)
+
+
+def candidate_layouts(base, dimension, codecs=CODECS):
+    """Variations of base along one dimension ('encodings', 'codec' or 'row_group_size')"""
+    if dimension == 'encodings':
+        return [{**base, 'dictionary': d, 'byte_stream_split': b, 'delta': e} for d, b, e in ENCODINGS]
+    if dimension == 'codec':
+        return [{**base, 'compression': c, 'compression_level': level} for c, level in codecs]
+    return [{**base, 'row_group_size': size} for size in ROW_GROUP_SIZES]
+
+
+def tune_dataset(table, objective='balanced', exhaustive=False, repeat=DEFAULT_REPEAT, codecs=CODECS,
+                 work_dir=None):
+    """
+    Find the best layout for a table
+
+    Args:
+        table: Arrow table as written by the converter
+        objective: Key of OBJECTIVES
+        exhaustive: Measure the whole grid instead of the coordinate descent
+        repeat: Timed runs per measure (the fastest counts)
+        codecs: (compression, level) pairs allowed
+        work_dir: Scratch folder (default: a temporary one)
+
+    Returns:
+        tuple: (winning layout, [{layout, measures, score}] sorted by score)
+    """
+    weights = OBJECTIVES[objective]
+    query = benchmark_query(table)
+    measured = {}
+    own_dir = work_dir is None
+    work_dir = Path(tempfile.mkdtemp(prefix='parquet_layout_') if own_dir else work_dir)
+
+    def run(layouts):
+        for layout in layouts:
+            key = json.dumps(layout, sort_keys=True)
+            if key not in measured:
+                measured[key] = (layout, measure(table, layout, work_dir, repeat, query))
+
+    def ranked():
+        best = {key: min(m[key] for _, m in measured.values()) for key in weights}
+        rows = [{'layout': layout, 'measures': m, 'score': score(m, best, weights)} for layout, m in measured.values()]
+        return sorted(rows, key=lambda row: row['score'])
+
+    try:
+        if exhaustive:
+            run({**DEFAULT_LAYOUT, 'compression': c, 'compression_level': level, 'dictionary': d,
+                 'byte_stream_split': b, 'delta': e, 'row_group_size': size}
+                for (c, level), (d, b, e), size in itertools.product(codecs, ENCODINGS, ROW_GROUP_SIZES))
+        else:
+            current = dict(DEFAULT_LAYOUT)
+            run([current])
+            for _ in range(MAX_ROUNDS):
+                start = current
+                for dimension in ('encodings', 'codec', 'row_group_size'):
+                    run(candidate_layouts(current, dimension, codecs))
+                    # Best so far among the variations of the current layout
+                    current = min((row for row in ranked() if row['layout'] in
+                                   candidate_layouts(current, dimension, codecs) + [current]),
+                                  key=lambda row: row['score'])['layout']
+                if current == start:
+                    break
+    finally:
+        if own_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    results = ranked()
+    return results[0]['layout'], results
+
+
+def tune_layouts(db_path=DEFAULT_DB_PATH, datasets=None, objective='balanced', exhaustive=False,
+                 repeat=DEFAULT_REPEAT, max_rows=DEFAULT_MAX_ROWS, codecs=CODECS):
+    """
+    Tune every converted dataset and save the winners to parquet_layouts.json
+
+    Returns:
+        dict: {dataset: (winning layout, ranked results)}
+    """
+    db_path = Path(db_path)
+    layouts = load_layouts(db_path)
+    tuned = {}
+    for dataset in datasets or DATASET_FILES:
+        path = db_path / DATASET_FILES[dataset]
+        if not path.exists():
+            continue
+        with span('layout.tune', dataset=dataset) as s:
+            table = pq.read_table(path)
+            if max_rows and len(table) > max_rows:
+                table = table.slice(0, max_rows)
+            winner, results = tune_dataset(table, objective, exhaustive, repeat, codecs)
+            s.add(rows=len(table))
+        best = results[0]['measures']
+        layouts[dataset] = {**winner, 'objective': objective, 'rows': len(table),
+                            'tuned': datetime.now().isoformat(timespec='seconds'),
+                            'measured': {key: round(value, 3) for key, value in best.items()}}
+        tuned[dataset] = (winner, results)
+    save_layouts(layouts, db_path)
+    return tuned
+
+
+def print_results(dataset, results, top=5):
+    """Best candidates and the default layout's row for comparison"""
+    print(f"\n{dataset}:")
+    shown = results[:top] + [row for row in results[top:] if row['layout'] == DEFAULT_LAYOUT]
+    for row in shown:
+        m = row['measures']
+        marker = ' (default)' if row['layout'] == DEFAULT_LAYOUT else ''
+        print(f"  {row['score']:6.2f}  {describe(row['layout']):<32} {m['bytes'] / 1024:9.1f} KB  "
+              f"write {m['write_ms']:7.1f} ms  read {m['read_ms']:6.1f} ms  query {m['query_ms']:6.1f} ms{marker}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Measure Parquet layouts and save the best one per dataset')
+    parser.add_argument('datasets', nargs='*', help=f"Datasets (default: all of {', '.join(DATASET_FILES)})")
+    parser.add_argument('--db', type=Path, default=DEFAULT_DB_PATH, help='Database folder')
+    parser.add_argument('--objective', choices=list(OBJECTIVES), default='balanced', help='Ranking weights')
+    parser.add_argument('--exhaustive', action='store_true', help='Measure the full grid')
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT, help='Timed runs per measure')
+    parser.add_argument('--max-rows', type=int, default=DEFAULT_MAX_ROWS, help='Rows tuned on (0: all)')
+    parser.add_argument('--codecs', nargs='+', help='Allowed codecs (e.g. snappy zstd, for older readers)')
+    args = parser.parse_args(argv)
+    unknown = sorted(set(args.datasets) - set(DATASET_FILES))
+    if unknown:
+        parser.error(f"unknown datasets: {', '.join(unknown)}")
+
+    codecs = [c for c in CODECS if not args.codecs or c[0] in args.codecs]
+    tuned = tune_layouts(args.db, args.datasets or None, args.objective, args.exhaustive, args.repeat,
+                         args.max_rows, codecs)
+    if not tuned:
+        print(f"No converted datasets in {args.db} (run convert_to_parquet.py first)")
+        return 1
+    for dataset, (winner, results) in tuned.items():
+        print_results(dataset, results)
+    print(f"\nSaved {len(tuned)} layout(s) to {layouts_path(args.db)}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,258 @@
+"""
+Fast status check of the datasets, for schedulers that poll the pipeline.
+
+The check only reads db/manifest.json and stats a handful of files; it
+imports nothing beyond the standard library, so a poll costs little more
+than the interpreter start. The manifest is rebuilt by refresh_manifest at
+the end of days.py and convert_to_parquet (that path imports pandas lazily).
+
+For every dataset the manifest records its date coverage, the days missing
+inside it, and the size and mtime of the source file and of the files
+derived from it. The status reports:
+
+    missing   day-ahead datasets that do not reach the expected date yet
+              (tomorrow once GME has published, today before that)
+    gaps      days missing inside the covered range
+    stale     derived files older than their source, or a source changed
+              since the manifest was written
+
+Exit codes: EXIT_OK, EXIT_MISSING (run days.py), EXIT_STALE (run
+convert_to_parquet) and EXIT_NO_MANIFEST.
+"""
+import argparse
+import json
+import os
+import sys
+from datetime import datetime, timedelta
+from pathlib import Path
+
+REPO_PATH = Path(__file__).resolve().parents[2]
+DEFAULT_DB_PATH = REPO_PATH / 'db'
+DEFAULT_XML_PATH = REPO_PATH / 'sources' / 'GME' / 'EE'
+MANIFEST_FILENAME = 'manifest.json'
+MANIFEST_VERSION = 1
+
+EXIT_OK = 0
+EXIT_MISSING = 1
+EXIT_STALE = 2
+EXIT_NO_MANIFEST = 3
+
+# GME publishes the day-ahead (MGP) results for tomorrow around 13:00 Rome time
+PUBLICATION_HOUR = 13
+DAY_AHEAD = ('MGP-Prezzi', 'PUN_CM', 'PUN_CM-15')
+
+
+def manifest_path(db_path=DEFAULT_DB_PATH):
+    return Path(db_path) / MANIFEST_FILENAME
+
+
+def file_signature(path):
+    """{mtime_ns, size} of a file or folder (newest file inside), or None"""
+    path = Path(path)
+    try:
+        if path.is_dir():
+            stats = [p.stat() for p in path.rglob('*') if p.is_file()]
+            if not stats:
+                return None
+            return {'mtime_ns': max(s.st_mtime_ns for s in stats), 'size': sum(s.st_size for s in stats)}
+        stat = path.stat()
+    except OSError:
+        return None
+    return {'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size}
+
+
+def rome_now():
+    """Current time in Europe/Rome (local time if the tz database is missing)"""
+    try:
+        from zoneinfo import ZoneInfo
+        return datetime.now(ZoneInfo('Europe/Rome')).replace(tzinfo=None)
+    except (ImportError, KeyError, ValueError):
+        return datetime.now()
+
+
+def expected_last_date(now=None):
+    """Last date a day-ahead dataset should reach at this time (YYYYMMDD)"""
+    now = now or rome_now()
+    published = now.hour >= PUBLICATION_HOUR
+    return (now.date() + timedelta(days=1 if published else 0)).strftime('%Y%m%d')
+
+
+def read_manifest(db_path=DEFAULT_DB_PATH):
+    """The manifest dict, or None when missing or unreadable"""
+    try:
+        manifest = json.loads(manifest_path(db_path).read_text(encoding='utf-8'))
+    except (OSError, ValueError):
+        return None
+    return manifest if manifest.get('version') == MANIFEST_VERSION else None
+
+
+def dataset_status(name, entry, expected):
+    """
+    Problems of one manifest entry
+
+    Returns:
+        dict: name, coverage and the lists missing / gaps / stale
+    """
+    status = {'dataset': name, 'first_date': entry.get('first_date'), 'last_date': entry.get('last_date'),
+              'missing': [], 'gaps': [], 'stale': []}
+
+    if name in DAY_AHEAD and (entry.get('last_date') or '') < expected:
+        status['missing'].append(f"ends {entry.get('last_date')}, expected {expected}")
+    if entry.get('missing_days'):
+        status['gaps'].append(f"{entry['missing_days']} day(s) missing inside the range")
+
+    source = entry.get('source')
+    if source:
+        current = file_signature(REPO_PATH / source['path'])
+        if current is None:
+            status['stale'].append(f"{source['path']} no longer exists")
+        elif current != {'mtime_ns': source['mtime_ns'], 'size': source['size']}:
+            status['stale'].append(f"{source['path']} changed since the manifest")
+        for output in entry.get('outputs', []):
+            derived = file_signature(REPO_PATH / output)
+            if derived is None:
+                status['stale'].append(f"{output} missing")
+            elif current is not None and derived['mtime_ns'] < current['mtime_ns']:
+                status['stale'].append(f"{output} older than its source")
+    return status
+
+
+def check(db_path=DEFAULT_DB_PATH, now=None):
+    """
+    Status of every dataset in the manifest
+
+    Returns:
+        tuple: (exit code, list of dataset status dicts)
+    """
+    manifest = read_manifest(db_path)
+    if manifest is None:
+        return EXIT_NO_MANIFEST, []
+
+    expected = expected_last_date(now)
+    statuses = [dataset_status(name, entry, expected) for name, entry in sorted(manifest['datasets'].items())]
+    if any(s['missing'] for s in statuses):
+        return EXIT_MISSING, statuses
+    if any(s['stale'] for s in statuses):
+        return EXIT_STALE, statuses
+    return EXIT_OK, statuses
+
+
+def _relative(path):
+    path = Path(path).resolve()
+    try:
+        return path.relative_to(REPO_PATH).as_posix()
+    except ValueError:
+        return str(path)
+
+
+def _date_coverage(dates):
+    """First and last date, and days missing inside that range"""
+    import numpy as np
+
+    days = np.unique(np.asarray(dates, dtype='datetime64[D]'))
+    if not len(days):
+        return {'first_date': None, 'last_date': None, 'missing_days': 0}
+    span = int((days[-1] - days[0]).astype('int64')) + 1
+    return {
+        'first_date': str(days[0]).replace('-', ''),
+        'last_date': str(days[-1]).replace('-', ''),
+        'missing_days': span - len(days),
+    }
+
+
+def _csv_coverage(path):
+    """Coverage of a dataset CSV from its date column only"""
+    import pandas as pd
+
+    header = pd.read_csv(path, sep=';', encoding='utf-8-sig', nrows=0).columns
+    column = next((c for c in ('Date', 'DATA', 'Data', 'YearMonth') if c in header), header[0])
+    values = pd.read_csv(path, sep=';', encoding='utf-8-sig', usecols=[column])[column]
+    if column == 'YearMonth':
+        dates = pd.to_datetime(values.astype(str), format='%Y%m')
+        coverage = {'first_date': dates.min().strftime('%Y%m%d'), 'last_date': dates.max().strftime('%Y%m%d'),
+                    'missing_days': 0}
+    elif pd.api.types.is_integer_dtype(values):
+        coverage = _date_coverage(pd.to_datetime(values.astype(str), format='%Y%m%d'))
+    else:
+        coverage = _date_coverage(pd.to_datetime(values, format='%d/%m/%Y'))
+    return dict(coverage, rows=len(values))
+
+
+def refresh_manifest(db_path=DEFAULT_DB_PATH, xml_path=DEFAULT_XML_PATH):
+    """
+    Rebuild the manifest from the data files (the slow path, run by the pipeline)
+
+    Returns:
+        dict: The manifest written to db/manifest.json
+    """
+    from gme_fetcher import GME_DATASETS, existing_dates
+
+    db_path, xml_path = Path(db_path), Path(xml_path)
+    datasets = {}
+
+    spec = GME_DATASETS['MGP-Prezzi']
+    dates = sorted(existing_dates(xml_path, spec['suffix']))
+    coverage = _date_coverage([f'{d[:4]}-{d[4:6]}-{d[6:]}' for d in dates])
+    datasets['MGP-Prezzi'] = dict(coverage, files=len(dates), folder=_relative(xml_path))
+
+    sources = sorted(xml_path.glob('PUN_CM*.csv')) + sorted(db_path.glob('*.csv'))
+    for source in sources:
+        try:
+            coverage = _csv_coverage(source)
+        except (ValueError, KeyError) as e:
+            print(f"Manifest: skipping {source.name}: {e}")
+            continue
+        outputs = []
+        if source.parent == db_path:
+            outputs.append(source.with_suffix('.parquet'))
+            if (db_path / 'Consumi').exists() and source.stem.startswith('IT'):
+                outputs.append(db_path / 'Consumi')
+        signature = file_signature(source)
+        datasets[source.stem] = dict(
+            coverage,
+            source={'path': _relative(source), **signature},
+            outputs=[_relative(p) for p in outputs],
+        )
+
+    manifest = {'version': MANIFEST_VERSION, 'updated_at': datetime.now().isoformat(timespec='seconds'),
+                'datasets': datasets}
+    path = manifest_path(db_path)
+    tmp = path.with_name(f'{path.name}.{os.getpid()}.tmp')
+    tmp.write_text(json.dumps(manifest, indent=1), encoding='utf-8')
+    os.replace(tmp, path)
+    return manifest
+
+
+def format_status(code, statuses):
+    if code == EXIT_NO_MANIFEST:
+        return "No manifest: run days.py / convert_to_parquet.py or status --refresh"
+    lines = []
+    for status in statuses:
+        problems = status['missing'] + status['stale'] + status['gaps']
+        state = 'MISSING' if status['missing'] else 'STALE' if status['stale'] else 'ok'
+        coverage = f"{status['first_date']}..{status['last_date']}"
+        lines.append(f"{status['dataset']:20} {coverage:18} {state:8} {'; '.join(problems)}".rstrip())
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Report missing or stale datasets from the manifest')
+    parser.add_argument('--db', type=Path, default=DEFAULT_DB_PATH, help='Database folder')
+    parser.add_argument('--xml', type=Path, default=DEFAULT_XML_PATH, help='GME XML folder (for --refresh)')
+    parser.add_argument('--refresh', action='store_true', help='Rebuild the manifest from the data files first')
+    parser.add_argument('--json', action='store_true', help='Print the status as JSON')
+    parser.add_argument('-q', '--quiet', action='store_true', help='Only set the exit code')
+    args = parser.parse_args(argv)
+
+    if args.refresh:
+        refresh_manifest(args.db, args.xml)
+    code, statuses = check(args.db)
+    if args.json:
+        print(json.dumps({'exit_code': code, 'datasets': statuses}))
+    elif not args.quiet:
+        print(format_status(code, statuses))
+    return code
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,328 @@
+"""
+Dense array-backed price series with O(1) time-indexed access.
+
+A PriceSeries is a contiguous float32 array over consecutive intervals plus a
+validity bitmap for the gaps. Interval numbers depend on the resolution:
+    15min, hour   UTC minute // interval length
+    day           local day number (days since 1970-01-01); gas series use
+                  gas days, which start at 06:00 (day_start_hour=6)
+    month         months since 1970-01
+
+So a price lookup is one subtraction and one array read, for a single
+instant or a million meter readings at once, and resampling between
+resolutions is a vectorized group-by on consecutive labels.
+
+A PriceSeries keeps no cache of its own: store columns are read through
+load_interval_store, which saves the UTC-ordered values (IntervalStore.utc_array)
+next to the dense matrix in db/dense/. A series read from the store is a
+read-only memory map of that file, and both views always come from the same
+source file.
+"""
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from download_and_read_excel import midnight_utc_offset_hours, rome_utc_offset_hours, yyyymmdd_to_day_number
+from interval_store import DEFAULT_DB_PATH, RESOLUTION_KEY, IntervalStore, load_interval_store, range_positions
+
+# resolution -> interval length in minutes (None: calendar based)
+RESOLUTIONS = {'15min': 15, 'hour': 60, 'day': None, 'month': None}
+RESOLUTION_ORDER = ['15min', 'hour', 'day', 'month']
+MINUTES_TO_RESOLUTION = {15: '15min', 60: 'hour'}
+
+
+def day_start_utc_minutes(days, start_hour=0):
+    """UTC minute at which each local day starts (at start_hour local time)"""
+    days = np.asarray(days, dtype='int64')
+    # DST switches happen at 02:00-03:00, so a day starting later has the new offset
+    offsets = midnight_utc_offset_hours(days + 1 if start_hour >= 3 else days)
+    return days * 1440 + start_hour * 60 - offsets * 60
+
+
+def utc_minutes_to_day(utc_minutes, start_hour=0):
+    """Local day (starting at start_hour) containing each UTC minute"""
+    utc_minutes = np.asarray(utc_minutes, dtype='int64')
+    local = utc_minutes + rome_utc_offset_hours(utc_minutes * 60) * 60
+    return (local - start_hour * 60) // 1440
+
+
+class PriceSeries:
+    """
+    Prices over consecutive intervals of one resolution
+
+    Attributes:
+        name: Series name (PUN, a zone, MGP-GAS, ...)
+        resolution: One of RESOLUTIONS
+        first: Interval number of position 0
+        values: float32 array, NaN where not valid
+        day_start_hour: Local hour at which days start (6 for gas days)
+    """
+
+    def __init__(self, name, resolution, first, values, valid=None, day_start_hour=0):
+        if resolution not in RESOLUTIONS:
+            raise ValueError(f"Unknown resolution: {resolution}")
+        self.name = name
+        self.resolution = resolution
+        self.minutes = RESOLUTIONS[resolution]
+        self.first = int(first)
+        self.values = values
+        self.day_start_hour = day_start_hour
+        if valid is None:
+            valid = np.packbits(~np.isnan(values), bitorder='little')
+        self.bitmap = valid
+        self._valid = None
+
+    def __len__(self):
+        return len(self.values)
+
+    def __repr__(self):
+        return (f"PriceSeries({self.name!r}, {self.resolution}, {len(self):,} intervals, "
+                f"{self.count():,} valid)")
+
+    @property
+    def end(self):
+        """Interval number one past the last position"""
+        return self.first + len(self.values)
+
+    @property
+    def valid(self):
+        """Bool array of the positions holding a price"""
+        if self._valid is None:
+            self._valid = np.unpackbits(self.bitmap, count=len(self.values), bitorder='little').astype(bool)
+        return self._valid
+
+    def count(self):
+        """Number of valid intervals"""
+        return int(self.valid.sum())
+
+    # Interval numbers <-> time
+
+    def index_of(self, utc_minutes):
+        """Interval number containing each UTC minute"""
+        utc_minutes = np.asarray(utc_minutes, dtype='int64')
+        if self.minutes:
+            return utc_minutes // self.minutes
+        days = utc_minutes_to_day(utc_minutes, self.day_start_hour)
+        if self.resolution == 'day':
+            return days
+        return days.astype('datetime64[D]').astype('datetime64[M]').astype('int64')
+
+    def start_utc_minutes(self, index):
+        """UTC minute at which each interval number starts"""
+        index = np.asarray(index, dtype='int64')
+        if self.minutes:
+            return index * self.minutes
+        if self.resolution == 'month':
+            index = index.astype('datetime64[M]').astype('datetime64[D]').astype('int64')
+        return day_start_utc_minutes(index, self.day_start_hour)
+
+    def index_of_time(self, when):
+        """Interval number of a timestamp (naive means Europe/Rome local time)"""
+        stamp = pd.Timestamp(when)
+        if stamp.tzinfo is None:
+            stamp = stamp.tz_localize('Europe/Rome', ambiguous=True, nonexistent='shift_forward')
+        return int(self.index_of(stamp.value // 60_000_000_000))
+
+    # Lookups
+
+    def at(self, index):
+        """Price of interval numbers (scalar or array), NaN outside or in gaps"""
+        index = np.asarray(index, dtype='int64')
+        positions = index - self.first
+        if positions.ndim == 0:
+            if 0 <= positions < len(self.values):
+                return float(self.values[positions])
+            return np.nan
+        inside = (positions >= 0) & (positions < len(self.values))
+        result = np.full(positions.shape, np.nan)
+        result[inside] = self.values[positions[inside]]
+        return result
+
+    def lookup(self, utc_minutes):
+        """Price of the interval containing each UTC minute (NaN if missing)"""
+        return self.at(self.index_of(utc_minutes))
+
+    def slice(self, start=None, end=None):
+        """Array view of the interval numbers [start, end)"""
+        lo, hi = range_positions(self.first, len(self.values), start, end)
+        return self.values[lo:hi]
+
+    def window(self, start=None, end=None):
+        """Sub-series over the interval numbers [start, end) (shares the values)"""
+        lo, hi = range_positions(self.first, len(self.values), start, end)
+        return PriceSeries(self.name, self.resolution, self.first + lo, self.values[lo:hi],
+                           day_start_hour=self.day_start_hour)
+
+    def between(self, start, end):
+        """Array view of the intervals from start to end (timestamps, end exclusive)"""
+        return self.slice(self.index_of_time(start), self.index_of_time(end))
+
+    # Resampling
+
+    def resample(self, resolution, day_start_hour=None):
+        """
+        Same prices at another resolution
+
+        Coarser targets take the mean of the valid intervals of each target
+        interval; finer targets repeat each value over its sub-intervals.
+        """
+        if day_start_hour is None:
+            day_start_hour = self.day_start_hour
+        if resolution == self.resolution and day_start_hour == self.day_start_hour:
+            return self
+
+        target = PriceSeries(self.name, resolution, 0, np.empty(0, dtype='float32'),
+                             day_start_hour=day_start_hour)
+        starts = self.start_utc_minutes([self.first, self.end])
+
+        if RESOLUTION_ORDER.index(resolution) < RESOLUTION_ORDER.index(self.resolution):
+            # Finer: every target interval takes the value of the interval it falls in
+            lo = int(target.index_of(starts[0]))
+            hi = int(target.index_of(starts[1] - 1)) + 1
+            values = self.lookup(target.start_utc_minutes(np.arange(lo, hi))).astype('float32')
+            return PriceSeries(self.name, resolution, lo, values, day_start_hour=day_start_hour)
+
+        labels = target.index_of(self.start_utc_minutes(np.arange(self.first, self.end)))
+        lo = int(labels[0]) if len(labels) else 0
+        valid = self.valid
+        sums = np.bincount(labels - lo, weights=np.where(valid, self.values, 0.0))
+        counts = np.bincount(labels - lo, weights=valid)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            values = np.where(counts > 0, sums / counts, np.nan).astype('float32')
+        return PriceSeries(self.name, resolution, lo, values, day_start_hour=day_start_hour)
+
+    def combine_first(self, other):
+        """This series, with gaps filled from other (resampled to this resolution)"""
+        other = other.resample(self.resolution, self.day_start_hour)
+        lo, hi = min(self.first, other.first), max(self.end, other.end)
+        values = np.full(hi - lo, np.nan, dtype='float32')
+        values[other.first - lo:other.end - lo] = other.values
+        mine = values[self.first - lo:self.end - lo]
+        mine[self.valid] = self.values[self.valid]
+        return PriceSeries(self.name, self.resolution, lo, values, day_start_hour=self.day_start_hour)
+
+    # Conversions
+
+    @classmethod
+    def from_interval_store(cls, store, name):
+        """
+        UTC-ordered view of an IntervalStore, without the DST padding (memory-mapped
+        for a store opened from the db/dense/ cache, one copy otherwise)
+        """
+        first, minutes, values = store.utc_array('float32')
+        return cls(name, MINUTES_TO_RESOLUTION[minutes], first, values)
+
+    @classmethod
+    def from_records(cls, name, days, intervals, values, minutes=None):
+        """Build from store rows: local day, 1-based interval of the day, price"""
+        return cls.from_interval_store(IntervalStore.from_records(days, intervals, values, minutes), name)
+
+    @classmethod
+    def from_store(cls, db_path=DEFAULT_DB_PATH, dataset='PUN-MGP', column='PUN', use_cache=True):
+        """Read a column of a Parquet/CSV price store (PUN-MGP, PUN-MGP-15, ...)"""
+        return cls.from_interval_store(load_interval_store(db_path, dataset, column, use_cache), column)
+
+    def to_frame(self, valid_only=True):
+        """
+        Store layout: Date, Hour (or Interval) and the price; Date and price for
+        day and month series
+        """
+        index = np.arange(self.first, self.end)
+        values = self.values
+        if valid_only:
+            index, values = index[self.valid], values[self.valid]
+
+        if not self.minutes:
+            if self.resolution == 'month':
+                dates = index.astype('datetime64[M]').astype('datetime64[D]')
+            else:
+                dates = index.astype('datetime64[D]')
+            return pd.DataFrame({'Date': dates, self.name: values})
+
+        utc_minutes = index * self.minutes
+        days = utc_minutes_to_day(utc_minutes)
+        intervals = (utc_minutes - day_start_utc_minutes(days)) // self.minutes + 1
+        interval_col = 'Hour' if self.minutes == 60 else 'Interval'
+        return pd.DataFrame({
+            'Date': days.astype('datetime64[D]'),
+            interval_col: intervals.astype('int8' if self.minutes == 60 else 'int16'),
+            self.name: values,
+        })
+
+    def to_parquet(self, path):
+        """Write the store layout to Parquet, recording the resolution"""
+        frame = self.to_frame()
+        frame['Year'] = frame['Date'].dt.year.astype('int16')
+        table = pa.Table.from_pandas(frame, preserve_index=False)
+        if self.minutes:
+            table = table.replace_schema_metadata(
+                {**(table.schema.metadata or {}), RESOLUTION_KEY: str(self.minutes).encode()}
+            )
+        pq.write_table(table, path, compression='snappy')
+        return Path(path)
+
+
+def load_price_series(db_path=DEFAULT_DB_PATH, dataset='PUN-MGP', column='PUN', use_cache=True):
+    """
+    PriceSeries of a store column, read through the dense IntervalStore cache
+
+    Args:
+        db_path: Folder with the price store
+        dataset: PUN-MGP (hourly) or PUN-MGP-15 (quarter-hourly)
+        column: Price column
+        use_cache: Read/write the db/dense/ cache
+    """
+    return PriceSeries.from_store(db_path, dataset, column, use_cache)
+
+
+def gas_price_series(gas, name='MGP-GAS'):
+    """PriceSeries over gas days (06:00 to 06:00) from a gas_series.GasSeries"""
+    values = np.asarray(gas.values[name], dtype='float32')
+    return PriceSeries(name, 'day', gas.first_day, values, day_start_hour=6)
+
+
+def load_zone_series(xml_folder, zones=None):
+    """
+    PriceSeries of PUN and every zone from MGPPrezzi XML files
+
+    Args:
+        xml_folder: Folder with *MGPPrezzi.xml files
+        zones: Price columns to keep (None for all)
+
+    Returns:
+        dict: {column: PriceSeries}
+    """
+    sys.path.append(str(Path(__file__).resolve().parents[2]))
+    from days import parse_mgp_xml, xml_resolution_minutes
+
+    # Hourly and quarter-hourly files are numbered differently: keep them apart
+    records_by_resolution = {}
+    for xml_file in sorted(Path(xml_folder).glob('*MGPPrezzi.xml')):
+        records = parse_mgp_xml(xml_file, columns=zones)
+        records_by_resolution.setdefault(xml_resolution_minutes(records), []).extend(records)
+
+    series = {}
+    for minutes in sorted(records_by_resolution):
+        frame = pd.DataFrame(records_by_resolution[minutes])
+        if frame.empty:
+            continue
+        days = yyyymmdd_to_day_number(frame['Data'].astype('int64').to_numpy())
+        intervals = frame['Ora'].to_numpy()
+        for column in frame.columns.drop(['Data', 'Ora']):
+            built = PriceSeries.from_records(column, days, intervals, frame[column].to_numpy(), minutes)
+            # The finest resolution comes first and wins where both exist
+            series[column] = series[column].combine_first(built) if column in series else built
+    return series
+
+
+if __name__ == "__main__":
+    pun = load_price_series()
+    print(pun)
+    for resolution in ('15min', 'day', 'month'):
+        print(f"  -> {pun.resample(resolution)}")
+    monthly = pun.resample('month').to_frame()
+    print(monthly.tail(6).to_string(index=False))
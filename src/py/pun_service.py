@@ -0,0 +1,446 @@
+"""
+Local HTTP query service over the price store.
+
+Endpoints (GET, query string parameters):
+    /health                               status and data version
+    /dates                                days with PUN data
+    /pun?start=&end=&resolution=          PUN (15min, hour, day or month)
+    /zones?zone=&start=&end=              zonal prices from the MGPPrezzi XML files
+    /rollup?level=&start=&end=&dataset=   day / month / fascia mean, min, max (exact in fixed point)
+    /cost?pod=&level=                     cost engine output for one POD
+    POST /invalidate                      drop cached data and responses
+
+Dates are YYYYMMDD or YYYY-MM-DD, end inclusive; a single day can be asked
+with date=. Responses are compact column-oriented JSON ({"columns": [...],
+"data": [[...], ...]}, one list per column), or Arrow IPC streams with
+format=arrow or an "Accept: application/vnd.apache.arrow.stream" header.
+
+Every response carries an ETag built from the data version (the size and
+mtime of the store, meter and XML files), so clients can revalidate with If-None-Match and
+get 304s. Responses are kept in an in-memory LRU cache; when an ingestion
+run rewrites a source file the version changes and the cache is dropped.
+
+No CORS headers are sent unless an allowed origin is given with --cors-origin
+(or ONEENERGY_CORS_ORIGIN), e.g. the URL of a dashboard served elsewhere.
+
+Usage:
+    python src/py/pun_service.py --port 8765
+    python src/py/pun_service.py --cors-origin http://localhost:8501
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+import pandas as pd
+
+from cost_engine import AGGREGATION_LEVELS, PRICE_DATASETS, run_cost_engine
+from interval_store import (
+    DEFAULT_DB_PATH, ROLLUP_LEVELS, fixed_rollup, load_interval_store, read_fixed_dataset
+)
+from price_series import (
+    RESOLUTIONS, load_price_series, load_zone_series, day_start_utc_minutes, utc_minutes_to_day
+)
+from serialization import frame_to_arrow, frame_to_json
+
+DEFAULT_XML_PATH = Path(__file__).resolve().parents[2] / 'sources' / 'GME' / 'EE'
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+DEFAULT_RANGE_DAYS = 7
+CACHE_MAX_BYTES = 64 * 1024 * 1024
+VERSION_CHECK_SECONDS = 1.0
+GZIP_MIN_BYTES = 1024
+CORS_ENV = 'ONEENERGY_CORS_ORIGIN'  # Origin allowed to read responses cross-site
+
+ARROW_MIME = 'application/vnd.apache.arrow.stream'
+JSON_MIME = 'application/json'
+
+
+class QueryError(Exception):
+    """Bad request parameters (answered with HTTP 400)"""
+
+
+class ResponseCache:
+    """Thread-safe LRU of encoded responses, bounded by total bytes"""
+
+    def __init__(self, max_bytes=CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._items = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._items.get(key)
+            if item is not None:
+                self._items.move_to_end(key)
+            return item
+
+    def put(self, key, body, content_type):
+        if len(body) > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._items:
+                self._bytes -= len(self._items.pop(key)[0])
+            self._items[key] = (body, content_type)
+            self._bytes += len(body)
+            while self._bytes > self.max_bytes:
+                _, (old_body, _) = self._items.popitem(last=False)
+                self._bytes -= len(old_body)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self._bytes = 0
+
+    def __len__(self):
+        return len(self._items)
+
+
+class DataSource:
+    """
+    Lazily loaded price data, reloaded when the source files change
+
+    Args:
+        db_path: Folder with the price store and meter files
+        xml_path: Folder with MGPPrezzi XML files (zonal prices)
+    """
+
+    def __init__(self, db_path=DEFAULT_DB_PATH, xml_path=DEFAULT_XML_PATH):
+        self.db_path = Path(db_path)
+        self.xml_path = Path(xml_path)
+        self._lock = threading.RLock()
+        self._loaded = {}
+        self._version = None
+        self._checked_at = 0.0
+
+    def _signature(self):
+        """Size and mtime of every file the service reads (store, meters, XML)"""
+        files = sorted(self.db_path.glob('*.csv')) + sorted(self.db_path.glob('*.parquet'))
+        files += sorted((self.db_path / 'pods').glob('*'))
+        files += sorted(self.xml_path.glob('*MGPPrezzi.xml'))
+        parts = []
+        for path in files:
+            if path.is_file():
+                stat = path.stat()
+                parts.append(f"{path.name}:{stat.st_mtime_ns}:{stat.st_size}")
+        return hashlib.sha1('|'.join(parts).encode()).hexdigest()[:16]
+
+    def version(self):
+        """Current data version; drops loaded data when it changed"""
+        with self._lock:
+            now = time.monotonic()
+            if self._version is None or now - self._checked_at >= VERSION_CHECK_SECONDS:
+                version = self._signature()
+                if version != self._version:
+                    self._loaded.clear()
+                    self._version = version
+                self._checked_at = now
+            return self._version
+
+    def invalidate(self):
+        """Forget everything loaded (the next request re-reads the sources)"""
+        with self._lock:
+            self._loaded.clear()
+            self._version = None
+
+    def _get(self, key, loader):
+        with self._lock:
+            if key not in self._loaded:
+                self._loaded[key] = loader()
+            return self._loaded[key]
+
+    def prices(self, minutes=60, column='PUN'):
+        return self._get(('prices', minutes, column),
+                         lambda: load_price_series(self.db_path, PRICE_DATASETS[minutes], column))
+
+    def store(self, dataset='PUN-MGP'):
+        return self._get(('store', dataset), lambda: load_interval_store(self.db_path, dataset))
+
+    def fixed(self, dataset='PUN-MGP'):
+        """Exact fixed-point records of a dataset, None when it is stored as float"""
+        return self._get(('fixed', dataset), lambda: read_fixed_dataset(self.db_path, dataset))
+
+    def zones(self):
+        return self._get(('zones',), lambda: load_zone_series(self.xml_path))
+
+    def meter_path(self, pod):
+        """Meter file of a POD: any CSV in db/pods/, or an IT* CSV / parquet in db/
+
+        Other files in db/ (the price store, lookup tables) are not PODs.
+        """
+        candidates = []
+        if pod and Path(pod).name == pod and not pod.startswith('.'):
+            candidates.append(self.db_path / 'pods' / f'{pod}.csv')
+            if pod.startswith('IT'):
+                candidates += [self.db_path / f'{pod}.parquet', self.db_path / f'{pod}.csv']
+        for path in candidates:
+            if path.is_file():
+                return path
+        raise QueryError(f"Unknown POD: {pod}")
+
+
+def parse_day(text):
+    """YYYYMMDD or YYYY-MM-DD to a day number"""
+    try:
+        return int(np.datetime64(pd.Timestamp(text.replace('-', '')).date(), 'D').astype('int64'))
+    except ValueError:
+        raise QueryError(f"Invalid date: {text}")
+
+
+def day_range(params, last_day):
+    """Inclusive (start, end) day numbers from date / start / end parameters"""
+    if 'date' in params:
+        day = parse_day(params['date'])
+        return day, day
+    end = parse_day(params['end']) if 'end' in params else last_day
+    start = parse_day(params['start']) if 'start' in params else end - DEFAULT_RANGE_DAYS + 1
+    if start > end:
+        raise QueryError("start is after end")
+    return start, end
+
+
+def _choice(params, name, choices, default):
+    value = params.get(name, default)
+    if value not in choices:
+        raise QueryError(f"{name} must be one of {sorted(choices)}")
+    return value
+
+
+def _series_window(series, start_day, end_day):
+    """Sub-series covering the local days [start_day, end_day]"""
+    if not series.minutes:
+        return series.window(start_day, end_day + 1)
+    start, end = series.index_of(day_start_utc_minutes([start_day, end_day + 1], series.day_start_hour))
+    return series.window(start, end)
+
+
+def _last_day(series):
+    """Local day of the last interval of a series"""
+    if not series.minutes:
+        return series.end - 1
+    return int(utc_minutes_to_day(series.start_utc_minutes(series.end - 1), series.day_start_hour))
+
+
+class QueryService:
+    """Endpoint implementations returning DataFrames"""
+
+    def __init__(self, source):
+        self.source = source
+
+    def health(self, params):
+        return pd.DataFrame({'status': ['ok'], 'version': [self.source.version()]})
+
+    def dates(self, params):
+        daily = self.source.prices(60).resample('day')
+        days = np.arange(daily.first, daily.end)[daily.valid]
+        return pd.DataFrame({'Date': days.astype('datetime64[D]')})
+
+    def pun(self, params):
+        resolution = _choice(params, 'resolution', RESOLUTIONS, 'hour')
+        minutes = 15 if resolution == '15min' else 60
+        series = self.source.prices(minutes)
+        start, end = day_range(params, _last_day(series))
+        window = _series_window(series, start, end)
+        return window.resample(resolution).to_frame()
+
+    def zones(self, params):
+        zones = self.source.zones()
+        if not zones:
+            raise QueryError("No MGPPrezzi XML files available")
+        names = params['zone'].split(',') if 'zone' in params else sorted(zones)
+        unknown = [name for name in names if name not in zones]
+        if unknown:
+            raise QueryError(f"Unknown zones: {unknown}")
+
+        reference = zones[names[0]]
+        start, end = day_range(params, _last_day(reference))
+        frame = None
+        for name in names:
+            part = _series_window(zones[name], start, end).to_frame(valid_only=False)
+            frame = part if frame is None else frame.assign(**{name: part[name].to_numpy()})
+        return frame.dropna(subset=names, how='all').reset_index(drop=True)
+
+    def rollup(self, params):
+        level = _choice(params, 'level', ROLLUP_LEVELS, 'day')
+        dataset = _choice(params, 'dataset', set(PRICE_DATASETS.values()), 'PUN-MGP')
+        store = self.source.store(dataset)
+        start, end = day_range(params, store.last_day)
+        fixed = self.source.fixed(dataset)
+        if fixed:
+            return fixed_rollup(*fixed, level, start, end)
+        return store.rollup(level, start, end)
+
+    def cost(self, params):
+        if 'pod' not in params:
+            raise QueryError("pod is required")
+        level = _choice(params, 'level', AGGREGATION_LEVELS, 'month')
+        path = self.source.meter_path(params['pod'])
+        results = run_cost_engine(path, self.source.db_path, levels=(level,),
+                                  prices=self.source.prices(60))
+        return results[level]
+
+    ROUTES = {
+        '/health': 'health',
+        '/dates': 'dates',
+        '/pun': 'pun',
+        '/zones': 'zones',
+        '/rollup': 'rollup',
+        '/cost': 'cost',
+    }
+
+
+def make_handler(service, cache, cors_origin=None):
+    """Request handler class bound to a QueryService and a ResponseCache
+
+    Args:
+        service: QueryService answering the GET endpoints
+        cache: ResponseCache of encoded responses
+        cors_origin: Value of Access-Control-Allow-Origin, or None to send no CORS headers
+    """
+
+    class Handler(BaseHTTPRequestHandler):
+        server_version = 'OneEnergyPUN/1.0'
+
+        def log_message(self, format, *args):
+            pass
+
+        def _send(self, status, body=b'', content_type=JSON_MIME, etag=None):
+            if body and len(body) >= GZIP_MIN_BYTES and 'gzip' in self.headers.get('Accept-Encoding', ''):
+                body = gzip.compress(body, compresslevel=5)
+                encoding = 'gzip'
+            else:
+                encoding = None
+            self.send_response(status)
+            if cors_origin:
+                self.send_header('Access-Control-Allow-Origin', cors_origin)
+                self.send_header('Access-Control-Expose-Headers', 'ETag')
+                if cors_origin != '*':
+                    self.send_header('Vary', 'Origin')
+            self.send_header('Cache-Control', 'no-cache')
+            if etag:
+                self.send_header('ETag', etag)
+            if body:
+                self.send_header('Content-Type', content_type)
+                if encoding:
+                    self.send_header('Content-Encoding', encoding)
+                    self.send_header('Vary', 'Accept-Encoding')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            if body:
+                self.wfile.write(body)
+
+        def _error(self, status, message):
+            self._send(status, json.dumps({'error': message}).encode())
+
+        def do_GET(self):
+            url = urlsplit(self.path)
+            method = QueryService.ROUTES.get(url.path.rstrip('/') or '/')
+            if method is None:
+                return self._error(404, f"Unknown endpoint: {url.path}")
+
+            params = {k: v[-1] for k, v in parse_qs(url.query).items()}
+            wants_arrow = (params.pop('format', None) == 'arrow'
+                           or ARROW_MIME in self.headers.get('Accept', ''))
+            version = service.source.version()
+            key = (url.path, tuple(sorted(params.items())), wants_arrow, version)
+            etag = '"' + hashlib.sha1(repr(key).encode()).hexdigest()[:20] + '"'
+
+            if etag in self.headers.get('If-None-Match', ''):
+                return self._send(304, etag=etag)
+
+            cached = cache.get(key)
+            if cached is None:
+                try:
+                    frame = getattr(service, method)(params)
+                except QueryError as e:
+                    return self._error(400, str(e))
+                except FileNotFoundError as e:
+                    return self._error(404, str(e))
+                except Exception:
+                    traceback.print_exc(file=sys.stderr)
+                    return self._error(500, f"Internal error while answering {url.path}")
+                if wants_arrow:
+                    cached = (frame_to_arrow(frame), ARROW_MIME)
+                else:
+                    cached = (frame_to_json(frame), JSON_MIME)
+                cache.put(key, *cached)
+            self._send(200, cached[0], cached[1], etag)
+
+        def do_POST(self):
+            if urlsplit(self.path).path.rstrip('/') != '/invalidate':
+                return self._error(404, f"Unknown endpoint: {self.path}")
+            service.source.invalidate()
+            cache.clear()
+            self._send(200, json.dumps({'status': 'invalidated'}).encode())
+
+        def do_OPTIONS(self):
+            self.send_response(204)
+            if cors_origin:
+                self.send_header('Access-Control-Allow-Origin', cors_origin)
+                self.send_header('Access-Control-Allow-Methods', 'GET, POST, OPTIONS')
+                self.send_header('Access-Control-Allow-Headers', 'If-None-Match, Accept')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+
+    return Handler
+
+
+class VersionedCache(ResponseCache):
+    """ResponseCache that empties itself when the data version changes"""
+
+    def __init__(self, max_bytes=CACHE_MAX_BYTES):
+        super().__init__(max_bytes)
+        self._seen_version = None
+
+    def get(self, key):
+        version = key[-1]
+        if version != self._seen_version:
+            self.clear()
+            self._seen_version = version
+        return super().get(key)
+
+
+def create_server(host=DEFAULT_HOST, port=DEFAULT_PORT, db_path=DEFAULT_DB_PATH,
+                  xml_path=DEFAULT_XML_PATH, cache_bytes=CACHE_MAX_BYTES, cors_origin=None):
+    """Build the (not yet started) threaded HTTP server"""
+    source = DataSource(db_path, xml_path)
+    cache = VersionedCache(cache_bytes)
+    handler = make_handler(QueryService(source), cache, cors_origin)
+    return ThreadingHTTPServer((host, port), handler)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Local HTTP query service for PUN data")
+    parser.add_argument('--host', default=DEFAULT_HOST)
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--db', default=str(DEFAULT_DB_PATH), help='Folder with the price store')
+    parser.add_argument('--xml', default=str(DEFAULT_XML_PATH), help='Folder with MGPPrezzi XML files')
+    parser.add_argument('--cache-mb', type=int, default=CACHE_MAX_BYTES // 1024 // 1024)
+    parser.add_argument('--cors-origin', default=os.environ.get(CORS_ENV) or None,
+                        help=f'Origin allowed to read responses cross-site (default: ${CORS_ENV}, none)')
+    args = parser.parse_args(argv)
+
+    server = create_server(args.host, args.port, args.db, args.xml, args.cache_mb * 1024 * 1024,
+                           args.cors_origin)
+    print(f"Serving PUN data from {args.db} on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
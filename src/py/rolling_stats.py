@@ -0,0 +1,385 @@
+"""
+Incrementally maintained rolling statistics over a price series.
+
+For every day of an IntervalStore the engine keeps sufficient statistics per
+group (all intervals, and each fascia F1/F2/F3): count, sum, sum of squares,
+min, max and a quantile sketch. Rolling indicators (moving mean, volatility,
+min/max, percentile bands, peak/off-peak spread) are reductions over the day
+rows of a window and never go back to the raw history:
+
+    mean, variance   prefix sums, O(1) per window
+    min, max         O(window)
+    quantiles        O(window) merge of the daily sketches
+
+The sketch is a logarithmic histogram with fixed buckets (as in DDSketch):
+quantiles come back within SKETCH_ACCURACY relative error, and the sketches
+of several days merge by adding their counts.
+
+The statistics are saved as rolling_stats.npz in the store's dense cache
+folder, together with a fingerprint of each day's prices, so an update only
+recomputes the days that are new or whose prices changed.
+"""
+import argparse
+import json
+import os
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from download_and_read_excel import get_fascia_codes, interval_gme_hours
+from interval_store import CACHE_DIRNAME, DEFAULT_DB_PATH, load_interval_store, source_signature
+
+STATS_FILENAME = 'rolling_stats.npz'
+STATS_FORMAT = 1
+
+# Group 0 is every interval, groups 1-3 the fascia codes
+GROUPS = ('all', 'F1', 'F2', 'F3')
+DEFAULT_WINDOWS = (7, 30, 90)
+DEFAULT_QUANTILES = (0.1, 0.5, 0.9)
+
+# Relative-accuracy sketch over (SKETCH_MIN, SKETCH_MAX] EUR/MWh; lower prices share bucket 0
+SKETCH_ACCURACY = 0.01
+SKETCH_GAMMA = (1 + SKETCH_ACCURACY) / (1 - SKETCH_ACCURACY)
+SKETCH_MIN = 1.0
+SKETCH_MAX = 4000.0
+SKETCH_BUCKETS = int(np.ceil(np.log(SKETCH_MAX / SKETCH_MIN) / np.log(SKETCH_GAMMA))) + 1
+
+
+def sketch_bucket(values):
+    """Sketch bucket of each price (0 for prices up to SKETCH_MIN)"""
+    with np.errstate(invalid='ignore', divide='ignore'):
+        scaled = np.log(np.maximum(np.asarray(values, dtype='float64'), SKETCH_MIN) / SKETCH_MIN)
+        buckets = np.ceil(scaled / np.log(SKETCH_GAMMA))
+    return np.clip(np.nan_to_num(buckets), 0, SKETCH_BUCKETS - 1).astype('int64')
+
+
+def bucket_value(buckets):
+    """Representative price of sketch buckets (bucket 0 reports SKETCH_MIN)"""
+    buckets = np.asarray(buckets)
+    values = SKETCH_MIN * 2 * SKETCH_GAMMA ** buckets / (SKETCH_GAMMA + 1)
+    return np.where(buckets == 0, SKETCH_MIN, values)
+
+
+def sketch_quantiles(sketches, quantiles, mins, maxs):
+    """
+    Quantiles of merged sketches, clamped to the exact window min and max
+
+    Args:
+        sketches: (windows x buckets) counts
+        quantiles: Probabilities in [0, 1]
+        mins, maxs: Exact min and max of each window
+
+    Returns:
+        np.ndarray: (windows x quantiles), NaN for empty windows
+    """
+    cumulative = np.cumsum(sketches, axis=1)
+    totals = cumulative[:, -1]
+    result = np.full((len(sketches), len(quantiles)), np.nan)
+    for j, q in enumerate(quantiles):
+        rank = q * (totals - 1)
+        buckets = (cumulative > rank[:, None]).argmax(axis=1)
+        result[:, j] = np.clip(bucket_value(buckets), mins, maxs)
+    result[totals == 0] = np.nan
+    return result
+
+
+def day_fingerprints(values):
+    """Order-sensitive integer digest of each day row, to spot changed days"""
+    bits = np.ascontiguousarray(values, dtype='float32').view('uint32').astype('uint64')
+    weights = np.arange(1, bits.shape[1] + 1, dtype='uint64') * np.uint64(2654435761)
+    return (bits * weights).sum(axis=1, dtype='uint64') ^ (bits.sum(axis=1, dtype='uint64') << np.uint64(32))
+
+
+def day_statistics(values, codes):
+    """
+    Per-day sufficient statistics of each group
+
+    Args:
+        values: (days x stride) prices, NaN where missing
+        codes: (days x stride) fascia codes
+
+    Returns:
+        dict: counts, sums, sumsqs, mins, maxs as (days x groups) arrays and
+        sketches as (days x groups x buckets) uint8 counts
+    """
+    values = np.asarray(values, dtype='float64')
+    observed = ~np.isnan(values)
+    n_days = len(values)
+    buckets = sketch_bucket(values)
+    shape = (n_days, len(GROUPS))
+    stats = {
+        'counts': np.zeros(shape, dtype='int32'),
+        'sums': np.zeros(shape),
+        'sumsqs': np.zeros(shape),
+        'mins': np.full(shape, np.nan, dtype='float32'),
+        'maxs': np.full(shape, np.nan, dtype='float32'),
+        'sketches': np.zeros(shape + (SKETCH_BUCKETS,), dtype='uint8'),
+    }
+    for group in range(len(GROUPS)):
+        selected = observed if group == 0 else observed & (codes == group)
+        masked = np.where(selected, values, 0.0)
+        counts = selected.sum(axis=1)
+        stats['counts'][:, group] = counts
+        stats['sums'][:, group] = masked.sum(axis=1)
+        stats['sumsqs'][:, group] = (masked * masked).sum(axis=1)
+        has_data = counts > 0
+        stats['mins'][has_data, group] = np.where(selected, values, np.inf).min(axis=1)[has_data]
+        stats['maxs'][has_data, group] = np.where(selected, values, -np.inf).max(axis=1)[has_data]
+        rows, slots = np.nonzero(selected)
+        flat = np.bincount(rows * SKETCH_BUCKETS + buckets[rows, slots], minlength=n_days * SKETCH_BUCKETS)
+        stats['sketches'][:, group] = flat.reshape(n_days, SKETCH_BUCKETS)
+    return stats
+
+
+def _fascia_rows(store, rows):
+    """Fascia codes of selected store rows (0 on the DST padding)"""
+    hours = interval_gme_hours(np.arange(1, store.stride + 1), store.minutes)
+    codes = get_fascia_codes(store.days[rows][:, None], hours[None, :])
+    codes[np.arange(store.stride)[None, :] >= store.counts[rows][:, None]] = 0
+    return codes
+
+
+class RollingStats:
+    """
+    Per-day, per-group statistics of a price series with rolling-window queries
+
+    Args:
+        first_day: Day number of row 0
+        minutes: Resolution of the source series
+        fingerprints: (days,) digests of the rows the statistics came from
+        **arrays: The day_statistics arrays
+    """
+
+    ARRAYS = ('counts', 'sums', 'sumsqs', 'mins', 'maxs', 'sketches')
+
+    def __init__(self, first_day, minutes, fingerprints, signature='', **arrays):
+        self.first_day = int(first_day)
+        self.minutes = int(minutes)
+        self.fingerprints = fingerprints
+        self.signature = signature
+        for name in self.ARRAYS:
+            setattr(self, name, arrays[name])
+
+    @classmethod
+    def from_store(cls, store, signature=''):
+        rows = np.arange(store.n_days)
+        stats = day_statistics(store.values, _fascia_rows(store, rows))
+        return cls(store.first_day, store.minutes, day_fingerprints(store.values), signature, **stats)
+
+    @property
+    def n_days(self):
+        return len(self.fingerprints)
+
+    @property
+    def days(self):
+        return np.arange(self.first_day, self.first_day + self.n_days, dtype='int64')
+
+    def update(self, store, signature=''):
+        """
+        Bring the statistics in line with store, recomputing only changed days
+
+        Returns:
+            int: Number of days recomputed
+        """
+        if store.first_day != self.first_day or store.minutes != self.minutes:
+            fresh = RollingStats.from_store(store, signature)
+            self.__dict__.update(fresh.__dict__)
+            return self.n_days
+
+        fingerprints = day_fingerprints(store.values)
+        kept = min(self.n_days, store.n_days)
+        changed = np.flatnonzero(fingerprints[:kept] != self.fingerprints[:kept])
+        rows = np.r_[changed, np.arange(kept, store.n_days)].astype('int64')
+
+        for name in self.ARRAYS:
+            current = getattr(self, name)[:kept]
+            if store.n_days > kept:
+                grown = np.zeros((store.n_days,) + current.shape[1:], dtype=current.dtype)
+                grown[:kept] = current
+                current = grown
+            else:
+                current = np.array(current)
+            setattr(self, name, current)
+
+        if len(rows):
+            stats = day_statistics(store.values[rows], _fascia_rows(store, rows))
+            for name in self.ARRAYS:
+                getattr(self, name)[rows] = stats[name]
+        self.fingerprints = fingerprints
+        self.signature = signature
+        return len(rows)
+
+    def _group(self, group):
+        if group not in GROUPS:
+            raise ValueError(f"Unknown group: {group}")
+        return GROUPS.index(group)
+
+    def _end_row(self, end):
+        if end is None:
+            return self.n_days
+        if not isinstance(end, (int, np.integer)):
+            end = int(np.datetime64(pd.Timestamp(end).date(), 'D').astype('int64'))
+        return int(np.clip(end - self.first_day + 1, 0, self.n_days))
+
+    def window(self, days=30, group='all', end=None, quantiles=DEFAULT_QUANTILES):
+        """
+        Statistics of the days-long window ending on end (the last day by default)
+
+        Returns:
+            dict: Count, Mean, Std, Min, Max and one P<nn> entry per quantile
+        """
+        g = self._group(group)
+        hi = self._end_row(end)
+        lo = max(hi - days, 0)
+        count = int(self.counts[lo:hi, g].sum())
+        result = {'Count': count}
+        if count == 0:
+            result.update(Mean=np.nan, Std=np.nan, Min=np.nan, Max=np.nan)
+            result.update({f'P{round(q * 100):02d}': np.nan for q in quantiles})
+            return result
+        mean = self.sums[lo:hi, g].sum() / count
+        variance = max(self.sumsqs[lo:hi, g].sum() / count - mean * mean, 0.0)
+        low, high = np.fmin.reduce(self.mins[lo:hi, g]), np.fmax.reduce(self.maxs[lo:hi, g])
+        merged = self.sketches[lo:hi, g].sum(axis=0, dtype='int64')[None, :]
+        bands = sketch_quantiles(merged, quantiles, np.array([low]), np.array([high]))[0]
+        result.update(Mean=mean, Std=np.sqrt(variance), Min=float(low), Max=float(high))
+        result.update({f'P{round(q * 100):02d}': float(v) for q, v in zip(quantiles, bands)})
+        return result
+
+    def rolling(self, days=30, group='all', quantiles=DEFAULT_QUANTILES):
+        """
+        Trailing days-long window statistics for every day of the history
+
+        Windows are NaN until days rows are available, as in pandas rolling.
+
+        Returns:
+            pd.DataFrame: Date, Count, Mean, Std, Min, Max and P<nn> columns
+        """
+        g = self._group(group)
+        n = self.n_days
+        frame = pd.DataFrame({'Date': self.days.astype('datetime64[D]')})
+        columns = ['Count', 'Mean', 'Std', 'Min', 'Max'] + [f'P{round(q * 100):02d}' for q in quantiles]
+        full = np.full((n, len(columns)), np.nan)
+        if n >= days:
+            def windowed(values):
+                prefix = np.r_[np.zeros((1,) + values.shape[1:], dtype=values.dtype), np.cumsum(values, axis=0)]
+                return prefix[days:] - prefix[:-days]
+
+            counts = windowed(self.counts[:, g].astype('int64'))
+            with np.errstate(divide='ignore', invalid='ignore'):
+                means = windowed(self.sums[:, g]) / counts
+                variances = np.maximum(windowed(self.sumsqs[:, g]) / counts - means * means, 0.0)
+            view = np.lib.stride_tricks.sliding_window_view
+            # fmin/fmax skip NaN days without warning on all-empty windows
+            mins = np.fmin.reduce(view(self.mins[:, g], days), axis=1)
+            maxs = np.fmax.reduce(view(self.maxs[:, g], days), axis=1)
+            sketches = windowed(self.sketches[:, g].astype('int32'))
+            bands = sketch_quantiles(sketches, quantiles, mins, maxs)
+            full[days - 1:] = np.column_stack([counts, means, np.sqrt(variances), mins, maxs, bands])
+            full[days - 1:][counts == 0, 1:] = np.nan
+        frame[columns] = full
+        return frame
+
+    def peak_spread(self, days=30, end=None):
+        """Mean F1 price minus mean F2+F3 price over the window"""
+        hi = self._end_row(end)
+        lo = max(hi - days, 0)
+        sums, counts = self.sums[lo:hi].sum(axis=0), self.counts[lo:hi].sum(axis=0)
+        off_peak = counts[2] + counts[3]
+        if counts[1] == 0 or off_peak == 0:
+            return np.nan
+        return sums[1] / counts[1] - (sums[2] + sums[3]) / off_peak
+
+    def latest(self, windows=DEFAULT_WINDOWS, end=None, quantiles=DEFAULT_QUANTILES):
+        """
+        Indicators of every window and group at one day, for the daily reports
+
+        Returns:
+            pd.DataFrame: Window, Group, statistics and the window's peak spread
+        """
+        rows = []
+        for days in windows:
+            spread = self.peak_spread(days, end)
+            for group in GROUPS:
+                rows.append({'Window': days, 'Group': group,
+                             **self.window(days, group, end, quantiles), 'PeakSpread': spread})
+        return pd.DataFrame(rows)
+
+    def save(self, path):
+        """Write the statistics atomically to an .npz file"""
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        meta = {'format': STATS_FORMAT, 'first_day': self.first_day, 'minutes': self.minutes,
+                'signature': self.signature, 'buckets': SKETCH_BUCKETS, 'accuracy': SKETCH_ACCURACY}
+        tmp = path.with_name(f'{path.stem}.{os.getpid()}.tmp.npz')
+        np.savez_compressed(tmp, meta=np.array(json.dumps(meta)), fingerprints=self.fingerprints,
+                            **{name: getattr(self, name) for name in self.ARRAYS})
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path):
+        """Open saved statistics, or None when missing or built with another sketch"""
+        path = Path(path)
+        if not path.exists():
+            return None
+        with np.load(path) as data:
+            meta = json.loads(str(data['meta']))
+            if (meta.get('format'), meta.get('buckets'), meta.get('accuracy')) != (
+                    STATS_FORMAT, SKETCH_BUCKETS, SKETCH_ACCURACY):
+                return None
+            arrays = {name: data[name] for name in cls.ARRAYS}
+            return cls(meta['first_day'], meta['minutes'], data['fingerprints'], meta['signature'], **arrays)
+
+
+def stats_path(db_path, dataset='PUN-MGP', value_col='PUN'):
+    """rolling_stats.npz next to the dense store cache of a dataset"""
+    return Path(db_path) / CACHE_DIRNAME / f'{dataset}.{value_col}' / STATS_FILENAME
+
+
+def update_rolling_stats(db_path=DEFAULT_DB_PATH, dataset='PUN-MGP', value_col='PUN'):
+    """
+    Load the saved statistics of a dataset and bring them up to date
+
+    Args:
+        db_path: Folder with <dataset>.parquet or <dataset>.csv
+        dataset: Price dataset
+        value_col: Price column
+
+    Returns:
+        tuple: (RollingStats, days recomputed)
+    """
+    path = stats_path(db_path, dataset, value_col)
+    signature = source_signature(db_path, dataset)
+    stats = RollingStats.load(path)
+    if stats is not None and stats.signature == signature:
+        return stats, 0
+
+    store = load_interval_store(db_path, dataset, value_col)
+    if stats is None:
+        stats, recomputed = RollingStats.from_store(store, signature), store.n_days
+    else:
+        recomputed = stats.update(store, signature)
+    stats.save(path)
+    return stats, recomputed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Rolling price statistics')
+    parser.add_argument('--db', type=Path, default=DEFAULT_DB_PATH, help='Folder with the dataset')
+    parser.add_argument('--dataset', default='PUN-MGP', help='Price dataset')
+    parser.add_argument('--column', default='PUN', help='Price column')
+    parser.add_argument('--windows', type=int, nargs='+', default=list(DEFAULT_WINDOWS), help='Window lengths in days')
+    args = parser.parse_args(argv)
+
+    stats, recomputed = update_rolling_stats(args.db, args.dataset, args.column)
+    last = np.datetime64(stats.first_day + stats.n_days - 1, 'D')
+    print(f"{args.dataset}.{args.column}: {stats.n_days} days, {recomputed} recomputed, last day {last}")
+    with pd.option_context('display.width', 160, 'display.max_columns', None):
+        print(stats.latest(args.windows).round(2).to_string(index=False))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,47 @@
+"""
+Compact serialization of query results.
+
+Shared by the HTTP query service (pun_service.py) and the static artifacts
+(static_shards.py), so writing files does not import the server.
+"""
+import io
+import json
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+
+def frame_to_json(frame):
+    """
+    Compact column-oriented JSON: dates as YYYYMMDD ints, NaN as null
+
+    float32 columns (the store's prices) are written with the shortest text
+    that reads back as the same float32, so 97.71 stays 97.71 rather than
+    the 97.709999 of its float64 widening; float64 columns are rounded to 6
+    decimals.
+    """
+    data = []
+    for column in frame.columns:
+        values = frame[column]
+        if pd.api.types.is_datetime64_any_dtype(values):
+            values = values.dt.strftime('%Y%m%d').astype('int64')
+        if values.dtype == np.float32:
+            texts = values.to_numpy().astype('U').tolist()  # numpy prints float32 in shortest form
+            data.append([None if text == 'nan' else float(text) for text in texts])
+        elif pd.api.types.is_float_dtype(values):
+            values = values.astype('float64').round(6)
+            data.append([None if np.isnan(v) else v for v in values.tolist()])
+        else:
+            data.append(values.tolist())
+    payload = {'columns': [str(c) for c in frame.columns], 'rows': len(frame), 'data': data}
+    return json.dumps(payload, separators=(',', ':'), default=str).encode()
+
+
+def frame_to_arrow(frame):
+    """Arrow IPC stream bytes"""
+    table = pa.Table.from_pandas(frame, preserve_index=False)
+    sink = io.BytesIO()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue()
@@ -0,0 +1,194 @@
+"""
+Static, pre-sharded PUN artifacts for the front-end chart.
+
+The chart (src/pun-chart-fixed.tsx) is served as static files, so instead of
+querying a server it fetches precomputed artifacts from public/data/pun/:
+
+    index.json          available dates, shard list and binary layout
+    summary.json        monthly and monthly-by-fascia rollups
+    YYYY/YYYY-MM.bin    one shard per month
+
+A shard is the month's rows of the dense IntervalStore, written as two
+little-endian blocks: float32 prices [days x stride] (NaN in the padding
+slots of short DST days) followed by uint8 fascia codes [days x stride]
+(1=F1, 2=F2, 3=F3, 0 where there is no price). An hourly month is about
+4 KB, small enough to fetch on demand without compression.
+
+Every shard's content hash is kept in index.json; a rerun writes only the
+months whose bytes changed, so a daily update touches a single shard.
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+
+from instrumentation import span
+from interval_store import DEFAULT_DB_PATH, fixed_rollup, load_interval_store, read_fixed_dataset
+from serialization import frame_to_json
+
+DEFAULT_OUTPUT_PATH = Path(__file__).resolve().parents[2] / 'public' / 'data' / 'pun'
+SHARD_FORMAT = 1
+
+LAYOUT = {
+    'byte_order': 'little',
+    'blocks': [
+        {'name': 'pun', 'dtype': 'float32', 'shape': ['days', 'stride'], 'missing': 'NaN'},
+        {'name': 'fascia', 'dtype': 'uint8', 'shape': ['days', 'stride'], 'codes': ['', 'F1', 'F2', 'F3']},
+    ],
+}
+
+
+def _write_atomic(path, payload):
+    """Write bytes to path through a temporary file, so readers never see a partial file"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f'{path.name}.{os.getpid()}.tmp')
+    tmp.write_bytes(payload)
+    os.replace(tmp, path)
+
+
+def month_runs(store):
+    """
+    Row ranges of each calendar month in the store
+
+    Returns:
+        list: (YYYY-MM, first row, end row) tuples
+    """
+    months = store.days.astype('datetime64[D]').astype('datetime64[M]')
+    if not len(months):
+        return []
+    starts = np.flatnonzero(np.r_[True, months[1:] != months[:-1]])
+    ends = np.r_[starts[1:], len(months)]
+    return [(str(months[lo]), int(lo), int(hi)) for lo, hi in zip(starts, ends)]
+
+
+def shard_bytes(values, codes):
+    """Serialize one month of prices and fascia codes in the LAYOUT order"""
+    values = np.ascontiguousarray(values, dtype='<f4')
+    codes = np.where(np.isnan(values), 0, codes).astype('uint8')
+    return values.tobytes() + codes.tobytes()
+
+
+def read_index(output):
+    """Existing index.json of an export folder, or None"""
+    path = Path(output) / 'index.json'
+    if not path.exists():
+        return None
+    try:
+        return json.loads(path.read_text(encoding='utf-8'))
+    except ValueError:
+        return None
+
+
+def _date_strings(days):
+    """Day numbers -> YYYYMMDD strings, the date format of the chart"""
+    return np.datetime_as_string(days.astype('datetime64[D]')).astype('U10')
+
+
+def export_shards(db_path=DEFAULT_DB_PATH, output=DEFAULT_OUTPUT_PATH, dataset='PUN-MGP', force=False):
+    """
+    Write the month shards, index.json and summary.json for a price dataset
+
+    Args:
+        db_path: Database folder with <dataset>.parquet or .csv
+        output: Folder the front-end serves the artifacts from
+        dataset: Price dataset (PUN-MGP or PUN-MGP-15)
+        force: Rewrite every shard even when its hash is unchanged
+
+    Returns:
+        dict: Counts of written, unchanged and removed shards
+    """
+    output = Path(output)
+    with span('shards.load'):
+        store = load_interval_store(db_path, dataset)
+        codes = store.fascia_codes()
+
+    previous = read_index(output) or {}
+    compatible = (previous.get('format') == SHARD_FORMAT and previous.get('dataset') == dataset
+                  and previous.get('stride') == store.stride)
+    known = {m['month']: m['sha1'] for m in previous.get('months', [])} if compatible and not force else {}
+
+    months, stats = [], {'written': 0, 'unchanged': 0, 'removed': 0}
+    with span('shards.write') as s:
+        for month, lo, hi in month_runs(store):
+            payload = shard_bytes(store.values[lo:hi], codes[lo:hi])
+            digest = hashlib.sha1(payload).hexdigest()
+            relative = f'{month[:4]}/{month}.bin'
+            if known.get(month) == digest and (output / relative).exists():
+                stats['unchanged'] += 1
+            else:
+                _write_atomic(output / relative, payload)
+                stats['written'] += 1
+                s.add(bytes=len(payload))
+            months.append({
+                'month': month,
+                'file': relative,
+                'first_date': str(_date_strings(store.days[lo:lo + 1])[0]).replace('-', ''),
+                'days': hi - lo,
+                'intervals': store.counts[lo:hi].tolist(),  # slots per day (23/24/25 or 92/96/100)
+                'bytes': len(payload),
+                'sha1': digest,
+            })
+        s.add(rows=len(months))
+
+    # Shards of months no longer in the dataset
+    current = {m['file'] for m in months}
+    for entry in previous.get('months', []):
+        stale = output / entry.get('file', '')
+        if entry.get('file') not in current and stale.is_file():
+            stale.unlink()
+            stats['removed'] += 1
+
+    with span('shards.summary'):
+        fixed = read_fixed_dataset(db_path, dataset)  # Exact totals when stored in fixed point
+        monthly = fixed_rollup(*fixed, 'month') if fixed else store.rollup('month')
+        fascia = fixed_rollup(*fixed, 'fascia') if fixed else store.rollup('fascia')
+        for frame in (monthly, fascia):
+            frame['Month'] = frame['Month'].dt.strftime('%Y-%m')
+        summary = b'{"monthly":' + frame_to_json(monthly) + b',"fascia":' + frame_to_json(fascia) + b'}'
+        _write_atomic(output / 'summary.json', summary)
+
+    available = store.days[(~np.isnan(store.values)).any(axis=1)]
+    dates = [d.replace('-', '') for d in _date_strings(available).tolist()]
+    index = {
+        'format': SHARD_FORMAT,
+        'dataset': dataset,
+        'resolution_minutes': store.minutes,
+        'stride': store.stride,
+        'layout': LAYOUT,
+        'generated_at': datetime.now().isoformat(timespec='seconds'),
+        'first_date': dates[0] if dates else None,
+        'last_date': dates[-1] if dates else None,
+        'dates': dates,
+        'months': months,
+        'summary': 'summary.json',
+    }
+    # The index goes last: a client reading it finds every shard it lists
+    _write_atomic(output / 'index.json', json.dumps(index, separators=(',', ':')).encode())
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Export static PUN shards for the front-end chart')
+    parser.add_argument('--db', type=Path, default=DEFAULT_DB_PATH, help='Database folder')
+    parser.add_argument('--output', type=Path, default=DEFAULT_OUTPUT_PATH, help='Artifact folder')
+    parser.add_argument('--dataset', default='PUN-MGP', help='Price dataset (PUN-MGP or PUN-MGP-15)')
+    parser.add_argument('--force', action='store_true', help='Rewrite every shard')
+    args = parser.parse_args(argv)
+
+    if not any((args.db / f'{args.dataset}{suffix}').exists() for suffix in ('.parquet', '.csv')):
+        print(f"Error: {args.dataset} not found in {args.db}")
+        return 1
+
+    stats = export_shards(args.db, args.output, args.dataset, args.force)
+    print(f"Shards in {args.output}: {stats['written']} written, "
+          f"{stats['unchanged']} unchanged, {stats['removed']} removed")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
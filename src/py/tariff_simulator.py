@@ -0,0 +1,282 @@
+"""
+Tariff what-if simulator over a portfolio of PODs.
+
+Every supported tariff is linear in a handful of per-POD, per-month
+statistics (energy and PUN-weighted energy per fascia, PUN-valued injection
+and the number of billed months). Each POD file is reduced to those
+statistics once, in a process pool, and the whole tariff grid is then
+evaluated with a single matrix product.
+
+Tariff kinds:
+    single      one fixed price for every hour
+    three_band  fixed F1/F2/F3 prices
+    pun         PUN-indexed: PUN + spread
+
+Every tariff also carries loss (network loss factor applied to energy), fee_mwh
+(EUR/MWh on withdrawn energy), fixed_month (EUR per billed month) and
+feed_in_share (share of the PUN paid back on ATTIVA_IMMESSA).
+
+Intervals without a PUN are left out of every statistic, so all tariffs are
+compared on the same priced intervals, and counted as MissingPrice.
+"""
+import itertools
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from cost_engine import (
+    DEFAULT_DB_PATH, DEFAULT_CHUNK_ROWS, METER_COLUMNS, ENERGY_COLUMN,
+    load_prices, meter_utc_minutes, interval_fascia_codes,
+    iter_meter_chunks
+)
+
+INJECTION_COLUMN = 'ATTIVA_IMMESSA'
+STAT_COLUMNS = ['E1', 'E2', 'E3', 'W1', 'W2', 'W3', 'InjectedPUN', 'Months']
+COUNT_COLUMNS = ['MissingPrice']  # Summed and reported, not priced
+TARIFF_COLUMNS = [
+    'kind', 'p_f1', 'p_f2', 'p_f3', 'spread', 'pun_weight',
+    'loss', 'fee_mwh', 'fixed_month', 'feed_in_share'
+]
+TARIFF_DEFAULTS = {
+    'p_f1': 0.0, 'p_f2': 0.0, 'p_f3': 0.0, 'spread': 0.0, 'pun_weight': 0.0,
+    'loss': 0.0, 'fee_mwh': 0.0, 'fixed_month': 0.0, 'feed_in_share': 0.0,
+}
+
+_worker_prices = None
+
+
+def tariff(kind, price=None, f1=None, f2=None, f3=None, spread=0.0, **params):
+    """
+    Describe one tariff as a row of the tariff grid
+
+    Args:
+        kind: 'single', 'three_band' or 'pun'
+        price: Fixed price (single), EUR/MWh
+        f1, f2, f3: Band prices (three_band), EUR/MWh
+        spread: Spread over PUN (pun), EUR/MWh
+        **params: loss, fee_mwh, fixed_month, feed_in_share
+
+    Returns:
+        dict: Tariff row
+    """
+    row = dict(TARIFF_DEFAULTS, kind=kind)
+    if kind == 'single':
+        row.update(p_f1=price, p_f2=price, p_f3=price)
+    elif kind == 'three_band':
+        row.update(p_f1=f1, p_f2=f2, p_f3=f3)
+    elif kind == 'pun':
+        row.update(pun_weight=1.0, spread=spread)
+    else:
+        raise ValueError(f"Unknown tariff kind: {kind}")
+
+    unknown = set(params) - set(TARIFF_DEFAULTS)
+    if unknown:
+        raise ValueError(f"Unknown tariff parameters: {sorted(unknown)}")
+    row.update(params)
+    return row
+
+
+def parameter_sweep(kind, **ranges):
+    """
+    Cartesian product of parameter values for one tariff kind
+
+    Example:
+        parameter_sweep('pun', spread=[5, 10, 15], loss=[0.0, 0.102])
+    """
+    names = list(ranges)
+    return [
+        tariff(kind, **dict(zip(names, values)))
+        for values in itertools.product(*(ranges[name] for name in names))
+    ]
+
+
+def tariff_grid(tariffs):
+    """Build the tariff grid DataFrame (one row per tariff, with tariff_id)"""
+    grid = pd.DataFrame(list(tariffs), columns=TARIFF_COLUMNS)
+    grid.insert(0, 'tariff_id', np.arange(len(grid), dtype='int32'))
+    return grid
+
+
+def coefficient_matrix(grid):
+    """
+    Linear coefficients of every tariff over STAT_COLUMNS
+
+    Returns:
+        np.ndarray: Shape (len(STAT_COLUMNS), n_tariffs), EUR per unit of stat
+    """
+    scale = (1 + grid['loss'].to_numpy(dtype='float64')) / 1000
+    fee = grid['fee_mwh'].to_numpy(dtype='float64') / 1000
+    spread = grid['spread'].to_numpy(dtype='float64')
+    pun_weight = grid['pun_weight'].to_numpy(dtype='float64')
+
+    coefficients = np.empty((len(STAT_COLUMNS), len(grid)))
+    for i, band in enumerate(('p_f1', 'p_f2', 'p_f3')):
+        coefficients[i] = scale * (grid[band].to_numpy(dtype='float64') + spread) + fee
+        coefficients[3 + i] = scale * pun_weight
+    coefficients[6] = -grid['feed_in_share'].to_numpy(dtype='float64') / 1000
+    coefficients[7] = grid['fixed_month'].to_numpy(dtype='float64')
+    return coefficients
+
+
+def pod_statistics(path, prices, chunk_rows=DEFAULT_CHUNK_ROWS):
+    """
+    Reduce a meter file to the per-POD, per-month tariff statistics
+
+    Returns:
+        pd.DataFrame: POD, Month, STAT_COLUMNS and MissingPrice (intervals
+        without a PUN, left out of the statistics)
+    """
+    partials = []
+    for chunk in iter_meter_chunks(path, chunk_rows, columns=METER_COLUMNS + [INJECTION_COLUMN]):
+        utc_minutes, valid, days = meter_utc_minutes(
+            chunk['DATA'].to_numpy(), chunk['ORA'].to_numpy(), chunk['FL_ORA_LEGALE'].to_numpy()
+        )
+        utc_minutes, days = utc_minutes[valid], days[valid]
+        energy = np.nan_to_num(pd.to_numeric(chunk[ENERGY_COLUMN], errors='coerce').to_numpy(dtype='float64')[valid])
+        injected = np.nan_to_num(pd.to_numeric(chunk[INJECTION_COLUMN], errors='coerce').to_numpy(dtype='float64')[valid])
+        price = prices.lookup(utc_minutes)
+        priced = ~np.isnan(price)
+        price = np.where(priced, price, 0.0)
+        fascia = interval_fascia_codes(utc_minutes, days)
+
+        frame = pd.DataFrame({
+            'POD': chunk['POD'].to_numpy()[valid],
+            'Month': days.astype('datetime64[D]').astype('datetime64[M]'),
+            'InjectedPUN': injected * price,
+            'MissingPrice': (~priced).astype('int64'),
+        })
+        for code in (1, 2, 3):
+            in_band = (fascia == code) & priced
+            frame[f'E{code}'] = np.where(in_band, energy, 0.0)
+            frame[f'W{code}'] = np.where(in_band, energy * price, 0.0)
+        partials.append(frame.groupby(['POD', 'Month'], sort=False).sum())
+
+    if not partials:
+        return pd.DataFrame(columns=['POD', 'Month'] + STAT_COLUMNS + COUNT_COLUMNS)
+
+    stats = pd.concat(partials).groupby(level=['POD', 'Month']).sum().reset_index()
+    stats['Months'] = 1.0
+    return stats[['POD', 'Month'] + STAT_COLUMNS + COUNT_COLUMNS]
+
+
+def _init_worker(db_path):
+    """Open the price series once per worker process"""
+    global _worker_prices
+    _worker_prices = load_prices(db_path)
+
+
+def _worker_statistics(path, chunk_rows):
+    return pod_statistics(path, _worker_prices, chunk_rows)
+
+
+def collect_statistics(meter_paths, db_path=DEFAULT_DB_PATH, workers=None,
+                       chunk_rows=DEFAULT_CHUNK_ROWS):
+    """
+    Compute tariff statistics for many meter files in a process pool
+
+    Args:
+        meter_paths: Meter files (one or more PODs each)
+        db_path: Price store folder
+        workers: Process count (default: CPU count; 1 runs in-process)
+        chunk_rows: Readings processed at a time
+
+    Returns:
+        pd.DataFrame: POD, Month, STAT_COLUMNS and MissingPrice for every POD
+    """
+    meter_paths = [Path(p) for p in meter_paths]
+    workers = workers or os.cpu_count() or 1
+
+    if workers == 1 or len(meter_paths) == 1:
+        prices = load_prices(db_path)
+        frames = [pod_statistics(path, prices, chunk_rows) for path in meter_paths]
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(db_path,)) as pool:
+            frames = list(pool.map(_worker_statistics, meter_paths,
+                                   itertools.repeat(chunk_rows), chunksize=4))
+
+    return pd.concat(frames, ignore_index=True)
+
+
+def simulate(stats, grid, monthly=False):
+    """
+    Evaluate every tariff of the grid for every POD (or POD and month)
+
+    Args:
+        stats: Output of collect_statistics
+        grid: Output of tariff_grid
+        monthly: Keep one result per month instead of per POD
+
+    Returns:
+        pd.DataFrame: Long table with the keys, tariff_id, kWh, CostEUR,
+        AvgPrice (EUR/MWh) and MissingPrice, joined with the tariff parameters
+    """
+    # A month split across several meter files is still billed once
+    per_month = stats.groupby(['POD', 'Month'], sort=True)[STAT_COLUMNS + COUNT_COLUMNS].sum()
+    per_month['Months'] = 1.0
+    keys = ['POD', 'Month'] if monthly else ['POD']
+    totals = per_month.groupby(level=keys, sort=True).sum()
+
+    costs = totals[STAT_COLUMNS].to_numpy(dtype='float64') @ coefficient_matrix(grid)
+    energy = totals[['E1', 'E2', 'E3']].sum(axis=1).to_numpy()
+
+    n_keys, n_tariffs = costs.shape
+    result = totals.index.to_frame(index=False).loc[np.repeat(np.arange(n_keys), n_tariffs)]
+    result = result.reset_index(drop=True)
+    result['tariff_id'] = np.tile(grid['tariff_id'].to_numpy(), n_keys)
+    result['kWh'] = np.repeat(energy, n_tariffs)
+    result['CostEUR'] = costs.ravel()
+    with np.errstate(divide='ignore', invalid='ignore'):
+        result['AvgPrice'] = result['CostEUR'] * 1000 / result['kWh']
+    result['MissingPrice'] = np.repeat(totals['MissingPrice'].to_numpy(dtype='int64'), n_tariffs)
+
+    return result.merge(grid, on='tariff_id', how='left')
+
+
+def write_results(results, output_path):
+    """Save simulation results to Parquet"""
+    output_path = Path(output_path)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    results.to_parquet(output_path, compression='snappy', index=False, engine='pyarrow')
+    return output_path
+
+
+def example_grid():
+    """Default what-if grid used by main()"""
+    return tariff_grid(
+        parameter_sweep('single', price=np.arange(90, 151, 5), loss=[0.102], fixed_month=[8.0])
+        + parameter_sweep('three_band', f1=[120, 130, 140], f2=[110, 120, 130], f3=[90, 100, 110],
+                          loss=[0.102], fixed_month=[8.0])
+        + parameter_sweep('pun', spread=np.arange(0, 31, 2.5), loss=[0.102], fixed_month=[8.0],
+                          feed_in_share=[0.0, 1.0])
+    )
+
+
+def main():
+    """Run the example grid on the POD file(s) in db/ (or the paths given)."""
+    meter_paths = sys.argv[1:] or [DEFAULT_DB_PATH / 'IT012E00801406.csv']
+    grid = example_grid()
+
+    print("=== Tariff What-If Simulator ===")
+    print(f"{len(meter_paths)} meter file(s), {len(grid)} tariffs")
+
+    stats = collect_statistics(meter_paths)
+    results = simulate(stats, grid)
+    output = write_results(results, DEFAULT_DB_PATH / 'tariff_simulation.parquet')
+
+    print(f"{len(results):,} (POD x tariff) evaluations written to {output}")
+    best = results.loc[results.groupby('POD')['CostEUR'].idxmin()]
+    print("\nCheapest tariff per POD:")
+    print(best[['POD', 'tariff_id', 'kind', 'kWh', 'CostEUR', 'AvgPrice']].to_string(index=False))
+
+    missing = int(best['MissingPrice'].sum())
+    if missing:
+        print(f"\nWarning: {missing:,} intervals without PUN price (left out of kWh and costs)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,205 @@
+"""
+Filesystem watching in debounced batches, for the long-running ingestion mode.
+
+A watcher follows a few folders, each with the file name patterns it cares
+about. Events come from watchdog when it is installed (inotify, FSEvents,
+ReadDirectoryChangesW) and otherwise from polling the folders every
+POLL_SECONDS for new or changed (mtime, size) entries.
+
+Events are not handled one by one: a Debouncer collects the changed paths and
+releases them as one batch once no event arrived for QUIET_SECONDS, or at the
+latest MAX_DELAY_SECONDS after the first one. A ZIP extracting 30 XML files
+is one batch, and a file still being written keeps resetting the quiet timer
+until it is complete.
+
+    watch([(xml_folder, ['*MGPPrezzi.xml']), (db_folder, ['IT*.csv'])], handle_batch)
+
+notify() tells a running pun_service to drop its caches after a batch.
+"""
+import fnmatch
+import os
+import threading
+import time
+import urllib.error
+import urllib.request
+from pathlib import Path
+
+POLL_SECONDS = 1.0
+QUIET_SECONDS = 2.0
+MAX_DELAY_SECONDS = 15.0
+TICK_SECONDS = 0.25
+NOTIFY_TIMEOUT = 2.0
+
+DEFAULT_NOTIFY_URL = 'http://127.0.0.1:8765/invalidate'  # pun_service
+
+
+def have_watchdog():
+    try:
+        import watchdog  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def matches(path, patterns):
+    return any(fnmatch.fnmatch(Path(path).name, pattern) for pattern in patterns)
+
+
+class Debouncer:
+    """
+    Thread-safe set of changed paths released in quiet-period batches
+
+    Args:
+        quiet: Seconds without events before a batch is released
+        max_delay: Longest wait after the first event of a batch
+        clock: Monotonic time source
+    """
+
+    def __init__(self, quiet=QUIET_SECONDS, max_delay=MAX_DELAY_SECONDS, clock=time.monotonic):
+        self.quiet = quiet
+        self.max_delay = max_delay
+        self.clock = clock
+        self._paths = {}
+        self._first = self._last = None
+        self._lock = threading.Lock()
+
+    def add(self, path):
+        with self._lock:
+            now = self.clock()
+            self._paths[str(path)] = None  # Ordered set
+            self._first = now if self._first is None else self._first
+            self._last = now
+
+    def pop_ready(self):
+        """The pending batch (in arrival order) when it is due, else []"""
+        with self._lock:
+            if not self._paths:
+                return []
+            now = self.clock()
+            if now - self._last < self.quiet and now - self._first < self.max_delay:
+                return []
+            batch = list(self._paths)
+            self._paths.clear()
+            self._first = self._last = None
+            return batch
+
+
+class PollingSource:
+    """
+    Changes found by comparing (mtime, size) snapshots of the folders
+
+    Args:
+        targets: (folder, patterns) pairs
+    """
+
+    def __init__(self, targets):
+        self.targets = [(Path(folder), patterns) for folder, patterns in targets]
+        self._snapshot = self.scan()
+
+    def scan(self):
+        snapshot = {}
+        for folder, patterns in self.targets:
+            try:
+                entries = list(os.scandir(folder))
+            except OSError:
+                continue
+            for entry in entries:
+                if entry.is_file() and matches(entry.name, patterns):
+                    stat = entry.stat()
+                    snapshot[entry.path] = (stat.st_mtime_ns, stat.st_size)
+        return snapshot
+
+    def poll(self):
+        """Paths created or modified since the previous call"""
+        snapshot = self.scan()
+        changed = [path for path, signature in snapshot.items() if self._snapshot.get(path) != signature]
+        self._snapshot = snapshot
+        return changed
+
+
+def start_observer(targets, callback):
+    """
+    watchdog Observer calling callback(path) for matching created, modified
+    or moved-in files
+
+    Returns:
+        Observer: Started observer (stop() and join() it)
+    """
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+
+    class Handler(FileSystemEventHandler):
+        def __init__(self, patterns):
+            self.patterns = patterns
+
+        def on_any_event(self, event):
+            if event.is_directory or event.event_type not in ('created', 'modified', 'moved', 'closed'):
+                return
+            path = getattr(event, 'dest_path', None) or event.src_path
+            if matches(path, self.patterns):
+                callback(path)
+
+    observer = Observer()
+    for folder, patterns in targets:
+        Path(folder).mkdir(parents=True, exist_ok=True)
+        observer.schedule(Handler(patterns), str(folder), recursive=False)
+    observer.start()
+    return observer
+
+
+def watch(targets, handler, quiet=QUIET_SECONDS, max_delay=MAX_DELAY_SECONDS, poll_seconds=POLL_SECONDS,
+          use_watchdog=None, stop_event=None):
+    """
+    Call handler(paths) with every debounced batch of changed files, until
+    stop_event is set or the process is interrupted
+
+    Args:
+        targets: (folder, patterns) pairs to follow
+        handler: Callable taking the list of changed paths
+        quiet, max_delay: Debouncer timing
+        poll_seconds: Polling interval when watchdog is not used
+        use_watchdog: Force (True) or disable (False) watchdog; default when installed
+        stop_event: threading.Event ending the loop
+    """
+    stop_event = stop_event or threading.Event()
+    debouncer = Debouncer(quiet, max_delay)
+    use_watchdog = have_watchdog() if use_watchdog is None else use_watchdog
+
+    observer = poller = None
+    if use_watchdog:
+        observer = start_observer(targets, debouncer.add)
+    else:
+        poller = PollingSource(targets)
+    print(f"Watching {', '.join(str(folder) for folder, _ in targets)} "
+          f"({'watchdog' if use_watchdog else f'polling every {poll_seconds:g}s'})")
+
+    next_poll = time.monotonic()
+    try:
+        while not stop_event.is_set():
+            if poller is not None and time.monotonic() >= next_poll:
+                for path in poller.poll():
+                    debouncer.add(path)
+                next_poll = time.monotonic() + poll_seconds
+            batch = debouncer.pop_ready()
+            if batch:
+                try:
+                    handler(batch)
+                except Exception as e:  # A bad file must not stop the watcher
+                    print(f"Error handling {len(batch)} changed file(s): {e}")
+            stop_event.wait(TICK_SECONDS)
+    except KeyboardInterrupt:
+        print("Watch stopped")
+    finally:
+        if observer is not None:
+            observer.stop()
+            observer.join()
+
+
+def notify(url=DEFAULT_NOTIFY_URL, timeout=NOTIFY_TIMEOUT):
+    """POST to a cache invalidation endpoint; False when nothing answered"""
+    request = urllib.request.Request(url, data=b'', method='POST')
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            return response.status == 200
+    except (urllib.error.URLError, OSError):
+        return False
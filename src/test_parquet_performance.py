@@ -1,112 +0,0 @@
-"""
-Test and compare performance between CSV and Parquet formats.
-"""
-import pandas as pd
-import time
-from pathlib import Path
-import sys
-
-def test_read_performance():
-    """Compare read times between CSV and Parquet."""
-    db_path = Path(__file__).parent.parent / 'db'
-
-    print("Performance Comparison: CSV vs Parquet")
-    print("=" * 50)
-
-    # Test PUN data
-    print("\n1. PUN Energy Prices (85,247 rows)")
-    print("-" * 30)
-
-    # CSV read
-    start = time.time()
-    df_csv = pd.read_csv(db_path / 'PUN-MGP.csv', sep=';', encoding='utf-8-sig')
-    df_csv['Date'] = pd.to_datetime(df_csv['Date'], format='%Y%m%d')
-    csv_time = time.time() - start
-    print(f"CSV read time: {csv_time:.3f} seconds")
-
-    # Parquet read
-    start = time.time()
-    df_parquet = pd.read_parquet(db_path / 'PUN-MGP.parquet')
-    parquet_time = time.time() - start
-    print(f"Parquet read time: {parquet_time:.3f} seconds")
-    print(f"Speed improvement: {csv_time/parquet_time:.1f}x faster")
-
-    # Test Consumi data
-    print("\n2. Consumption Data (58,752 rows)")
-    print("-" * 30)
-
-    # CSV read
-    start = time.time()
-    df_csv = pd.read_csv(db_path / 'IT012E00801406.csv', sep=';')
-    df_csv['DateTime'] = pd.to_datetime(
-        df_csv['DATA'].astype(str) + ' ' + df_csv['ORA'].astype(str).str.zfill(6),
-        format='%Y%m%d %H%M%S'
-    )
-    csv_time = time.time() - start
-    print(f"CSV read time: {csv_time:.3f} seconds")
-
-    # Parquet read
-    start = time.time()
-    df_parquet = pd.read_parquet(db_path / 'IT012E00801406.parquet')
-    parquet_time = time.time() - start
-    print(f"Parquet read time: {parquet_time:.3f} seconds")
-    print(f"Speed improvement: {csv_time/parquet_time:.1f}x faster")
-
-    # Test filtering performance
-    print("\n3. Filtering Performance (Year 2024)")
-    print("-" * 30)
-
-    # CSV filtering
-    start = time.time()
-    df_csv = pd.read_csv(db_path / 'IT012E00801406.csv', sep=';')
-    df_csv['DATA'] = df_csv['DATA'].astype(str)
-    filtered_csv = df_csv[df_csv['DATA'].str.startswith('2024')]
-    csv_filter_time = time.time() - start
-    print(f"CSV filter time: {csv_filter_time:.3f} seconds")
-    print(f"Filtered rows: {len(filtered_csv):,}")
-
-    # Parquet filtering (direct from partitioned data)
-    start = time.time()
-    df_parquet_2024 = pd.read_parquet(db_path / 'Consumi' / 'Year=2024')
-    parquet_filter_time = time.time() - start
-    print(f"Parquet partition read time: {parquet_filter_time:.3f} seconds")
-    print(f"Filtered rows: {len(df_parquet_2024):,}")
-    print(f"Speed improvement: {csv_filter_time/parquet_filter_time:.1f}x faster")
-
-    # Test aggregation performance
-    print("\n4. Aggregation Performance (Daily totals)")
-    print("-" * 30)
-
-    # Load full Parquet data
-    df = pd.read_parquet(db_path / 'IT012E00801406.parquet')
-
-    start = time.time()
-    daily_totals = df.groupby(df['DateTime'].dt.date)['CONSUMO_ATTIVA_PRELEVATA'].sum()
-    agg_time = time.time() - start
-    print(f"Parquet aggregation time: {agg_time:.3f} seconds")
-    print(f"Daily records: {len(daily_totals):,}")
-
-    # Memory usage comparison
-    print("\n5. Memory Usage")
-    print("-" * 30)
-
-    df_csv = pd.read_csv(db_path / 'PUN-MGP.csv', sep=';', encoding='utf-8-sig')
-    csv_memory = df_csv.memory_usage(deep=True).sum() / 1024 / 1024
-
-    df_parquet = pd.read_parquet(db_path / 'PUN-MGP.parquet')
-    parquet_memory = df_parquet.memory_usage(deep=True).sum() / 1024 / 1024
-
-    print(f"CSV in memory: {csv_memory:.2f} MB")
-    print(f"Parquet in memory: {parquet_memory:.2f} MB")
-    print(f"Memory reduction: {(1 - parquet_memory/csv_memory)*100:.1f}%")
-
-    print("\n" + "=" * 50)
-    print("Summary: Parquet provides significant performance improvements")
-    print("- Faster read times (3-10x)")
-    print("- Smaller file sizes (70-80% reduction)")
-    print("- Efficient columnar filtering")
-    print("- Native partitioning support")
-    print("- Lower memory usage")
-
-if __name__ == "__main__":
-    test_read_performance()
\ No newline at end of file